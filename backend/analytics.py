@@ -0,0 +1,174 @@
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from models import OrderStatus
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BACKFILL_JOB = "analytics.backfill"
+
+ROLLUP_COLLECTION = "store_rollups"
+
+# Rollup granularity read for each dashboard period, and how far back it reaches
+ANALYTICS_PERIODS = {
+    "day": ("hour", timedelta(days=1)),
+    "week": ("day", timedelta(days=7)),
+    "month": ("day", timedelta(days=30)),
+}
+
+TOP_PRODUCTS_LIMIT = 10
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    """Start of the hour or day containing `at`"""
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_id(store_id: str, granularity: str, bucket: datetime) -> str:
+    return f"{store_id}:{granularity}:{bucket.isoformat()}"
+
+def status_field(status) -> str:
+    """Rollup counter for an order status, given as an OrderStatus or its value"""
+    return f"status.{OrderStatus(status).value}"
+
+def order_increments(order: Dict, sign: int = 1) -> Dict[str, float]:
+    """Revenue and per-product sales an order adds to (or, with sign=-1, removes from) a rollup"""
+    increments = {"revenue": sign * order["total_amount"]}
+    for item in order["items"]:
+        increments[f"products.{item['product_id']}.quantity"] = sign * item["quantity"]
+        increments[f"products.{item['product_id']}.revenue"] = sign * item["total_price"]
+    return increments
+
+def rollup_operations(order: Dict, increments: Dict[str, float]) -> List[UpdateOne]:
+    """Upserts applying increments to the hourly and daily rollups of an order's store"""
+    product_names = {f"products.{item['product_id']}.name": item["product_name"] for item in order["items"]}
+    operations = []
+    for granularity in ("hour", "day"):
+        bucket = bucket_start(order["created_at"], granularity)
+        operations.append(UpdateOne(
+            {"_id": rollup_id(order["store_id"], granularity, bucket)},
+            {
+                "$inc": increments,
+                "$set": product_names,
+                "$setOnInsert": {"store_id": order["store_id"], "granularity": granularity, "bucket": bucket}
+            },
+            upsert=True
+        ))
+    return operations
+
+def previous_status(order: Dict) -> str:
+    """Status an order had before its latest transition"""
+    history = order.get("status_history") or []
+    return history[-2]["status"] if len(history) >= 2 else OrderStatus.PENDING.value
+
+async def record_order_created(db, order: Dict) -> None:
+    """Count a newly placed order in its store's rollups"""
+    increments = {"orders": 1, status_field(order["status"]): 1, **order_increments(order)}
+    try:
+        await db[ROLLUP_COLLECTION].bulk_write(rollup_operations(order, increments), ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to roll up order {order['id']}: {str(e)}")
+
+async def record_status_changes(db, orders: List[Dict]) -> None:
+    """Move transitioned orders between status counters, removing cancelled sales"""
+    operations = []
+    for order in orders:
+        increments = {status_field(previous_status(order)): -1, status_field(order["status"]): 1}
+        if order["status"] == OrderStatus.CANCELLED.value:
+            increments.update(order_increments(order, sign=-1))
+        operations.extend(rollup_operations(order, increments))
+    if not operations:
+        return
+    try:
+        await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to roll up status changes for {len(orders)} orders: {str(e)}")
+
+async def get_store_analytics(db, period: str, store_id: Optional[str] = None) -> Dict:
+    """Dashboard totals for a period, read from rollups only"""
+    granularity, window = ANALYTICS_PERIODS[period]
+    query = {
+        "granularity": granularity,
+        "bucket": {"$gte": bucket_start(datetime.utcnow() - window, granularity)}
+    }
+    if store_id:
+        query["store_id"] = store_id
+
+    total_revenue = 0.0
+    total_orders = 0
+    orders_by_status: Dict[str, int] = {status.value: 0 for status in OrderStatus}
+    products: Dict[str, Dict] = defaultdict(lambda: {"quantity_sold": 0, "revenue": 0.0})
+
+    async for rollup in db[ROLLUP_COLLECTION].find(query):
+        total_revenue += rollup.get("revenue", 0)
+        total_orders += rollup.get("orders", 0)
+        for status, count in rollup.get("status", {}).items():
+            # Skip counters nested under "status.OrderStatus" by older writes; a backfill removes them
+            if not isinstance(count, (int, float)):
+                continue
+            orders_by_status[status] = orders_by_status.get(status, 0) + count
+        for product_id, sales in rollup.get("products", {}).items():
+            product = products[product_id]
+            product["product_name"] = sales.get("name", product.get("product_name"))
+            product["quantity_sold"] += sales.get("quantity", 0)
+            product["revenue"] += sales.get("revenue", 0)
+
+    top_products = sorted(
+        (
+            {"product_id": product_id, **sales, "revenue": round(sales["revenue"], 2)}
+            for product_id, sales in products.items() if sales["quantity_sold"] > 0
+        ),
+        key=lambda product: product["quantity_sold"],
+        reverse=True
+    )[:TOP_PRODUCTS_LIMIT]
+
+    return {
+        "total_revenue": round(total_revenue, 2),
+        "total_orders": total_orders,
+        "top_products": top_products,
+        "orders_by_status": orders_by_status
+    }
+
+async def rebuild_rollups(db, payload: Dict) -> None:
+    """Rebuild every rollup from order history (job handler).
+
+    Orders are read in _id order, payload["batch_size"] at a time, and each
+    batch is folded into a scratch collection with one bulk_write; the
+    scratch collection then replaces the live rollups in a single rename.
+    Status changes made while a rebuild is running may be lost, so run it
+    off-peak.
+    """
+    batch_size = payload.get("batch_size", 1000)
+    scratch = db[f"{ROLLUP_COLLECTION}_rebuild_{uuid.uuid4().hex}"]
+    last_id = None
+    rebuilt = 0
+
+    try:
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            orders = await db.orders.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not orders:
+                break
+            last_id = orders[-1]["_id"]
+
+            operations = []
+            for order in orders:
+                increments = {"orders": 1, status_field(order["status"]): 1}
+                if order["status"] != OrderStatus.CANCELLED.value:
+                    increments.update(order_increments(order))
+                operations.extend(rollup_operations(order, increments))
+            await scratch.bulk_write(operations, ordered=False)
+            rebuilt += len(orders)
+
+        if rebuilt:
+            await scratch.create_index([("granularity", 1), ("store_id", 1), ("bucket", 1)])
+            await scratch.rename(ROLLUP_COLLECTION, dropTarget=True)
+        else:
+            await db[ROLLUP_COLLECTION].delete_many({})
+    finally:
+        await scratch.drop()
+
+    logger.info(f"Rebuilt analytics rollups from {rebuilt} orders")
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from auth import get_staff_user, staff_store_scope
+from database import get_database
+from analytics import ANALYTICS_BACKFILL_JOB, get_store_analytics
+from job_queue import job_queue
+from request_tracing import TracedRoute
+import logging
+
+logger = logging.getLogger(__name__)
+
+analytics_router = APIRouter(prefix="/api/analytics", tags=["analytics"], route_class=TracedRoute)
+
+@analytics_router.get("")
+async def get_analytics(
+    period: str = Query("week", pattern="^(day|week|month)$"),
+    store_id: Optional[str] = None,
+    current_user: dict = Depends(get_staff_user),
+    db = Depends(get_database)
+):
+    """Get revenue, order counts and top products for the staff member's store (Staff only)
+
+    store_id is only honoured for store admins not tied to a store.
+    """
+    return await get_store_analytics(db, period, staff_store_scope(current_user, store_id))
+
+@analytics_router.post("/backfill")
+async def backfill_analytics(
+    batch_size: int = Query(1000, ge=100, le=10000),
+    current_user: dict = Depends(get_staff_user),
+    db = Depends(get_database)
+):
+    """Queue a rebuild of all analytics rollups from order history (Staff only)"""
+    await job_queue.enqueue(db, ANALYTICS_BACKFILL_JOB, {"batch_size": batch_size})
+    logger.info(f"Analytics backfill requested by user {current_user['id']}")
+    return {"message": "Analytics backfill queued"}
@@ -6,6 +6,7 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from models import User, UserRole
 from database import get_database
+from request_tracing import span
 import os
 from dotenv import load_dotenv
 
@@ -65,14 +66,16 @@ async def get_current_user(
     )
     
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("auth.jwt"):
+            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_by_email(email, db)
+    with span("auth.user"):
+        user = await get_user_by_email(email, db)
     if user is None:
         raise credentials_exception
     
@@ -87,14 +90,16 @@ async def get_current_user_optional(
         return None
     
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("auth.jwt"):
+            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             return None
     except JWTError:
         return None
     
-    user = await get_user_by_email(email, db)
+    with span("auth.user"):
+        user = await get_user_by_email(email, db)
     return user
 
 async def get_current_active_user(current_user: dict = Depends(get_current_user)) -> dict:
@@ -115,6 +120,18 @@ def require_role(required_role: UserRole):
         return current_user
     return role_checker
 
+def require_any_role(*required_roles: UserRole):
+    """Dependency to require one of several user roles"""
+    allowed = {role.value for role in required_roles}
+    async def role_checker(current_user: dict = Depends(get_current_active_user)) -> dict:
+        if current_user.get("role") not in allowed:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Operation requires one of roles: {', '.join(sorted(allowed))}"
+            )
+        return current_user
+    return role_checker
+
 # Role-specific dependencies
 async def get_customer_user(current_user: dict = Depends(require_role(UserRole.CUSTOMER))) -> dict:
     return current_user
@@ -123,4 +140,24 @@ async def get_store_admin_user(current_user: dict = Depends(require_role(UserRol
     return current_user
 
 async def get_delivery_user(current_user: dict = Depends(require_role(UserRole.DELIVERY))) -> dict:
-    return current_user
\ No newline at end of file
+    return current_user
+
+async def get_staff_user(current_user: dict = Depends(require_any_role(UserRole.STORE_ADMIN, UserRole.STAFF))) -> dict:
+    return current_user
+
+async def get_courier_user(current_user: dict = Depends(require_any_role(UserRole.COURIER, UserRole.DELIVERY))) -> dict:
+    return current_user
+def staff_store_scope(user: dict, requested_store_id: Optional[str] = None) -> Optional[str]:
+    """Store a staff user's queries are limited to; None means every store.
+
+    Users tied to a store always get their own. Only store admins without a
+    store (platform admins) may pick any store, or all of them.
+    """
+    if user.get("store_id"):
+        return user["store_id"]
+    if user.get("role") == UserRole.STORE_ADMIN.value:
+        return requested_store_id
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="User must be associated with a store"
+    )
@@ -0,0 +1,72 @@
+"""
+Checkout session creation load test against a local Stripe stand-in.
+
+Run stripe-mock (https://github.com/stripe/stripe-mock) locally, then:
+
+    STRIPE_API_BASE=http://localhost:12111 STRIPE_API_KEY=sk_test_123 \
+        python benchmark_checkout.py --sessions 500 --concurrency 32
+
+Pass --per-call to reproduce the old behaviour of building a new
+StripeCheckout (and default SDK transport) for every session.
+"""
+import argparse
+import asyncio
+import os
+import time
+import stripe
+from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionRequest
+from payment_service import PaymentService
+
+WEBHOOK_URL = "http://localhost:8001/api/webhook/stripe"
+
+def build_request(index: int) -> CheckoutSessionRequest:
+    return CheckoutSessionRequest(
+        amount=5.00,
+        currency="usd",
+        success_url="http://localhost:3000/payment/success?session_id={CHECKOUT_SESSION_ID}",
+        cancel_url="http://localhost:3000/payment/cancel",
+        metadata={"package_id": "small", "benchmark_index": str(index)}
+    )
+
+async def run(sessions: int, concurrency: int, per_call: bool):
+    os.environ.setdefault("STRIPE_API_BASE", "http://localhost:12111")
+    os.environ.setdefault("STRIPE_API_KEY", "sk_test_123")
+
+    service = PaymentService()
+    if per_call:
+        stripe.default_http_client = None
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def create(index: int):
+        async with semaphore:
+            if per_call:
+                client = StripeCheckout(api_key=service.stripe_api_key, webhook_url=WEBHOOK_URL)
+            else:
+                client = service.get_checkout_client(WEBHOOK_URL)
+            started = time.perf_counter()
+            await client.create_checkout_session(build_request(index))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(create(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    mode = "per-call client" if per_call else "reused client"
+    print(f"{mode}: {sessions} sessions in {elapsed:.2f}s "
+          f"({sessions / elapsed:.1f} sessions/s, concurrency {concurrency})")
+    print(f"latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"max={latencies[-1] * 1000:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--per-call", action="store_true", help="create a new client per session")
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.concurrency, args.per_call))
+
+if __name__ == "__main__":
+    main()
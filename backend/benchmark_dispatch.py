@@ -0,0 +1,157 @@
+"""
+Courier dispatch simulation: assignment latency under many concurrent couriers.
+
+    MONGO_URL="mongodb://localhost:27017" \
+        python benchmark_dispatch.py --couriers 300 --orders 5000 --rate 200
+
+Seeds a scratch database (dropped afterwards) and releases --orders ready
+orders at --rate orders/second across the Baños zones and --stores stores.
+Each simulated courier polls for available orders, races the others to accept
+one, then stays busy for --delivery-ms. Waiting couriers are also handed
+orders directly by the dispatcher as they become ready. Reports how long
+orders waited between becoming ready and being assigned, how many accepts lost
+the race, and the average batch size.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List
+from motor.motor_asyncio import AsyncIOMotorClient
+from delivery_zones import DELIVERY_ZONE_IDS
+from dispatch import Dispatcher
+from models import OrderStatus
+from order_events import order_events, ALL_ORDERS_TOPIC
+
+BENCHMARK_DB = "benchmark_dispatch"
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class DispatchSimulation:
+    def __init__(self, db, dispatcher: Dispatcher, couriers: int, stores: int, delivery_seconds: float, poll_seconds: float):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.zones = sorted(DELIVERY_ZONE_IDS)
+        self.stores = [f"store-{index}" for index in range(stores)]
+        self.couriers = [
+            {"id": f"courier-{index}", "delivery_zone": self.zones[index % len(self.zones)]}
+            for index in range(couriers)
+        ]
+        self.delivery_seconds = delivery_seconds
+        self.poll_seconds = poll_seconds
+        self.ready_at: Dict[str, float] = {}
+        self.latencies: List[float] = []
+        self.batches = 0.0
+        self.busy_until: Dict[str, float] = {}
+        self.lost_races = 0
+
+    async def release_orders(self, orders: int, rate: float) -> None:
+        for _ in range(orders):
+            order = {
+                "id": str(uuid.uuid4()),
+                "user_id": "customer",
+                "store_id": random.choice(self.stores),
+                "delivery_zone": random.choice(self.zones),
+                "status": OrderStatus.READY.value,
+                "delivery_driver_id": None,
+                "created_at": datetime.utcnow()
+            }
+            await self.db.orders.insert_one(dict(order))
+            self.ready_at[order["id"]] = time.perf_counter()
+            self.dispatcher.add_ready_order(order)
+            await self.dispatcher.dispatch(self.db)
+            await asyncio.sleep(1 / rate)
+
+    async def collect_assignments(self) -> None:
+        queue = order_events.subscribe([ALL_ORDERS_TOPIC])
+        try:
+            while True:
+                event = await queue.get()
+                if event["type"] != "order.assigned":
+                    continue
+                self.latencies.append(time.perf_counter() - self.ready_at[event["order_id"]])
+                self.batches += 1 / event["batch_size"]
+                self.busy_until[event["courier_id"]] = time.perf_counter() + self.delivery_seconds
+        finally:
+            order_events.unsubscribe(queue, [ALL_ORDERS_TOPIC])
+
+    async def courier(self, courier: Dict, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            busy_for = self.busy_until.get(courier["id"], 0) - time.perf_counter()
+            if busy_for > 0:
+                await asyncio.sleep(busy_for)
+                continue
+            if self.busy_until.pop(courier["id"], None) is not None:
+                # Delivered everything, which frees the courier's active order slots
+                await self.db.users.update_one({"id": courier["id"]}, {"$set": {"active_orders": 0}})
+
+            self.dispatcher.courier_available(courier)
+            order_ids = self.dispatcher.available_orders(courier, limit=5)
+            if not order_ids:
+                await asyncio.sleep(self.poll_seconds * random.uniform(0.5, 1.5))
+                continue
+            # Couriers tend to pick one of the first few orders, so they collide
+            if not await self.dispatcher.accept(self.db, random.choice(order_ids), courier["id"]):
+                self.lost_races += 1
+
+    def report(self, orders: int, elapsed: float) -> None:
+        values = sorted(self.latencies)
+        assigned = len(values)
+        print(f"{assigned}/{orders} orders assigned in {elapsed:.2f}s ({assigned / elapsed:.1f} orders/s), "
+              f"{len(self.couriers)} couriers")
+        print(f"ready->assigned ms: p50 {percentile(values, 0.50) * 1000:.1f}, "
+              f"p95 {percentile(values, 0.95) * 1000:.1f}, p99 {percentile(values, 0.99) * 1000:.1f}, "
+              f"max {(values[-1] if values else 0) * 1000:.1f}")
+        print(f"lost accept races: {self.lost_races}, "
+              f"average batch size: {assigned / self.batches if self.batches else 0:.2f}")
+
+async def run(couriers: int, orders: int, rate: float, stores: int, delivery_ms: float, poll_ms: float):
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    await client.drop_database(BENCHMARK_DB)
+    db = client[BENCHMARK_DB]
+    try:
+        await db.orders.create_index("id", unique=True)
+        await db.users.create_index("id", unique=True)
+        simulation = DispatchSimulation(
+            db, Dispatcher(), couriers, stores, delivery_ms / 1000, poll_ms / 1000
+        )
+        await db.users.insert_many([{**courier, "active_orders": 0} for courier in simulation.couriers])
+        order_events.queue_size = orders  # The collector must not drop assignment events
+        collector = asyncio.create_task(simulation.collect_assignments())
+
+        started = time.perf_counter()
+        deadline = started + orders / rate + 10
+        courier_tasks = [asyncio.create_task(simulation.courier(courier, deadline)) for courier in simulation.couriers]
+        await simulation.release_orders(orders, rate)
+        while len(simulation.latencies) < orders and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        for task in courier_tasks + [collector]:
+            task.cancel()
+        await asyncio.gather(*courier_tasks, collector, return_exceptions=True)
+        simulation.report(orders, elapsed)
+    finally:
+        await client.drop_database(BENCHMARK_DB)
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--couriers", type=int, default=300)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=200, help="orders becoming ready per second")
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--delivery-ms", type=float, default=500, help="time a courier stays busy per batch")
+    parser.add_argument("--poll-ms", type=float, default=200, help="courier polling interval when idle")
+    args = parser.parse_args()
+    asyncio.run(run(args.couriers, args.orders, args.rate, args.stores, args.delivery_ms, args.poll_ms))
+
+if __name__ == "__main__":
+    main()
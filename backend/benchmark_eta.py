@@ -0,0 +1,53 @@
+"""
+ETA computation benchmark.
+
+Times eta_service.estimate_minutes over synthetic open orders, without Mongo:
+
+    python benchmark_eta.py --orders 1000 10000 100000 --stores 20 --couriers 60
+
+Orders are spread over random statuses, stores and the Baños zones; couriers
+are split evenly across zones with a few idle in each.
+"""
+import argparse
+import time
+import numpy as np
+from eta_service import ZONE_IDS, estimate_minutes, OPEN_STATUSES
+
+def synthetic_orders(count: int, stores: int, couriers: int, rng) -> dict:
+    zones = len(ZONE_IDS)
+    zone_couriers = np.r_[np.full(zones, couriers / zones), 0]
+    return {
+        "status_codes": rng.integers(0, len(OPEN_STATUSES), count),
+        "store_indexes": rng.integers(0, stores, count),
+        "pickup_zones": rng.integers(0, zones, count),
+        "dropoff_zones": rng.integers(0, zones, count),
+        "assigned": rng.random(count) < 0.3,
+        "age_minutes": rng.random(count) * 60,
+        "since_pickup_minutes": rng.random(count) * 15,
+        "idle_couriers": np.floor(zone_couriers * 0.1),
+        "zone_couriers": zone_couriers
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--couriers", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for count in args.orders:
+        orders = synthetic_orders(count, args.stores, args.couriers, rng)
+        estimate_minutes(**orders)  # Warm up
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            estimate_minutes(**orders)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{count:>8} orders: median {timings[len(timings) // 2] * 1000:.2f} ms, "
+              f"best {timings[0] * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Order placement throughput on a local single-node replica set.
+
+Transactions need a replica set, e.g.:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+    MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" \
+        python benchmark_orders.py --orders 2000 --concurrency 32 --products 50
+
+Seeds a scratch database (dropped afterwards) with one store, --products
+products and one customer per concurrent worker, then places --orders orders
+through order_service.place_order and reports orders/second. Fewer products
+means more write conflicts on stock and more transaction retries.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from motor.motor_asyncio import AsyncIOMotorClient
+from models import Address, OrderCreate, OrderItemCreate
+from order_service import place_order
+
+BENCHMARK_DB = "benchmark_orders"
+STORE_ID = "store_benchmark"
+
+async def seed(db, products: int, customers: int):
+    await db.stores.insert_one({"id": STORE_ID, "name": "Benchmark Store", "delivery_fee": 1.5, "min_order_amount": 0.0})
+    await db.products.insert_many([
+        {
+            "id": f"product-{index}",
+            "name": f"Product {index}",
+            "price": round(random.uniform(0.5, 20), 2),
+            "store_id": STORE_ID,
+            "is_available": True,
+            "stock_quantity": 10_000_000
+        }
+        for index in range(products)
+    ])
+    await db.products.create_index("id", unique=True)
+    await db.orders.create_index("id", unique=True)
+
+    users = []
+    for _ in range(customers):
+        user = {"id": str(uuid.uuid4()), "role": "customer"}
+        address = Address(
+            user_id=user["id"], full_name="Cliente", phone="+593900000000",
+            street_address="Av. Amazonas", city="Baños de Agua Santa",
+            state="Tungurahua", postal_code="180250"
+        )
+        await db.addresses.insert_one(address.dict())
+        users.append((user, address.id))
+    return users
+
+async def run(orders: int, concurrency: int, products: int, items_per_order: int):
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017/?replicaSet=rs0"))
+    await client.drop_database(BENCHMARK_DB)
+    db = client[BENCHMARK_DB]
+    try:
+        users = await seed(db, products, concurrency)
+        remaining = iter(range(orders))
+        failures = 0
+
+        async def worker(user, address_id):
+            nonlocal failures
+            for _ in remaining:
+                order_data = OrderCreate(
+                    items=[
+                        OrderItemCreate(product_id=f"product-{random.randrange(products)}", quantity=random.randint(1, 3))
+                        for _ in range(items_per_order)
+                    ],
+                    delivery_address_id=address_id
+                )
+                try:
+                    await place_order(db, user, order_data)
+                except Exception:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(user, address_id) for user, address_id in users))
+        elapsed = time.perf_counter() - started
+
+        placed = await db.orders.count_documents({})
+        print(f"{placed} orders in {elapsed:.2f}s ({placed / elapsed:.1f} orders/s), "
+              f"{failures} failed, concurrency {concurrency}, {products} products, "
+              f"{items_per_order} items per order")
+    finally:
+        await client.drop_database(BENCHMARK_DB)
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--items-per-order", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.orders, args.concurrency, args.products, args.items_per_order))
+
+if __name__ == "__main__":
+    main()
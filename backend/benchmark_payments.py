@@ -0,0 +1,107 @@
+"""
+Concurrent checkout, polling and webhook load benchmark.
+
+Start the API with the offline checkout provider, then point this script at it:
+
+    PAYMENT_PROVIDER=fake FAKE_STRIPE_LATENCY_MS=50 uvicorn server:app --port 8001
+    python benchmark_payments.py --base-url http://localhost:8001 --users 50 --duration 30
+
+Each virtual user creates a checkout session, polls its status while it is
+open, delivers a signed checkout.session.completed webhook and polls again
+until the payment is reported as paid. Throughput and latency percentiles are
+reported per operation.
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List
+import httpx
+from fake_checkout import build_checkout_completed_event, sign_webhook_payload
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class PaymentLoad:
+    def __init__(self, client: httpx.AsyncClient, open_polls: int):
+        self.client = client
+        self.open_polls = open_polls
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def _timed(self, operation: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[operation] += 1
+            return None
+        self.latencies[operation].append(time.perf_counter() - started)
+        if response.status_code != 200:
+            self.errors[operation] += 1
+            return None
+        return response.json()
+
+    async def checkout_flow(self) -> None:
+        session = await self._timed(
+            "checkout", "POST", "/api/payments/checkout/session",
+            json={"package_id": "small", "origin_url": "http://localhost:3000"}
+        )
+        if not session:
+            return
+        session_id = session["session_id"]
+
+        for _ in range(self.open_polls):
+            await self._timed("poll_open", "GET", f"/api/payments/checkout/status/{session_id}")
+
+        payload = build_checkout_completed_event(session_id)
+        await self._timed(
+            "webhook", "POST", "/api/payments/webhook/stripe",
+            content=payload,
+            headers={"Stripe-Signature": sign_webhook_payload(payload), "Content-Type": "application/json"}
+        )
+
+        status = await self._timed("poll_paid", "GET", f"/api/payments/checkout/status/{session_id}")
+        if status and status.get("payment_status") != "paid":
+            self.errors["poll_paid"] += 1
+
+    async def user(self, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            await self.checkout_flow()
+
+    def report(self, elapsed: float) -> None:
+        print(f"{'operation':<12} {'count':>7} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for operation in ("checkout", "poll_open", "webhook", "poll_paid"):
+            values = sorted(self.latencies[operation])
+            print(
+                f"{operation:<12} {len(values):>7} {self.errors[operation]:>7} "
+                f"{len(values) / elapsed:>9.1f} "
+                f"{percentile(values, 0.50) * 1000:>8.1f} "
+                f"{percentile(values, 0.95) * 1000:>8.1f} "
+                f"{percentile(values, 0.99) * 1000:>8.1f}"
+            )
+        total = sum(len(values) for values in self.latencies.values())
+        print(f"total: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+async def run(base_url: str, users: int, duration: float, open_polls: int):
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        load = PaymentLoad(client, open_polls)
+        started = time.perf_counter()
+        await asyncio.gather(*(load.user(started + duration) for _ in range(users)))
+        load.report(time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--open-polls", type=int, default=3, help="status polls per session before payment")
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.users, args.duration, args.open_polls))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Courier route planning benchmark.
+
+Times route_planner.plan_route (nearest neighbour plus 2-opt) on random stops
+inside the Baños delivery area and compares the route length with the
+nearest-neighbour tour alone and with the stops in arrival order:
+
+    python benchmark_route.py --stops 10 20 30 40 50 --trials 50
+"""
+import argparse
+import random
+import time
+import numpy as np
+from delivery_zones import DELIVERY_AREAS
+from route_planner import distance_matrix_km, nearest_neighbor_route, plan_route
+
+def delivery_bounds():
+    points = [point for area in DELIVERY_AREAS for point in area["boundary"]["coordinates"][0]]
+    longitudes, latitudes = zip(*points)
+    return min(latitudes), max(latitudes), min(longitudes), max(longitudes)
+
+def path_km(distances: np.ndarray, route) -> float:
+    return float(distances[route[:-1], route[1:]].sum())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", type=int, nargs="+", default=[10, 20, 30, 40, 50])
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    south, north, west, east = delivery_bounds()
+    print(f"{'stops':>5} {'p50 ms':>8} {'max ms':>8} {'km':>7} {'nn km':>7} {'arrival km':>10}")
+    for count in args.stops:
+        timings, planned, greedy, arrival = [], [], [], []
+        for _ in range(args.trials):
+            points = [(random.uniform(south, north), random.uniform(west, east)) for _ in range(count + 1)]
+            started = time.perf_counter()
+            _, legs = plan_route(points[0], points[1:])
+            timings.append(time.perf_counter() - started)
+
+            distances = distance_matrix_km(points)
+            planned.append(sum(legs))
+            greedy.append(path_km(distances, np.array(nearest_neighbor_route(distances))))
+            arrival.append(path_km(distances, np.arange(count + 1)))
+        timings.sort()
+        print(f"{count:>5} {timings[len(timings) // 2] * 1000:>8.2f} {timings[-1] * 1000:>8.2f} "
+              f"{np.mean(planned):>7.2f} {np.mean(greedy):>7.2f} {np.mean(arrival):>10.2f}")
+
+if __name__ == "__main__":
+    main()
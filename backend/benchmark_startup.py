@@ -0,0 +1,73 @@
+"""
+Startup index creation benchmark.
+
+Measures the time from creating a Mongo client to being ready to serve for
+each way of handling indexes, against scratch databases (dropped afterwards):
+
+    MONGO_URL="mongodb://localhost:27017" python benchmark_startup.py --repeat 5
+
+  sequential  one create_index call per index, one after another (the old startup)
+  cold        concurrent createIndexes per collection on empty databases
+  warm        concurrent createIndexes when every index already exists (--force)
+  skipped     the stored spec hash matches, so only one find_one is issued
+"""
+import argparse
+import asyncio
+import os
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from database import INDEX_SPECS, INVITATION_INDEX_SPECS, create_indexes
+
+BENCHMARK_DB = "benchmark_startup"
+BENCHMARK_INVITATIONS_DB = "benchmark_startup_invitations"
+
+async def create_sequentially(database, invitations_database):
+    for name, models in INDEX_SPECS.items():
+        for model in models:
+            await database[name].create_indexes([model])
+    for model in INVITATION_INDEX_SPECS:
+        await invitations_database.invitations.create_indexes([model])
+
+async def drop_scratch(client):
+    await client.drop_database(BENCHMARK_DB)
+    await client.drop_database(BENCHMARK_INVITATIONS_DB)
+
+async def timed_start(mongo_url: str, mode: str) -> float:
+    started = time.perf_counter()
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        await client.admin.command("ping")
+        database, invitations_database = client[BENCHMARK_DB], client[BENCHMARK_INVITATIONS_DB]
+        if mode == "sequential":
+            await create_sequentially(database, invitations_database)
+        else:
+            await create_indexes(database, invitations_database, force=mode != "skipped")
+        return time.perf_counter() - started
+    finally:
+        client.close()
+
+async def run(repeat: int):
+    mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+    admin = AsyncIOMotorClient(mongo_url)
+    try:
+        for mode in ("sequential", "cold", "warm", "skipped"):
+            timings = []
+            for _ in range(repeat):
+                if mode in ("sequential", "cold"):
+                    await drop_scratch(admin)
+                timings.append(await timed_start(mongo_url, mode))
+            timings.sort()
+            print(f"{mode:<11} median {timings[len(timings) // 2] * 1000:8.1f} ms   "
+                  f"min {timings[0] * 1000:8.1f} ms   max {timings[-1] * 1000:8.1f} ms")
+    finally:
+        await drop_scratch(admin)
+        admin.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+if __name__ == "__main__":
+    main()
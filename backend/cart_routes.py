@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends
+from typing import Optional
+from auth import get_current_active_user
+from database import get_database
+from models import Cart, CartItemAdd, CartItemUpdate
+from cart_service import cart_store
+from request_tracing import TracedRoute
+
+cart_router = APIRouter(prefix="/api/cart", tags=["cart"], route_class=TracedRoute)
+
+@cart_router.get("", response_model=Cart)
+async def get_cart(
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Get the current user's cart"""
+    return await cart_store.get(db, current_user["id"])
+
+@cart_router.post("/items", response_model=Cart)
+async def add_cart_item(
+    item_data: CartItemAdd,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Add a product to the cart, or increase its quantity"""
+    return await cart_store.add_item(
+        db, current_user["id"], item_data.product_id, item_data.quantity, item_data.expected_version
+    )
+
+@cart_router.put("/items/{product_id}", response_model=Cart)
+async def update_cart_item(
+    product_id: str,
+    item_data: CartItemUpdate,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Set the quantity of a product in the cart (0 removes it)"""
+    return await cart_store.set_quantity(
+        db, current_user["id"], product_id, item_data.quantity, item_data.expected_version
+    )
+
+@cart_router.delete("/items/{product_id}", response_model=Cart)
+async def remove_cart_item(
+    product_id: str,
+    expected_version: Optional[int] = None,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Remove a product from the cart"""
+    return await cart_store.set_quantity(db, current_user["id"], product_id, 0, expected_version)
+
+@cart_router.delete("", response_model=Cart)
+async def clear_cart(
+    expected_version: Optional[int] = None,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Remove every item from the cart"""
+    return await cart_store.clear(db, current_user["id"], expected_version)
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Set
+from fastapi import HTTPException, status
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+class CartStore:
+    """In-memory carts with coalesced write-behind persistence to `carts`.
+
+    Mutations only touch the in-process cart and mark it dirty; a background
+    flush writes each dirty cart once per interval with a single bulk_write.
+    Every change bumps the cart version: clients may send expected_version to
+    detect concurrent edits, and flushes only overwrite older stored versions.
+    A flush rejected because a newer version is stored is reported to the
+    user's next cart request as a 409. Checkout empties the stored cart with
+    a higher version instead of deleting it, so a flush still in flight
+    cannot bring the purchased cart back.
+    Carts are cached per process, so run one worker or route users stickily.
+    """
+
+    def __init__(self, flush_interval: float = 2.0, max_idle_seconds: float = 1800):
+        self.flush_interval = flush_interval
+        self.max_idle_seconds = max_idle_seconds
+        self._carts: Dict[str, Cart] = {}
+        self._last_access: Dict[str, float] = {}
+        self._dirty: Set[str] = set()
+        # Users whose last changes lost to a newer cart stored by another worker
+        self._conflicts: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, db, user_id: str) -> Cart:
+        """Get a user's cart, loading it from Mongo on first access"""
+        if user_id in self._conflicts:
+            self._conflicts.discard(user_id)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Cart was changed in another session and your last changes were not saved; reload it"
+            )
+        cart = self._carts.get(user_id)
+        if cart is None:
+            doc = await db.carts.find_one({"user_id": user_id})
+            # Another request may have loaded the cart while we were waiting
+            cart = self._carts.setdefault(user_id, Cart(**doc) if doc else Cart(user_id=user_id))
+        self._last_access[user_id] = time.monotonic()
+        return cart
+
+    def _check_version(self, cart: Cart, expected_version: Optional[int]) -> None:
+        if expected_version is not None and expected_version != cart.version:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Cart was modified (expected version {expected_version}, current {cart.version})"
+            )
+
+    def _touch(self, cart: Cart) -> Cart:
+        cart.version += 1
+        cart.updated_at = datetime.utcnow()
+        if not cart.items:
+            cart.store_id = None
+        self._dirty.add(cart.user_id)
+        return cart
+
+    async def add_item(self, db, user_id: str, product_id: str, quantity: int, expected_version: Optional[int] = None) -> Cart:
+        """Add quantity of a product, pricing it only when it is new to the cart"""
+        cart = await self.get(db, user_id)
+        self._check_version(cart, expected_version)
+
+        for item in cart.items:
+            if item.product_id == product_id:
+                item.quantity += quantity
+                return self._touch(cart)
+
+        product = await db.products.find_one(
+            {"id": product_id, "is_available": True}, {"price": 1, "store_id": 1}
+        )
+        if not product:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+        # Re-check after the lookup; the cart may have changed meanwhile
+        self._check_version(cart, expected_version)
+        if cart.items and cart.store_id != product["store_id"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cart can only contain products from one store"
+            )
+
+        existing = next((item for item in cart.items if item.product_id == product_id), None)
+        if existing:
+            existing.quantity += quantity
+        else:
+            cart.items.append(CartItem(product_id=product_id, quantity=quantity, price=product["price"]))
+            cart.store_id = product["store_id"]
+        return self._touch(cart)
+
+    async def set_quantity(self, db, user_id: str, product_id: str, quantity: int, expected_version: Optional[int] = None) -> Cart:
+        """Set the quantity of a product already in the cart; 0 removes it"""
+        cart = await self.get(db, user_id)
+        self._check_version(cart, expected_version)
+
+        item = next((item for item in cart.items if item.product_id == product_id), None)
+        if item is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not in cart")
+
+        if quantity == 0:
+            cart.items.remove(item)
+        else:
+            item.quantity = quantity
+        return self._touch(cart)
+
+    async def clear(self, db, user_id: str, expected_version: Optional[int] = None) -> Cart:
+        """Remove every item from the cart"""
+        cart = await self.get(db, user_id)
+        self._check_version(cart, expected_version)
+        cart.items = []
+        return self._touch(cart)
+
+    def discard(self, user_id: str) -> None:
+        """Forget a cached cart so the next access reloads it (e.g. after checkout)"""
+        self._carts.pop(user_id, None)
+        self._last_access.pop(user_id, None)
+        self._dirty.discard(user_id)
+
+    async def checkout(self, db, user_id: str, session=None) -> None:
+        """Empty the stored cart at a version above any this process may still flush"""
+        cached = self._carts.get(user_id)
+        now = datetime.utcnow()
+        await db.carts.update_one(
+            {"user_id": user_id},
+            {
+                "$set": {"items": [], "store_id": None, "updated_at": now, "checked_out_at": now},
+                "$max": {"version": (cached.version if cached else 0) + 1},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+            },
+            upsert=True,
+            session=session
+        )
+
+    async def flush(self, db) -> int:
+        """Write every dirty cart with one bulk_write, returning how many were written"""
+        dirty, self._dirty = self._dirty, set()
+        carts = [self._carts[user_id] for user_id in dirty if user_id in self._carts]
+        if not carts:
+            return 0
+
+        operations = [
+            UpdateOne(
+                {
+                    "user_id": cart.user_id,
+                    "$or": [{"version": {"$lt": cart.version}}, {"version": {"$exists": False}}]
+                },
+                {
+                    "$set": cart.dict(exclude={"id", "user_id", "created_at"}),
+                    "$setOnInsert": {"id": cart.id, "created_at": cart.created_at}
+                },
+                upsert=True
+            )
+            for cart in carts
+        ]
+
+        try:
+            await db.carts.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                cart = carts[error["index"]]
+                if error.get("code") == DUPLICATE_KEY_ERROR:
+                    # A newer version is stored; unless checkout already dropped this cart,
+                    # it came from another worker and the user's changes were lost
+                    if self._carts.get(cart.user_id) is cart:
+                        self._conflicts.add(cart.user_id)
+                        logger.warning(f"Cart of user {cart.user_id} lost to a newer version (v{cart.version})")
+                    self.discard(cart.user_id)
+                else:
+                    self._dirty.add(cart.user_id)
+            logger.warning(f"Cart flush had {len(e.details.get('writeErrors', []))} write errors")
+        except Exception:
+            self._dirty.update(cart.user_id for cart in carts)
+            raise
+
+        return len(carts)
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.max_idle_seconds
+        for user_id, last_access in list(self._last_access.items()):
+            if last_access < cutoff and user_id not in self._dirty:
+                self.discard(user_id)
+
+    def start(self, db) -> None:
+        """Start the periodic write-behind flush"""
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self, db) -> None:
+        """Stop flushing and write out any remaining changes"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush(db)
+
+    async def _run(self, db) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(db)
+                self._evict_idle()
+            except Exception as e:
+                logger.error(f"Cart flush failed: {str(e)}")
+
+# Shared cart store for this process
+cart_store = CartStore()
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from auth import get_courier_user
+from database import get_database
+from delivery_zones import ZONE_CENTROIDS
+from eta_service import COURIER_SPEED_KMH, DEFAULT_STORE_ZONE, HANDOFF_MINUTES, ROAD_FACTOR
+from models import OrderStatus
+from route_planner import plan_route
+from request_tracing import TracedRoute
+
+courier_router = APIRouter(prefix="/api/courier", tags=["courier"], route_class=TracedRoute)
+
+ROUTE_PROJECTION = {"_id": 0, "id": 1, "store_id": 1, "status": 1, "delivery_zone": 1, "delivery_address": 1}
+
+def stop_location(order: dict) -> tuple:
+    """Drop-off coordinates of an order, falling back to its zone's centre"""
+    address = order.get("delivery_address") or {}
+    if address.get("latitude") is not None and address.get("longitude") is not None:
+        return address["latitude"], address["longitude"]
+    return ZONE_CENTROIDS.get(order.get("delivery_zone"), ZONE_CENTROIDS[DEFAULT_STORE_ZONE])
+
+@courier_router.get("/route")
+async def get_courier_route(
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    current_user: dict = Depends(get_courier_user),
+    db = Depends(get_database)
+):
+    """Get the courier's assigned orders in a short delivery order (Couriers only)
+
+    The route starts at the courier's coordinates when given, otherwise at the store.
+    """
+    orders = await db.orders.find(
+        {
+            "delivery_driver_id": current_user["id"],
+            "status": {"$in": [OrderStatus.READY.value, OrderStatus.OUT_FOR_DELIVERY.value]}
+        },
+        ROUTE_PROJECTION
+    ).to_list(100)
+    
+    if latitude is not None and longitude is not None:
+        start = (latitude, longitude)
+    else:
+        store_ids = list({order["store_id"] for order in orders})
+        store = await db.stores.find_one({"id": {"$in": store_ids}}, {"delivery_zones": 1}) if store_ids else None
+        store_zone = next(iter((store or {}).get("delivery_zones") or []), DEFAULT_STORE_ZONE)
+        start = ZONE_CENTROIDS.get(store_zone, ZONE_CENTROIDS[DEFAULT_STORE_ZONE])
+    
+    locations = [stop_location(order) for order in orders]
+    sequence, legs = plan_route(start, locations)
+    
+    stops = []
+    elapsed_minutes = 0.0
+    for index, leg_km in zip(sequence, legs):
+        order, location = orders[index], locations[index]
+        elapsed_minutes += HANDOFF_MINUTES + leg_km * ROAD_FACTOR / COURIER_SPEED_KMH * 60
+        stops.append({
+            "order_id": order["id"],
+            "status": order["status"],
+            "delivery_zone": order.get("delivery_zone"),
+            "latitude": location[0],
+            "longitude": location[1],
+            "address": (order.get("delivery_address") or {}).get("street_address"),
+            "eta_minutes": round(elapsed_minutes, 1)
+        })
+    
+    return {"start": {"latitude": start[0], "longitude": start[1]}, "stops": stops, "total_km": round(sum(legs), 2)}
@@ -1,67 +1,206 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
+from mongo_client import create_client, catalog_read_preference
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+from typing import Dict, List, Optional
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Set to "false" to skip index creation when API workers start, and run
+# `python ensure_indexes.py` once per deploy instead
+CREATE_INDEXES_ON_STARTUP = os.getenv("CREATE_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+# InvitationSystem keeps codes in its own database
+INVITATIONS_DB = "megabodega_db"
+
+# Non-unique cart index from before carts were unique per user; dropped by migrate_carts
+LEGACY_CART_USER_INDEX = "user_id_1"
+
+# MongoDB error code for dropping an index that does not exist
+INDEX_NOT_FOUND = 27
+
+# Read notifications are deleted this long after being read; unread ones are kept
+READ_NOTIFICATION_TTL_SECONDS = 30 * 24 * 60 * 60
+
 class Database:
     client: Optional[AsyncIOMotorClient] = None
     database = None
+    catalog = None  # Same database, read with CATALOG_READ_PREFERENCE
 
 db = Database()
 
 async def get_database():
     return db.database
 
+async def get_catalog_database():
+    return db.catalog
+
+def get_client() -> Optional[AsyncIOMotorClient]:
+    return db.client
+
 async def connect_to_mongo():
     """Create database connection"""
     mongo_url = os.getenv("MONGO_URL")
     db_name = os.getenv("DB_NAME", "delivery_app")
     
-    db.client = AsyncIOMotorClient(mongo_url)
+    db.client = create_client(mongo_url)
     db.database = db.client[db_name]
+    db.catalog = db.database.with_options(read_preference=catalog_read_preference())
     
     # Create indexes for performance
-    await create_indexes()
+    if CREATE_INDEXES_ON_STARTUP:
+        await create_indexes()
 
 async def close_mongo_connection():
     """Close database connection"""
     if db.client:
         db.client.close()
 
-async def create_indexes():
-    """Create database indexes for better performance"""
-    if db.database is None:
-        return
-    
-    # User indexes
-    await db.database.users.create_index("email", unique=True)
-    await db.database.users.create_index("role")
-    
-    # Product indexes
-    await db.database.products.create_index("store_id")
-    await db.database.products.create_index("category_id")
-    await db.database.products.create_index("is_available")
-    
-    # Order indexes
-    await db.database.orders.create_index("user_id")
-    await db.database.orders.create_index("store_id")
-    await db.database.orders.create_index("status")
-    await db.database.orders.create_index("created_at")
-    
-    # Cart indexes
-    await db.database.carts.create_index("user_id")
-    await db.database.carts.create_index("store_id")
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel("email", unique=True),
+        IndexModel("role"),
+    ],
+    "products": [
+        IndexModel("id"),
+        IndexModel("store_id"),
+        IndexModel("category_id"),
+        IndexModel("is_available"),
+    ],
+    "orders": [
+        IndexModel([("user_id", 1), ("created_at", -1), ("_id", -1)]),
+        IndexModel([("store_id", 1), ("created_at", -1), ("_id", -1)]),
+        IndexModel([("store_id", 1), ("status", 1), ("created_at", -1), ("_id", -1)]),
+        IndexModel("status"),
+        IndexModel("created_at"),
+        IndexModel("id", unique=True),
+        IndexModel([("status", 1), ("delivery_driver_id", 1)]),
+        IndexModel([("delivery_driver_id", 1), ("status", 1)]),
+        IndexModel("last_transition_id", sparse=True),
+    ],
+    # Analytics rollups
+    "store_rollups": [
+        IndexModel([("granularity", 1), ("store_id", 1), ("bucket", 1)]),
+    ],
+    "carts": [
+        # Own name, so it does not clash with the legacy non-unique user_id_1
+        IndexModel("user_id", unique=True, name="user_id_unique"),
+        IndexModel("store_id"),
+    ],
+    "addresses": [
+        IndexModel("user_id"),
+    ],
+    "notifications": [
+        IndexModel("id", unique=True),
+        IndexModel("user_id"),
+        IndexModel("is_read"),
+        IndexModel([("user_id", 1), ("sent_at", -1), ("_id", -1)]),
+        IndexModel([("user_id", 1), ("is_read", 1)]),
+        IndexModel(
+            "read_at",
+            expireAfterSeconds=READ_NOTIFICATION_TTL_SECONDS,
+            partialFilterExpression={"is_read": True}
+        ),
+    ],
+    "payment_transactions": [
+        IndexModel("session_id", unique=True),
+        IndexModel("order_id"),
+        IndexModel("user_id"),
+        IndexModel([("payment_status", 1), ("updated_at", 1)]),
+        # Fulfillment outbox: paid transactions whose job is not queued yet
+        IndexModel("updated_at", name="fulfillment_outbox", partialFilterExpression={"fulfillment_queued": False}),
+    ],
+    # Processed Stripe webhook events (Stripe retries for up to 3 days)
+    "stripe_events": [
+        IndexModel("received_at", expireAfterSeconds=7 * 24 * 60 * 60),
+    ],
+    # Job queue (claim scans runnable and lease-expired jobs)
+    "jobs": [
+        IndexModel("id", unique=True),
+        IndexModel([("status", 1), ("run_at", 1)]),
+        IndexModel([("status", 1), ("lease_expires_at", 1)]),
+        IndexModel("dedupe_key", unique=True, sparse=True),
+        IndexModel("finished_at", expireAfterSeconds=7 * 24 * 60 * 60),
+    ],
+}
+
+# Unused invitation codes must be unique so bulk inserts can detect collisions
+INVITATION_INDEX_SPECS: List[IndexModel] = [
+    IndexModel("code", unique=True, partialFilterExpression={"is_used": False}),
+    IndexModel([("created_by", 1), ("created_at", -1), ("_id", -1)]),
+]
+
+def index_spec_hash() -> str:
+    """Hash of every index definition, to detect when indexes need (re)creating"""
+    specs = {
+        name: [model.document for model in models]
+        for name, models in {**INDEX_SPECS, f"{INVITATIONS_DB}.invitations": INVITATION_INDEX_SPECS}.items()
+    }
+    return hashlib.sha256(json.dumps(specs, sort_keys=True, default=str).encode()).hexdigest()
+
+async def migrate_carts(database) -> int:
+    """Keep only the newest cart per user and drop the legacy non-unique user_id index.
+
+    Must run before the unique user_id index is created; returns how many
+    duplicate carts were deleted.
+    """
+    duplicates = database.carts.aggregate([
+        {"$sort": {"version": -1, "updated_at": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    stale_ids = []
+    async for group in duplicates:
+        stale_ids.extend(group["ids"][1:])
+    if stale_ids:
+        await database.carts.delete_many({"_id": {"$in": stale_ids}})
+        logger.warning(f"Deleted {len(stale_ids)} duplicate carts")
     
-    # Address indexes
-    await db.database.addresses.create_index("user_id")
+    try:
+        await database.carts.drop_index(LEGACY_CART_USER_INDEX)
+    except OperationFailure as e:
+        if e.code != INDEX_NOT_FOUND:
+            raise
+    return len(stale_ids)
+
+async def create_indexes(database=None, invitations_database=None, force: bool = False) -> bool:
+    """Create database indexes for better performance.
+
+    Each collection gets one createIndexes command and all collections are
+    sent concurrently. The spec hash is stored in schema_meta, so later starts
+    skip the work unless the definitions changed or force is set. Data
+    migrations the new indexes depend on run first. Returns whether indexes
+    were created.
+    """
+    database = database if database is not None else db.database
+    if database is None:
+        return False
+    invitations_database = invitations_database if invitations_database is not None else db.client[INVITATIONS_DB]
     
-    # Notification indexes
-    await db.database.notifications.create_index("user_id")
-    await db.database.notifications.create_index("is_read")
+    spec_hash = index_spec_hash()
+    if not force:
+        applied = await database.schema_meta.find_one({"_id": "indexes"})
+        if applied and applied.get("spec_hash") == spec_hash:
+            return False
     
-    # Payment transaction indexes
-    await db.database.payment_transactions.create_index("session_id", unique=True)
-    await db.database.payment_transactions.create_index("order_id")
-    await db.database.payment_transactions.create_index("user_id")
\ No newline at end of file
+    await migrate_carts(database)
+    await asyncio.gather(
+        *(database[name].create_indexes(models) for name, models in INDEX_SPECS.items()),
+        invitations_database.invitations.create_indexes(INVITATION_INDEX_SPECS)
+    )
+    await database.schema_meta.update_one(
+        {"_id": "indexes"},
+        {"$set": {"spec_hash": spec_hash, "applied_at": datetime.utcnow()}},
+        upsert=True
+    )
+    logger.info(f"Created indexes on {len(INDEX_SPECS) + 1} collections")
+    return True
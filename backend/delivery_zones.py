@@ -0,0 +1,144 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Delivery areas in Baños de Agua Santa; ids double as courier delivery zones.
+# Boundaries are GeoJSON polygons, [longitude, latitude] pairs, ring closed.
+DELIVERY_AREAS = [
+    {
+        "id": "banos-centro",
+        "name": "Baños Centro",
+        "city": "Baños de Agua Santa",
+        "state": "Tungurahua",
+        "country": "Ecuador",
+        "is_active": True,
+        "boundary": {
+            "type": "Polygon",
+            "coordinates": [[
+                [-78.4340, -1.3925], [-78.4235, -1.3920], [-78.4130, -1.3930],
+                [-78.4130, -1.3990], [-78.4235, -1.3995], [-78.4340, -1.3985],
+                [-78.4340, -1.3925]
+            ]]
+        }
+    },
+    {
+        "id": "banos-norte",
+        "name": "Baños Norte",
+        "city": "Baños de Agua Santa",
+        "state": "Tungurahua",
+        "country": "Ecuador",
+        "is_active": True,
+        "boundary": {
+            "type": "Polygon",
+            "coordinates": [[
+                [-78.4340, -1.3850], [-78.4130, -1.3850],
+                [-78.4130, -1.3930], [-78.4235, -1.3920], [-78.4340, -1.3925],
+                [-78.4340, -1.3850]
+            ]]
+        }
+    },
+    {
+        "id": "banos-sur",
+        "name": "Baños Sur",
+        "city": "Baños de Agua Santa",
+        "state": "Tungurahua",
+        "country": "Ecuador",
+        "is_active": True,
+        "boundary": {
+            "type": "Polygon",
+            "coordinates": [[
+                [-78.4340, -1.3985], [-78.4235, -1.3995], [-78.4130, -1.3990],
+                [-78.4130, -1.4080], [-78.4340, -1.4080],
+                [-78.4340, -1.3985]
+            ]]
+        }
+    }
+]
+
+DELIVERY_ZONE_IDS = {area["id"] for area in DELIVERY_AREAS}
+
+def ring_centroid(ring: Sequence[Sequence[float]]) -> Tuple[float, float]:
+    """Mean vertex of a closed ring, as (latitude, longitude)"""
+    vertices = ring[:-1]
+    return (
+        sum(lat for _, lat in vertices) / len(vertices),
+        sum(lng for lng, _ in vertices) / len(vertices)
+    )
+
+# Representative point of each zone, used when an address has no coordinates
+ZONE_CENTROIDS = {area["id"]: ring_centroid(area["boundary"]["coordinates"][0]) for area in DELIVERY_AREAS}
+
+# Grid cell size in degrees (about 55 m at the equator)
+GRID_CELL_DEGREES = 0.0005
+
+Ring = Sequence[Sequence[float]]
+
+def point_in_ring(lng: float, lat: float, ring: Ring) -> bool:
+    """Ray-casting point in polygon test"""
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (y1 > lat) != (y2 > lat) and lng < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+class ZoneIndex:
+    """Uniform grid over the zone polygons for constant-time point lookups.
+
+    Each cell that no polygon edge passes through is labelled with the zone
+    covering it (or none) when the index is built; only cells on a boundary
+    keep a short list of candidate zones that need a point-in-polygon test.
+    """
+
+    def __init__(self, areas: List[Dict], cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell = cell_degrees
+        self.rings: Dict[str, Ring] = {
+            area["id"]: area["boundary"]["coordinates"][0] for area in areas if area.get("is_active")
+        }
+        points = [point for ring in self.rings.values() for point in ring]
+        self.min_lng = min(lng for lng, _ in points)
+        self.min_lat = min(lat for _, lat in points)
+        self.columns = math.ceil((max(lng for lng, _ in points) - self.min_lng) / self.cell)
+        self.rows = math.ceil((max(lat for _, lat in points) - self.min_lat) / self.cell)
+        # Per cell: a zone id, None (outside every zone) or a tuple of candidate zone ids
+        self.cells: List[object] = [self._classify(column, row) for row in range(self.rows) for column in range(self.columns)]
+
+    def _classify(self, column: int, row: int) -> object:
+        west = self.min_lng + column * self.cell
+        south = self.min_lat + row * self.cell
+        east, north = west + self.cell, south + self.cell
+
+        crossing = tuple(
+            zone_id for zone_id, ring in self.rings.items()
+            if any(
+                min(x1, x2) <= east and max(x1, x2) >= west and min(y1, y2) <= north and max(y1, y2) >= south
+                for (x1, y1), (x2, y2) in zip(ring, ring[1:])
+            )
+        )
+        if crossing:
+            return crossing
+
+        center_lng, center_lat = west + self.cell / 2, south + self.cell / 2
+        return next(
+            (zone_id for zone_id, ring in self.rings.items() if point_in_ring(center_lng, center_lat, ring)),
+            None
+        )
+
+    def lookup(self, latitude: float, longitude: float) -> Optional[str]:
+        """Id of the delivery zone containing a point, or None if it is outside all zones"""
+        column = int((longitude - self.min_lng) // self.cell)
+        row = int((latitude - self.min_lat) // self.cell)
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return None
+
+        cell = self.cells[row * self.columns + column]
+        if not isinstance(cell, tuple):
+            return cell
+        return next(
+            (zone_id for zone_id in cell if point_in_ring(longitude, latitude, self.rings[zone_id])),
+            None
+        )
+
+zone_index = ZoneIndex(DELIVERY_AREAS)
+
+def resolve_delivery_zone(latitude: float, longitude: float) -> Optional[str]:
+    """Delivery zone for a coordinate, or None if it is outside the delivery area"""
+    return zone_index.lookup(latitude, longitude)
@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from models import OrderStatus
+from order_events import order_events, ALL_ORDERS_TOPIC
+
+logger = logging.getLogger(__name__)
+
+# Bucket for orders placed without a delivery zone; every courier can see it
+UNZONED = ""
+
+# Orders a courier may hold at once (assigned or out for delivery)
+MAX_ACTIVE_ORDERS_PER_COURIER = int(os.getenv("MAX_ACTIVE_ORDERS_PER_COURIER", "3"))
+
+# Seconds a courier stays in the dispatch line after asking for work
+COURIER_TTL_SECONDS = 120
+
+# Order fields the dispatcher keeps in memory for each ready order
+DISPATCH_PROJECTION = {"_id": 0, "id": 1, "store_id": 1, "delivery_zone": 1, "created_at": 1}
+
+class Dispatcher:
+    """Assigns ready orders to couriers, per delivery zone.
+
+    Ready orders wait in a per-zone heap, oldest first, and couriers that have
+    asked for work wait in a per-zone FIFO. Assignment always goes through an
+    atomic claim on the order document, so two couriers (or two workers) can
+    never get the same order; the in-memory queues are only an index and are
+    rebuilt from Mongo on start. Orders ready at the same store in the same
+    zone within batch_window_seconds are handed to one courier together.
+    Each claim first takes one of the courier's max_active_orders slots,
+    counted on their user document, and gives it back if the order is gone.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 3,
+        batch_window_seconds: float = 300,
+        courier_ttl_seconds: float = COURIER_TTL_SECONDS,
+        max_active_orders: int = MAX_ACTIVE_ORDERS_PER_COURIER
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_active_orders = max_active_orders
+        self.batch_window = timedelta(seconds=batch_window_seconds)
+        self.courier_ttl_seconds = courier_ttl_seconds
+        # zone -> heap of (created_at, seq, order_id); entries for orders no longer
+        # in _orders are stale and skipped when popped
+        self._ready: Dict[str, List[Tuple[datetime, int, str]]] = defaultdict(list)
+        self._stale: Dict[str, int] = defaultdict(int)
+        self._orders: Dict[str, Dict] = {}
+        # zone -> courier id -> time the courier became available, oldest first
+        self._couriers: Dict[str, "OrderedDict[str, float]"] = defaultdict(OrderedDict)
+        self._courier_zones: Dict[str, str] = {}
+        self._sequence = itertools.count()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _zone_of(doc: Dict) -> str:
+        return doc.get("delivery_zone") or UNZONED
+
+    def _zones_for(self, courier: Dict) -> List[str]:
+        # Couriers without a zone cover the whole town
+        if courier.get("delivery_zone"):
+            return [courier["delivery_zone"], UNZONED]
+        return list(self._ready)
+
+    def add_ready_order(self, order: Dict) -> None:
+        """Queue an order that is ready for pickup"""
+        if order["id"] in self._orders:
+            return
+        summary = {field: order.get(field) for field in DISPATCH_PROJECTION if field != "_id"}
+        zone = self._zone_of(summary)
+        self._orders[order["id"]] = summary
+        heapq.heappush(self._ready[zone], (summary["created_at"], next(self._sequence), order["id"]))
+
+    def remove_order(self, order_id: str) -> None:
+        """Forget an order that was assigned, cancelled or moved on"""
+        summary = self._orders.pop(order_id, None)
+        if summary is None:
+            return
+        zone = self._zone_of(summary)
+        self._stale[zone] += 1
+        # Rebuild the heap once it is mostly stale entries
+        if self._stale[zone] > len(self._ready[zone]) // 2:
+            self._ready[zone] = [entry for entry in self._ready[zone] if entry[2] in self._orders]
+            heapq.heapify(self._ready[zone])
+            self._stale[zone] = 0
+
+    def _peek_order(self, zone: str) -> Optional[str]:
+        heap = self._ready.get(zone)
+        while heap:
+            order_id = heap[0][2]
+            if order_id in self._orders:
+                return order_id
+            heapq.heappop(heap)
+            self._stale[zone] -= 1
+        return None
+
+    def available_orders(self, courier: Dict, limit: int = 20) -> List[str]:
+        """Ids of the oldest ready orders a courier may accept"""
+        candidates = []
+        for zone in self._zones_for(courier):
+            heap = self._ready.get(zone, [])
+            # At most _stale[zone] entries are stale, so this window holds every live one we need
+            candidates.extend(
+                entry for entry in heapq.nsmallest(limit + self._stale[zone], heap)
+                if entry[2] in self._orders
+            )
+        return [order_id for _, _, order_id in heapq.nsmallest(limit, candidates)]
+
+    def courier_available(self, courier: Dict) -> None:
+        """Mark a courier as waiting for work in their zone"""
+        zone = courier.get("delivery_zone") or UNZONED
+        self._couriers[zone].pop(courier["id"], None)
+        self._couriers[zone][courier["id"]] = time.monotonic()
+        self._courier_zones[courier["id"]] = zone
+
+    def courier_busy(self, courier_id: str) -> None:
+        """Stop offering work to a courier"""
+        zone = self._courier_zones.pop(courier_id, None)
+        if zone is not None:
+            self._couriers[zone].pop(courier_id, None)
+
+    def _next_courier(self, zone: str) -> Optional[Tuple[str, str, float]]:
+        cutoff = time.monotonic() - self.courier_ttl_seconds
+        for courier_zone in (zone, UNZONED) if zone != UNZONED else (UNZONED,):
+            waiting = self._couriers.get(courier_zone)
+            while waiting:
+                courier_id, since = waiting.popitem(last=False)
+                self._courier_zones.pop(courier_id, None)
+                if since >= cutoff:
+                    return courier_id, courier_zone, since
+        return None
+
+    async def reserve_slot(self, db, courier_id: str) -> bool:
+        """Count one more active order for a courier, unless they are at the cap"""
+        result = await db.users.update_one(
+            {"id": courier_id, "active_orders": {"$not": {"$gte": self.max_active_orders}}},
+            {"$inc": {"active_orders": 1}}
+        )
+        return result.modified_count == 1
+
+    async def has_capacity(self, db, courier_id: str) -> bool:
+        """Whether a courier is below the active order cap"""
+        courier = await db.users.find_one({"id": courier_id}, {"_id": 0, "active_orders": 1})
+        return bool(courier) and courier.get("active_orders", 0) < self.max_active_orders
+
+    async def claim(self, db, order_id: str, courier_id: str) -> Optional[Dict]:
+        """Atomically assign a ready, unassigned order; None if someone else got it or the courier is full"""
+        if not await self.reserve_slot(db, courier_id):
+            return None
+        order = await db.orders.find_one_and_update(
+            {"id": order_id, "status": OrderStatus.READY.value, "delivery_driver_id": None},
+            {"$set": {"delivery_driver_id": courier_id, "assigned_at": datetime.utcnow()}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if order is None:
+            await db.users.update_one({"id": courier_id}, {"$inc": {"active_orders": -1}})
+        self.remove_order(order_id)
+        return order
+
+    def _batch_candidates(self, order: Dict) -> List[str]:
+        """Other ready orders from the same store and zone, close in time to this one"""
+        zone = self._zone_of(order)
+        return [
+            order_id
+            for _, _, order_id in sorted(self._ready.get(zone, []))
+            if order_id != order["id"]
+            and order_id in self._orders
+            and self._orders[order_id]["store_id"] == order["store_id"]
+            and abs(self._orders[order_id]["created_at"] - order["created_at"]) <= self.batch_window
+        ][:self.max_batch_size - 1]
+
+    async def accept(self, db, order_id: str, courier_id: str) -> List[Dict]:
+        """Claim an order for a courier plus any orders batched with it"""
+        order = await self.claim(db, order_id, courier_id)
+        if order is None:
+            return []
+        self.courier_busy(courier_id)
+
+        claimed = [order]
+        for candidate_id in self._batch_candidates(order):
+            batched = await self.claim(db, candidate_id, courier_id)
+            if batched:
+                claimed.append(batched)
+
+        for assigned in claimed:
+            await order_events.publish(db, "order.assigned", assigned, courier_id=courier_id, batch_size=len(claimed))
+        return claimed
+
+    async def dispatch(self, db) -> int:
+        """Pair waiting couriers with ready orders, returning how many orders were assigned"""
+        assigned = 0
+        async with self._lock:
+            for zone in list(self._ready):
+                while True:
+                    order_id = self._peek_order(zone)
+                    if order_id is None:
+                        break
+                    courier = self._next_courier(zone)
+                    if courier is None:
+                        break
+                    courier_id, courier_zone, since = courier
+                    claimed = await self.accept(db, order_id, courier_id)
+                    if not claimed and order_id in self._orders:
+                        # The courier is at the cap and stays out of the line until they ask again
+                        continue
+                    if not claimed:
+                        # Another courier got the order first; keep this one at the front of the line
+                        self._couriers[courier_zone][courier_id] = since
+                        self._couriers[courier_zone].move_to_end(courier_id, last=False)
+                        self._courier_zones[courier_id] = courier_zone
+                    assigned += len(claimed)
+        return assigned
+
+    async def rebuild(self, db) -> int:
+        """Reload the ready queue from Mongo, returning how many orders are waiting"""
+        self._ready.clear()
+        self._stale.clear()
+        self._orders.clear()
+        cursor = db.orders.find(
+            {"status": OrderStatus.READY.value, "delivery_driver_id": None}, DISPATCH_PROJECTION
+        )
+        async for order in cursor:
+            self.add_ready_order(order)
+        return len(self._orders)
+
+    def start(self, db) -> None:
+        """Load ready orders and follow order events"""
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        """Stop following order events"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, db) -> None:
+        queue = order_events.subscribe([ALL_ORDERS_TOPIC])
+        try:
+            await self.rebuild(db)
+            while True:
+                event = await queue.get()
+                try:
+                    await self._handle_event(db, event)
+                except Exception as e:
+                    logger.error(f"Dispatch failed for order {event['order_id']}: {str(e)}")
+        finally:
+            order_events.unsubscribe(queue, [ALL_ORDERS_TOPIC])
+
+    async def _handle_event(self, db, event: Dict) -> None:
+        if event["type"] == "order.assigned" or event.get("status") != OrderStatus.READY.value:
+            self.remove_order(event["order_id"])
+            return
+
+        order = await db.orders.find_one(
+            {"id": event["order_id"], "status": OrderStatus.READY.value, "delivery_driver_id": None},
+            DISPATCH_PROJECTION
+        )
+        if order:
+            self.add_ready_order(order)
+            await self.dispatch(db)
+
+# Shared dispatcher for this process
+dispatcher = Dispatcher()
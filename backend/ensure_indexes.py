@@ -0,0 +1,40 @@
+"""
+Create the database indexes outside API worker startup.
+
+Run once per deploy (for example as a release step) and start the API with
+CREATE_INDEXES_ON_STARTUP=false. Data migrations the indexes depend on (such
+as removing duplicate carts before carts.user_id becomes unique) run first:
+
+    python ensure_indexes.py          # skipped if the stored spec hash matches
+    python ensure_indexes.py --force  # re-issue every createIndexes command
+"""
+import argparse
+import asyncio
+import logging
+import os
+from database import create_indexes, INVITATIONS_DB
+from mongo_client import create_client
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+async def run(force: bool):
+    client = create_client()
+    try:
+        created = await create_indexes(
+            client[os.getenv("DB_NAME", "delivery_app")], client[INVITATIONS_DB], force=force
+        )
+        print("Indexes created" if created else "Indexes already up to date")
+    finally:
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="create indexes even if the spec hash matches")
+    args = parser.parse_args()
+    asyncio.run(run(args.force))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from delivery_zones import DELIVERY_AREAS, ZONE_CENTROIDS
+from dispatch import COURIER_TTL_SECONDS
+from models import OrderStatus, UserRole
+from route_planner import distance_matrix_km
+
+logger = logging.getLogger(__name__)
+
+# Zone order used for every per-zone array; index len(ZONE_IDS) means "unknown zone"
+ZONE_IDS = [area["id"] for area in DELIVERY_AREAS]
+ZONE_INDEX = {zone_id: index for index, zone_id in enumerate(ZONE_IDS)}
+
+# Stores without delivery zones are assumed to be in the centre
+DEFAULT_STORE_ZONE = "banos-centro"
+
+# Travel model: town roads are ~40% longer than the straight line, at ~20 km/h,
+# plus a fixed pickup/handoff time
+ROAD_FACTOR = 1.4
+COURIER_SPEED_KMH = 20.0
+HANDOFF_MINUTES = 4.0
+
+# Kitchen model: base preparation time, extra minutes per order ahead in the store's queue
+BASE_PREP_MINUTES = 10.0
+PREP_MINUTES_PER_QUEUED_ORDER = 3.0
+
+# Minutes a courier takes to finish a delivery and be free again
+COURIER_CYCLE_MINUTES = 25.0
+
+# Document in the leases collection held by the worker refreshing ETAs
+ETA_REFRESH_LEASE = "eta_refresh"
+
+# Only rewrite an order's ETA when it moved by more than this
+ETA_WRITE_THRESHOLD = timedelta(minutes=1)
+
+OPEN_STATUSES = [
+    OrderStatus.PENDING.value, OrderStatus.CONFIRMED.value, OrderStatus.PREPARING.value,
+    OrderStatus.READY.value, OrderStatus.OUT_FOR_DELIVERY.value
+]
+STATUS_CODES = {status: code for code, status in enumerate(OPEN_STATUSES)}
+READY_CODE = STATUS_CODES[OrderStatus.READY.value]
+OUT_FOR_DELIVERY_CODE = STATUS_CODES[OrderStatus.OUT_FOR_DELIVERY.value]
+
+ETA_PROJECTION = {
+    "_id": 0, "id": 1, "store_id": 1, "status": 1, "delivery_zone": 1, "delivery_driver_id": 1,
+    "created_at": 1, "picked_up_at": 1, "estimated_delivery_time": 1
+}
+
+def build_travel_matrix() -> np.ndarray:
+    """Minutes from zone i to zone j, with an extra row/column for unknown zones"""
+    km = distance_matrix_km([ZONE_CENTROIDS[zone_id] for zone_id in ZONE_IDS])
+    minutes = HANDOFF_MINUTES + km * ROAD_FACTOR / COURIER_SPEED_KMH * 60
+
+    # Unknown zones get the worst known travel time
+    matrix = np.full((len(ZONE_IDS) + 1, len(ZONE_IDS) + 1), minutes.max())
+    matrix[:-1, :-1] = minutes
+    return matrix
+
+TRAVEL_MINUTES = build_travel_matrix()
+
+def rank_within_groups(groups: np.ndarray, order_keys: np.ndarray) -> np.ndarray:
+    """Position of each element among elements of the same group, by ascending order_keys"""
+    if groups.size == 0:
+        return groups
+    order = np.lexsort((order_keys, groups))
+    sorted_groups = groups[order]
+    starts = np.r_[0, np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, sorted_groups.size]))
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(sorted_groups.size) - group_start
+    return ranks
+
+def estimate_minutes(
+    status_codes: np.ndarray,
+    store_indexes: np.ndarray,
+    pickup_zones: np.ndarray,
+    dropoff_zones: np.ndarray,
+    assigned: np.ndarray,
+    age_minutes: np.ndarray,
+    since_pickup_minutes: np.ndarray,
+    idle_couriers: np.ndarray,
+    zone_couriers: np.ndarray
+) -> np.ndarray:
+    """Minutes from now until delivery for every open order, in one vectorized pass.
+
+    Orders still in the kitchen wait behind older orders of the same store;
+    unassigned orders wait for a courier behind older unassigned orders of
+    the same pickup zone, beyond the couriers idle there; every order then
+    travels from its pickup zone to its drop-off zone.
+    """
+    in_kitchen = status_codes < READY_CODE
+    queue_position = rank_within_groups(np.where(in_kitchen, store_indexes, -1), -age_minutes)
+    prep = np.where(
+        in_kitchen,
+        np.maximum(BASE_PREP_MINUTES + queue_position * PREP_MINUTES_PER_QUEUED_ORDER - age_minutes, 0),
+        0
+    )
+
+    waiting = ~assigned & (status_codes < OUT_FOR_DELIVERY_CODE)
+    courier_position = rank_within_groups(np.where(waiting, pickup_zones, -1), -age_minutes)
+    behind_idle = np.maximum(courier_position - idle_couriers[pickup_zones] + 1, 0)
+    courier_wait = np.where(
+        waiting,
+        behind_idle * COURIER_CYCLE_MINUTES / np.maximum(zone_couriers[pickup_zones], 1),
+        0
+    )
+
+    travel = TRAVEL_MINUTES[pickup_zones, dropoff_zones]
+    on_the_way = status_codes == OUT_FOR_DELIVERY_CODE
+    return np.where(
+        on_the_way,
+        np.maximum(travel - since_pickup_minutes, 1),
+        # Couriers can head to the store while the order is being prepared
+        np.maximum(prep, courier_wait) + travel
+    )
+
+class EtaEstimator:
+    """Periodically refreshes estimated_delivery_time on every open order.
+
+    Courier counts come from the users collection rather than this process's
+    dispatcher, so every worker computes the same ETAs for the same orders.
+    Every API worker runs an estimator, but each round is claimed with a
+    lease in Mongo first, so only one worker refreshes per interval.
+    """
+
+    def __init__(self, interval_seconds: float = 30, idle_seconds: float = COURIER_TTL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.idle_seconds = idle_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def _courier_counts(self, db) -> Tuple[np.ndarray, np.ndarray]:
+        """Active couriers per zone, and those among them idle and waiting for work"""
+        zone_counts = np.zeros(len(ZONE_IDS) + 1)
+        idle_counts = np.zeros(len(ZONE_IDS) + 1)
+        idle_since = datetime.utcnow() - timedelta(seconds=self.idle_seconds)
+        pipeline = [
+            {"$match": {"role": {"$in": [UserRole.COURIER.value, UserRole.DELIVERY.value]}, "is_active": True}},
+            {"$group": {
+                "_id": "$delivery_zone",
+                "couriers": {"$sum": 1},
+                # Asked for work within the dispatch line's TTL and holds no orders
+                "idle": {"$sum": {"$cond": [
+                    {"$and": [
+                        {"$lte": [{"$ifNull": ["$active_orders", 0]}, 0]},
+                        {"$gte": ["$available_at", idle_since]}
+                    ]},
+                    1, 0
+                ]}}
+            }}
+        ]
+        async for group in db.users.aggregate(pipeline):
+            index = ZONE_INDEX.get(group["_id"], len(ZONE_IDS))
+            zone_counts[index] += group["couriers"]
+            idle_counts[index] += group["idle"]
+        return zone_counts, idle_counts
+
+    async def claim(self, db) -> bool:
+        """Lease the next refresh round, returning False if another worker holds it"""
+        now = datetime.utcnow()
+        try:
+            await db.leases.update_one(
+                {"_id": ETA_REFRESH_LEASE, "lease_until": {"$lte": now}},
+                {"$set": {"lease_until": now + timedelta(seconds=self.interval_seconds)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The lease exists and has not expired, so the upsert tried to insert a second one
+            return False
+        return True
+
+    async def refresh(self, db) -> int:
+        """Recompute ETAs for all open orders, returning how many were rewritten"""
+        orders: List[Dict] = await db.orders.find({"status": {"$in": OPEN_STATUSES}}, ETA_PROJECTION).to_list(None)
+        if not orders:
+            return 0
+
+        stores = {
+            store["id"]: store.get("delivery_zones") or []
+            async for store in db.stores.find({"id": {"$in": list({order["store_id"] for order in orders})}}, {"id": 1, "delivery_zones": 1})
+        }
+        store_ids = {store_id: index for index, store_id in enumerate(stores)}
+        unknown_zone = len(ZONE_IDS)
+        zone_couriers, idle_couriers = await self._courier_counts(db)
+        now = datetime.utcnow()
+
+        started = time.perf_counter()
+        minutes = estimate_minutes(
+            status_codes=np.fromiter((STATUS_CODES[order["status"]] for order in orders), int, len(orders)),
+            store_indexes=np.fromiter((store_ids.get(order["store_id"], -2) for order in orders), int, len(orders)),
+            pickup_zones=np.fromiter(
+                (ZONE_INDEX.get(next(iter(stores.get(order["store_id"]) or []), DEFAULT_STORE_ZONE), unknown_zone) for order in orders),
+                int, len(orders)
+            ),
+            dropoff_zones=np.fromiter((ZONE_INDEX.get(order.get("delivery_zone"), unknown_zone) for order in orders), int, len(orders)),
+            assigned=np.fromiter((bool(order.get("delivery_driver_id")) for order in orders), bool, len(orders)),
+            age_minutes=np.fromiter(((now - order["created_at"]).total_seconds() / 60 for order in orders), float, len(orders)),
+            since_pickup_minutes=np.fromiter(
+                (((now - order["picked_up_at"]).total_seconds() / 60) if order.get("picked_up_at") else 0.0 for order in orders),
+                float, len(orders)
+            ),
+            idle_couriers=idle_couriers,
+            zone_couriers=zone_couriers
+        )
+        computed_ms = (time.perf_counter() - started) * 1000
+
+        operations = []
+        for order, eta_minutes in zip(orders, minutes.tolist()):
+            eta = now + timedelta(minutes=eta_minutes)
+            previous = order.get("estimated_delivery_time")
+            if previous is None or abs(previous - eta) > ETA_WRITE_THRESHOLD:
+                operations.append(UpdateOne(
+                    {"id": order["id"], "status": order["status"]},
+                    {"$set": {"estimated_delivery_time": eta}}
+                ))
+        if operations:
+            await db.orders.bulk_write(operations, ordered=False)
+
+        logger.info(f"Refreshed ETAs for {len(orders)} open orders in {computed_ms:.1f} ms, rewrote {len(operations)}")
+        return len(operations)
+
+    def start(self, db) -> None:
+        """Start refreshing ETAs every interval_seconds"""
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        """Stop refreshing"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                if await self.claim(db):
+                    await self.refresh(db)
+            except Exception as e:
+                logger.error(f"ETA refresh failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
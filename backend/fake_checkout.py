@@ -0,0 +1,128 @@
+"""
+Offline stand-in for the emergentintegrations Stripe checkout client.
+
+Selected with PAYMENT_PROVIDER=fake. Sessions live in process memory, calls
+sleep for FAKE_STRIPE_LATENCY_MS to mimic the Stripe round trip, and webhooks
+must carry a Stripe-style signature made with FAKE_STRIPE_WEBHOOK_SECRET
+(see sign_webhook_payload). No network access or API key is needed.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from typing import Dict, Optional
+from pydantic import BaseModel
+
+FAKE_STRIPE_LATENCY_MS = float(os.getenv("FAKE_STRIPE_LATENCY_MS", "50"))
+FAKE_STRIPE_WEBHOOK_SECRET = os.getenv("FAKE_STRIPE_WEBHOOK_SECRET", "whsec_fake")
+WEBHOOK_TOLERANCE_SECONDS = 300
+
+class CheckoutSessionRequest(BaseModel):
+    amount: float
+    currency: str
+    success_url: str
+    cancel_url: str
+    metadata: Optional[Dict[str, str]] = None
+
+class CheckoutSessionResponse(BaseModel):
+    url: str
+    session_id: str
+
+class CheckoutStatusResponse(BaseModel):
+    status: str
+    payment_status: str
+    amount_total: int
+    currency: str
+    metadata: Dict[str, str]
+
+class WebhookResponse(BaseModel):
+    event_type: str
+    event_id: str
+    session_id: Optional[str] = None
+    payment_status: Optional[str] = None
+    metadata: Dict[str, str] = {}
+
+def sign_webhook_payload(payload: bytes, secret: str = FAKE_STRIPE_WEBHOOK_SECRET, timestamp: Optional[int] = None) -> str:
+    """Build a Stripe-Signature header value for a webhook payload"""
+    timestamp = timestamp or int(time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def build_checkout_completed_event(session_id: str, payment_status: str = "paid") -> bytes:
+    """Build a checkout.session.completed webhook payload"""
+    return json.dumps({
+        "id": f"evt_{uuid.uuid4().hex}",
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": session_id,
+            "status": "complete",
+            "payment_status": payment_status,
+            "metadata": {}
+        }}
+    }).encode()
+
+class StripeCheckout:
+    """In-memory checkout provider with the same interface as the Stripe client"""
+
+    # Shared by every client in the process, like sessions on Stripe's side
+    sessions: Dict[str, Dict] = {}
+
+    def __init__(self, api_key: str, webhook_url: Optional[str] = None, webhook_secret: Optional[str] = None):
+        self.api_key = api_key
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret or FAKE_STRIPE_WEBHOOK_SECRET
+
+    async def _round_trip(self):
+        if FAKE_STRIPE_LATENCY_MS > 0:
+            await asyncio.sleep(FAKE_STRIPE_LATENCY_MS / 1000)
+
+    async def create_checkout_session(self, request: CheckoutSessionRequest) -> CheckoutSessionResponse:
+        await self._round_trip()
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        self.sessions[session_id] = {
+            "status": "open",
+            "payment_status": "unpaid",
+            "amount_total": int(round(request.amount * 100)),
+            "currency": request.currency,
+            "metadata": dict(request.metadata or {})
+        }
+        return CheckoutSessionResponse(url=f"https://checkout.stripe.test/c/pay/{session_id}", session_id=session_id)
+
+    async def get_checkout_status(self, checkout_session_id: str) -> CheckoutStatusResponse:
+        await self._round_trip()
+        session = self.sessions.get(checkout_session_id)
+        if session is None:
+            raise ValueError(f"No such checkout session: {checkout_session_id}")
+        return CheckoutStatusResponse(**session)
+
+    async def handle_webhook(self, payload: bytes, signature: str) -> WebhookResponse:
+        self._verify_signature(payload, signature)
+        event = json.loads(payload)
+        session = event["data"]["object"]
+
+        stored = self.sessions.get(session["id"])
+        if stored is not None:
+            stored["status"] = session.get("status", stored["status"])
+            stored["payment_status"] = session.get("payment_status", stored["payment_status"])
+
+        return WebhookResponse(
+            event_type=event["type"],
+            event_id=event["id"],
+            session_id=session["id"],
+            payment_status=session.get("payment_status"),
+            metadata=session.get("metadata", {})
+        )
+
+    def _verify_signature(self, payload: bytes, signature: str) -> None:
+        parts = dict(part.split("=", 1) for part in signature.split(",") if "=" in part)
+        timestamp = int(parts.get("t", "0"))
+        if abs(time.time() - timestamp) > WEBHOOK_TOLERANCE_SECONDS:
+            raise ValueError("Webhook timestamp outside tolerance")
+
+        expected = sign_webhook_payload(payload, self.webhook_secret, timestamp).split("v1=", 1)[1]
+        if not hmac.compare_digest(expected, parts.get("v1", "")):
+            raise ValueError("Invalid webhook signature")
@@ -0,0 +1,45 @@
+"""
+Standalone fulfillment worker.
+
+Runs the post-payment and analytics backfill job workers outside the API
+processes so fulfillment can be scaled independently; start the API with
+FULFILLMENT_WORKERS=0.
+
+    python fulfillment_worker.py --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+from database import connect_to_mongo, close_mongo_connection, get_database
+from job_queue import JobWorkerPool, job_queue
+from payment_service import PaymentService, FULFILL_PAYMENT_JOB
+from analytics import ANALYTICS_BACKFILL_JOB, rebuild_rollups
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+async def run(concurrency: int):
+    await connect_to_mongo()
+    payment_service = PaymentService()
+    workers = JobWorkerPool(
+        job_queue,
+        {FULFILL_PAYMENT_JOB: payment_service.fulfill_payment, ANALYTICS_BACKFILL_JOB: rebuild_rollups},
+        concurrency=concurrency
+    )
+    workers.start(await get_database())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await workers.stop()
+        await close_mongo_connection()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,105 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
-import os
 import secrets
 import string
 from datetime import datetime, timedelta
+from typing import Optional
+from pagination import keyset_filter, next_cursor
+from mongo_client import create_client
 
 load_dotenv()
 
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+DUPLICATE_KEY_ERROR = 11000
+INVITATION_LIST_PROJECTION = {
+    "code": 1, "role": 1, "created_at": 1, "expires_at": 1,
+    "is_used": 1, "used_by": 1, "used_at": 1
+}
+MAX_BULK_INSERT_ATTEMPTS = 5
+
+def generate_code() -> str:
+    """Генерирует случайный код приглашения"""
+    return ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+def build_invitation(code: str, role: str, created_by: str, expires_in_days: int) -> dict:
+    """Создает документ приглашения"""
+    now = datetime.utcnow()
+    return {
+        "code": code,
+        "role": role,
+        "created_by": created_by,
+        "created_at": now,
+        "expires_at": now + timedelta(days=expires_in_days),
+        "is_used": False,
+        "used_by": None,
+        "used_at": None
+    }
+
 class InvitationSystem:
-    def __init__(self):
-        self.client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+    def __init__(self, client: Optional[AsyncIOMotorClient] = None):
+        # Используем общий клиент приложения, если он передан
+        self._owns_client = client is None
+        self.client = client or create_client()
         self.db = self.client.megabodega_db
         self.invitations = self.db.invitations
 
+    def close(self):
+        """Закрывает соединение, если клиент создан этой системой"""
+        if self._owns_client:
+            self.client.close()
+
     async def generate_invitation_code(self, role: str, created_by: str, expires_in_days: int = 30):
         """Генерирует код приглашения для роли courier или staff"""
         if role not in ['courier', 'staff']:
             raise ValueError("Role must be 'courier' or 'staff'")
         
         # Генерируем уникальный код
-        code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+        code = generate_code()
         
         # Проверяем уникальность
         while await self.invitations.find_one({"code": code, "is_used": False}):
-            code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+            code = generate_code()
         
-        invitation = {
-            "code": code,
-            "role": role,
-            "created_by": created_by,
-            "created_at": datetime.utcnow(),
-            "expires_at": datetime.utcnow() + timedelta(days=expires_in_days),
-            "is_used": False,
-            "used_by": None,
-            "used_at": None
-        }
+        invitation = build_invitation(code, role, created_by, expires_in_days)
         
         await self.invitations.insert_one(invitation)
         return code
 
+    async def generate_invitation_codes_bulk(self, role: str, created_by: str, count: int, expires_in_days: int = 30):
+        """Генерирует пакет кодов приглашения одним insert_many.
+
+        Уникальность обеспечивает частичный уникальный индекс по code
+        (см. create_indexes в database.py): при редкой коллизии повторно
+        генерируются и вставляются только конфликтующие коды.
+        """
+        if role not in ['courier', 'staff']:
+            raise ValueError("Role must be 'courier' or 'staff'")
+        
+        pending = [build_invitation(generate_code(), role, created_by, expires_in_days) for _ in range(count)]
+        created = []
+        
+        for _ in range(MAX_BULK_INSERT_ATTEMPTS):
+            try:
+                await self.invitations.insert_many(pending, ordered=False)
+                created.extend(pending)
+                return created
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != DUPLICATE_KEY_ERROR for error in write_errors):
+                    raise
+                
+                collided = {error["index"] for error in write_errors}
+                created.extend(doc for index, doc in enumerate(pending) if index not in collided)
+                pending = [
+                    build_invitation(generate_code(), role, created_by, expires_in_days)
+                    for _ in collided
+                ]
+        
+        raise RuntimeError(f"Could not generate {len(pending)} unique invitation codes")
+
     async def validate_invitation_code(self, code: str, role: str):
         """Проверяет валидность кода приглашения"""
         invitation = await self.invitations.find_one({
@@ -65,6 +125,40 @@ class InvitationSystem:
         )
         return result.modified_count > 0
 
+    async def redeem_invitation_code(self, code: str, role: str, used_by: str):
+        """Атомарно проверяет и помечает код как использованный одним обновлением"""
+        now = datetime.utcnow()
+        result = await self.invitations.update_one(
+            {
+                "code": code,
+                "role": role,
+                "is_used": False,
+                "expires_at": {"$gt": now}
+            },
+            {
+                "$set": {
+                    "is_used": True,
+                    "used_by": used_by,
+                    "used_at": now
+                }
+            }
+        )
+        return result.modified_count > 0
+
+    async def release_invitation_code(self, code: str, used_by: str):
+        """Возвращает код, если регистрация после его использования не удалась"""
+        result = await self.invitations.update_one(
+            {"code": code, "is_used": True, "used_by": used_by},
+            {
+                "$set": {
+                    "is_used": False,
+                    "used_by": None,
+                    "used_at": None
+                }
+            }
+        )
+        return result.modified_count > 0
+
     async def get_invitation_codes(self, created_by: str = None):
         """Получает список кодов приглашений"""
         query = {}
@@ -78,6 +172,55 @@ class InvitationSystem:
         
         return codes
 
+    async def get_invitation_codes_page(
+        self,
+        created_by: str,
+        role: Optional[str] = None,
+        is_used: Optional[bool] = None,
+        expired: Optional[bool] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ):
+        """Получает страницу кодов приглашений (новые сначала) и курсор следующей страницы"""
+        query = {"created_by": created_by, **keyset_filter(cursor)}
+        if role:
+            query["role"] = role
+        if is_used is not None:
+            query["is_used"] = is_used
+        if expired is not None:
+            query["expires_at"] = {"$lte" if expired else "$gt": datetime.utcnow()}
+        
+        codes = await self.invitations.find(query, INVITATION_LIST_PROJECTION) \
+            .sort([("created_at", -1), ("_id", -1)]) \
+            .limit(limit + 1) \
+            .to_list(limit + 1)
+        
+        return codes, next_cursor(codes, limit)
+
+    async def count_invitation_codes(self, created_by: str):
+        """Считает коды приглашений по состоянию на стороне сервера"""
+        now = datetime.utcnow()
+        pipeline = [
+            {"$match": {"created_by": created_by}},
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "used": {"$sum": {"$cond": ["$is_used", 1, 0]}},
+                "expired": {"$sum": {"$cond": [
+                    {"$and": [{"$not": ["$is_used"]}, {"$lte": ["$expires_at", now]}]}, 1, 0
+                ]}}
+            }}
+        ]
+        result = await self.invitations.aggregate(pipeline).to_list(1)
+        counts = result[0] if result else {"total": 0, "used": 0, "expired": 0}
+        
+        return {
+            "total": counts["total"],
+            "used": counts["used"],
+            "expired": counts["expired"],
+            "active": counts["total"] - counts["used"] - counts["expired"]
+        }
+
     async def delete_invitation_code(self, code: str):
         """Удаляет код приглашения"""
         result = await self.invitations.delete_one({"code": code})
@@ -99,20 +242,11 @@ async def initialize_invitation_system():
         for code, role in PRESET_CODES.items():
             existing = await invitation_system.invitations.find_one({"code": code})
             if not existing:
-                invitation = {
-                    "code": code,
-                    "role": role,
-                    "created_by": "system",
-                    "created_at": datetime.utcnow(),
-                    "expires_at": datetime.utcnow() + timedelta(days=365),  # Год действия
-                    "is_used": False,
-                    "used_by": None,
-                    "used_at": None
-                }
+                invitation = build_invitation(code, role, "system", 365)  # Год действия
                 await invitation_system.invitations.insert_one(invitation)
                 print(f"Created invitation code: {code} for role: {role}")
         
-        invitation_system.client.close()
+        invitation_system.close()
         print("Invitation system initialized successfully")
         
     except Exception as e:
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_DEAD = "dead"  # Exhausted its retries; kept for inspection and manual requeue
+
+JobHandler = Callable[[object, Dict], Awaitable[None]]
+
+class JobQueue:
+    """Durable job queue stored in a Mongo collection.
+
+    Workers claim jobs with find_one_and_update and hold them under a lease
+    that is renewed while the job runs; a job whose worker dies is picked up
+    again once the lease expires.
+    Failed jobs are retried with exponential backoff and dead-lettered after
+    max_attempts, as are jobs whose lease expires on their last attempt.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "jobs",
+        lease_seconds: int = 60,
+        max_attempts: int = 5,
+        base_backoff_seconds: float = 5,
+        max_backoff_seconds: float = 600
+    ):
+        self.collection_name = collection_name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._wakeup = asyncio.Event()
+
+    def _collection(self, db):
+        return db[self.collection_name]
+
+    def backoff(self, attempts: int) -> timedelta:
+        """Delay before retrying a job that has failed `attempts` times"""
+        seconds = min(self.base_backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+        return timedelta(seconds=seconds)
+
+    async def enqueue(self, db, job_type: str, payload: Dict, dedupe_key: Optional[str] = None) -> bool:
+        """Enqueue a job, returning False if a job with the same dedupe_key exists"""
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "run_at": now,
+            "created_at": now,
+            "updated_at": now
+        }
+        if dedupe_key:
+            job["dedupe_key"] = dedupe_key
+
+        try:
+            await self._collection(db).insert_one(job)
+        except DuplicateKeyError:
+            return False
+
+        self._wakeup.set()
+        return True
+
+    async def claim(self, db, worker_id: str) -> Optional[Dict]:
+        """Lease the next runnable job, or a job whose lease has expired with attempts left"""
+        now = datetime.utcnow()
+        return await self._collection(db).find_one_and_update(
+            {"$or": [
+                {"status": JOB_QUEUED, "run_at": {"$lte": now}},
+                {"status": JOB_RUNNING, "lease_expires_at": {"$lte": now}, "attempts": {"$lt": self.max_attempts}}
+            ]},
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "worker_id": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew_lease(self, db, job: Dict) -> bool:
+        """Extend a running job's lease, returning False if this worker no longer holds it"""
+        now = datetime.utcnow()
+        result = await self._collection(db).update_one(
+            {"id": job["id"], "worker_id": job["worker_id"], "status": JOB_RUNNING},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+        )
+        return result.modified_count == 1
+
+    async def complete(self, db, job: Dict) -> None:
+        """Mark a leased job as done"""
+        now = datetime.utcnow()
+        await self._collection(db).update_one(
+            {"id": job["id"], "worker_id": job["worker_id"], "status": JOB_RUNNING},
+            {"$set": {"status": JOB_DONE, "finished_at": now, "updated_at": now}}
+        )
+
+    async def fail(self, db, job: Dict, error: str) -> None:
+        """Schedule a retry with backoff, or dead-letter the job after max_attempts"""
+        now = datetime.utcnow()
+        if job["attempts"] >= self.max_attempts:
+            update = {"status": JOB_DEAD, "last_error": error, "updated_at": now}
+            logger.error(f"Job {job['id']} ({job['type']}) dead-lettered after {job['attempts']} attempts: {error}")
+        else:
+            update = {
+                "status": JOB_QUEUED,
+                "run_at": now + self.backoff(job["attempts"]),
+                "last_error": error,
+                "updated_at": now
+            }
+
+        await self._collection(db).update_one(
+            {"id": job["id"], "worker_id": job["worker_id"], "status": JOB_RUNNING},
+            {"$set": update}
+        )
+
+    async def dead_letter_expired(self, db) -> int:
+        """Dead-letter jobs whose lease expired on their last attempt, e.g. because they crashed the worker"""
+        now = datetime.utcnow()
+        result = await self._collection(db).update_many(
+            {"status": JOB_RUNNING, "lease_expires_at": {"$lte": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": JOB_DEAD, "last_error": "Lease expired on the last attempt", "updated_at": now}}
+        )
+        if result.modified_count:
+            logger.error(f"Dead-lettered {result.modified_count} jobs whose lease expired after {self.max_attempts} attempts")
+        return result.modified_count
+
+    async def wait_for_jobs(self, timeout: float) -> None:
+        """Sleep until a job is enqueued in this process or the timeout elapses"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+class JobWorkerPool:
+    """Pool of asyncio workers draining a JobQueue"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, JobHandler],
+        concurrency: int = 4,
+        poll_interval: float = 1.0
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def start(self, db) -> None:
+        """Start the worker tasks"""
+        self._stopping = False
+        prefix = uuid.uuid4().hex[:8]
+        self._tasks = [
+            asyncio.create_task(self._run(db, f"{prefix}-{index}"))
+            for index in range(self.concurrency)
+        ]
+        logger.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs in flight are retried after their lease expires"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, db, worker_id: str) -> None:
+        while not self._stopping:
+            try:
+                job = await self.queue.claim(db, worker_id)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed to claim a job: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if job is None:
+                try:
+                    await self.queue.dead_letter_expired(db)
+                except Exception as e:
+                    logger.error(f"Job worker {worker_id} failed to dead-letter expired jobs: {str(e)}")
+                await self.queue.wait_for_jobs(self.poll_interval)
+                continue
+
+            await self._process(db, job)
+
+    async def _heartbeat(self, db, job: Dict) -> None:
+        """Renew the job's lease at a third of its length while the handler runs"""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                if not await self.queue.renew_lease(db, job):
+                    logger.warning(f"Job {job['id']} ({job['type']}) lost its lease")
+                    return
+            except Exception as e:
+                logger.error(f"Failed to renew lease of job {job['id']}: {str(e)}")
+
+    async def _process(self, db, job: Dict) -> None:
+        handler = self.handlers.get(job["type"])
+        heartbeat = asyncio.create_task(self._heartbeat(db, job))
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job type {job['type']}")
+            await handler(db, job["payload"])
+        except Exception as e:
+            logger.exception(f"Job {job['id']} ({job['type']}) failed")
+            await self.queue.fail(db, job, str(e))
+        else:
+            await self.queue.complete(db, job)
+        finally:
+            heartbeat.cancel()
+
+# Shared queue for post-payment fulfillment work
+job_queue = JobQueue()
@@ -0,0 +1,142 @@
+import os
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+from pymongo.monitoring import CommandListener
+from starlette.routing import Match
+from mongo_client import add_event_listener, pool_metrics
+
+# Latency buckets (seconds) for HTTP requests and Mongo commands
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+
+# Label for requests that matched no route, so unknown paths cannot blow up label cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+# Route template of the request being handled, for code that runs on its behalf
+current_route: ContextVar[str] = ContextVar("current_route", default="")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status",
+    ["method", "route", "status"], buckets=REQUEST_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled",
+    ["method", "route"], multiprocess_mode="livesum"
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by command, collection and outcome",
+    ["command", "collection", "outcome"], buckets=MONGO_BUCKETS
+)
+
+class MongoCommandMetrics(CommandListener):
+    """Records the duration of every MongoDB command in a histogram"""
+
+    def __init__(self):
+        # (connection, request id) -> collection, until the command finishes
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_LATENCY.labels(event.command_name, collection, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._observe(event, "success")
+
+    def failed(self, event):
+        self._observe(event, "failure")
+
+class MongoPoolCollector:
+    """Exports connection pool state from mongo_client.pool_metrics at scrape time"""
+
+    def collect(self):
+        gauges = {
+            "open_connections": GaugeMetricFamily("mongo_pool_open_connections", "Open pooled connections", labels=["server"]),
+            "checked_out": GaugeMetricFamily("mongo_pool_checked_out_connections", "Connections checked out of the pool", labels=["server"]),
+            "waiting": GaugeMetricFamily("mongo_pool_waiting_checkouts", "Checkouts waiting for a connection", labels=["server"]),
+            "saturation": GaugeMetricFamily("mongo_pool_saturation_ratio", "Checked-out connections over max pool size", labels=["server"]),
+            "wait_ms_avg": GaugeMetricFamily("mongo_pool_checkout_wait_avg_ms", "Average connection checkout wait", labels=["server"]),
+            "wait_ms_max": GaugeMetricFamily("mongo_pool_checkout_wait_max_ms", "Longest connection checkout wait", labels=["server"]),
+        }
+        for server, pool in pool_metrics.snapshot().items():
+            for field, gauge in gauges.items():
+                gauge.add_metric([server], pool[field] or 0)
+        return list(gauges.values())
+
+command_metrics = MongoCommandMetrics()
+add_event_listener(command_metrics)
+
+# Per-worker multiprocess files only hold counters and histograms, so pool state
+# is exported from the single-process registry only
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    REGISTRY.register(MongoPoolCollector())
+
+def metrics_response_body() -> Tuple[bytes, str]:
+    """Current metrics in Prometheus text format, merged across workers in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+@lru_cache(maxsize=4096)
+def route_template(app, method: str, path: str) -> str:
+    """Path template of the route serving method and path, e.g. /api/orders/{order_id}"""
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+class PrometheusMiddleware:
+    """ASGI middleware timing every HTTP request by route template and status.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streaming responses are not
+    buffered; server-sent event streams are counted in flight but not timed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope["app"], method, scope["path"])
+        route_token = current_route.set(f"{method} {route}")
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_route.reset(route_token)
+            in_flight.dec()
+            if not streaming:
+                REQUEST_LATENCY.labels(method, route, str(status_code)).observe(time.perf_counter() - started)
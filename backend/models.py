@@ -131,6 +131,8 @@ class Address(BaseModel):
     postal_code: str
     is_default: bool = False
     delivery_instructions: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class AddressCreate(BaseModel):
@@ -142,6 +144,8 @@ class AddressCreate(BaseModel):
     postal_code: str
     is_default: bool = False
     delivery_instructions: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 # Cart Models
 class CartItem(BaseModel):
@@ -152,11 +156,21 @@ class CartItem(BaseModel):
 class Cart(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    store_id: str
+    store_id: Optional[str] = None  # Set by the first item; one store per cart
     items: List[CartItem] = []
+    version: int = 0  # Incremented on every change, for optimistic concurrency
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class CartItemAdd(BaseModel):
+    product_id: str
+    quantity: int = Field(1, gt=0)
+    expected_version: Optional[int] = None
+
+class CartItemUpdate(BaseModel):
+    quantity: int = Field(..., ge=0)  # 0 removes the item
+    expected_version: Optional[int] = None
+
 # Order Models
 class OrderItem(BaseModel):
     product_id: str
@@ -165,6 +179,12 @@ class OrderItem(BaseModel):
     unit_price: float
     total_price: float
 
+class OrderStatusChange(BaseModel):
+    status: OrderStatus
+    at: datetime
+    by: str  # User id of whoever made the change
+    note: Optional[str] = None
+
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -184,21 +204,62 @@ class Order(BaseModel):
     # Timestamps
     created_at: datetime = Field(default_factory=datetime.utcnow)
     confirmed_at: Optional[datetime] = None
+    preparing_at: Optional[datetime] = None
+    ready_at: Optional[datetime] = None
+    picked_up_at: Optional[datetime] = None
     delivered_at: Optional[datetime] = None
+    cancelled_at: Optional[datetime] = None
+    status_history: List[OrderStatusChange] = []
     
     # Assignment
+    delivery_zone: Optional[str] = None
     delivery_driver_id: Optional[str] = None
+    assigned_at: Optional[datetime] = None
     estimated_delivery_time: Optional[datetime] = None
     
     # Notes
     customer_notes: Optional[str] = None
     internal_notes: Optional[str] = None
 
+class OrderItemCreate(BaseModel):
+    product_id: str
+    quantity: int = Field(..., gt=0)
+
 class OrderCreate(BaseModel):
+    items: List[OrderItemCreate] = Field(..., min_length=1)  # Priced server-side
+    delivery_address_id: Optional[str] = None  # Saved address, or
+    delivery_address: Optional[AddressCreate] = None  # an address given inline
+    delivery_zone: Optional[str] = None  # One of the delivery area ids; resolved from address coordinates when given
+    customer_notes: Optional[str] = None
+
+class OrderStatusUpdate(BaseModel):
+    status: OrderStatus
+    note: Optional[str] = None
+
+class OrderStatusBulkUpdate(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1, max_length=500)
+    status: OrderStatus
+    note: Optional[str] = None
+
+class OrderStatusBulkResult(BaseModel):
+    updated: List[str]
+    skipped: List[str]  # Missing, outside the caller's store or not in a state that allows the move
+
+class OrderSummary(BaseModel):
+    """Order fields for history lists, without the embedded address and notes"""
+    id: str
+    user_id: str
     store_id: str
     items: List[OrderItem]
-    delivery_address_id: str
-    customer_notes: Optional[str] = None
+    status: OrderStatus
+    payment_status: PaymentStatus
+    total_amount: float
+    created_at: datetime
+    delivered_at: Optional[datetime] = None
+
+class OrderSummaryPage(BaseModel):
+    items: List[OrderSummary]
+    next_cursor: Optional[str] = None
 
 # Payment Models
 class PaymentTransaction(BaseModel):
@@ -224,6 +285,7 @@ class Notification(BaseModel):
     data: Dict[str, Any] = {}  # Extra data like order_id
     is_read: bool = False
     sent_at: datetime = Field(default_factory=datetime.utcnow)
+    read_at: Optional[datetime] = None  # Read notifications expire after a while
 
 class NotificationCreate(BaseModel):
     title: str
@@ -231,6 +293,16 @@ class NotificationCreate(BaseModel):
     notification_type: str
     data: Dict[str, Any] = {}
 
+class NotificationBroadcast(NotificationCreate):
+    role: UserRole
+
+class NotificationMarkRead(BaseModel):
+    notification_ids: Optional[List[str]] = Field(None, max_length=500)  # None marks all as read
+
+class NotificationPage(BaseModel):
+    items: List[Notification]
+    next_cursor: Optional[str] = None
+
 # API Response Models
 class AuthResponse(BaseModel):
     user: User
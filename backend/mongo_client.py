@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+load_dotenv()
+
+# Connection pool size per client (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+# Milliseconds a request may wait for a free pooled connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# Wire compressors in order of preference (add snappy if python-snappy is installed);
+# ones the server does not support are skipped
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,zlib")
+
+# Read preference for catalog reads (stores, categories, products)
+CATALOG_READ_PREFERENCE = os.getenv("CATALOG_READ_PREFERENCE", "secondaryPreferred")
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Upper bounds (ms) of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+class PoolMetrics(ConnectionPoolListener):
+    """Connection pool event listener tracking checkout waits and pool saturation.
+
+    pymongo calls these hooks on the thread doing the checkout, so the start
+    of each checkout is kept in a thread-local until it completes or fails.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.max_pool_size: Dict[str, int] = {}
+        self.open_connections: Dict[str, int] = defaultdict(int)
+        self.checked_out: Dict[str, int] = defaultdict(int)
+        self.waiting: Dict[str, int] = defaultdict(int)
+        self.checkouts: Dict[str, int] = defaultdict(int)
+        self.failed_checkouts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.wait_seconds_total: Dict[str, float] = defaultdict(float)
+        self.wait_seconds_max: Dict[str, float] = defaultdict(float)
+        self.wait_buckets: Dict[str, list] = defaultdict(lambda: [0] * (len(WAIT_BUCKETS_MS) + 1))
+
+    @staticmethod
+    def _key(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def _finish_wait(self, key: str) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        self.waiting[key] -= 1
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        with self._lock:
+            self.max_pool_size[self._key(event)] = event.options.get("maxPoolSize", MONGO_MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections[self._key(event)] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections[self._key(event)] -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting[self._key(event)] += 1
+
+    def connection_check_out_failed(self, event):
+        key = self._key(event)
+        with self._lock:
+            self._finish_wait(key)
+            self.failed_checkouts[key][str(event.reason)] += 1
+
+    def connection_checked_out(self, event):
+        key = self._key(event)
+        with self._lock:
+            waited = self._finish_wait(key)
+            self.checked_out[key] += 1
+            self.checkouts[key] += 1
+            self.wait_seconds_total[key] += waited
+            self.wait_seconds_max[key] = max(self.wait_seconds_max[key], waited)
+            waited_ms = waited * 1000
+            bucket = next((index for index, bound in enumerate(WAIT_BUCKETS_MS) if waited_ms <= bound), len(WAIT_BUCKETS_MS))
+            self.wait_buckets[key][bucket] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out[self._key(event)] -= 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Current pool state and checkout wait statistics per server"""
+        with self._lock:
+            pools = {}
+            for key in set(self.max_pool_size) | set(self.checkouts) | set(self.open_connections):
+                max_size = self.max_pool_size.get(key, MONGO_MAX_POOL_SIZE)
+                checkouts = self.checkouts[key]
+                pools[key] = {
+                    "max_pool_size": max_size,
+                    "open_connections": self.open_connections[key],
+                    "checked_out": self.checked_out[key],
+                    "waiting": self.waiting[key],
+                    "saturation": round(self.checked_out[key] / max_size, 3) if max_size else None,
+                    "checkouts": checkouts,
+                    "failed_checkouts": dict(self.failed_checkouts[key]),
+                    "wait_ms_avg": round(self.wait_seconds_total[key] / checkouts * 1000, 3) if checkouts else 0.0,
+                    "wait_ms_max": round(self.wait_seconds_max[key] * 1000, 3),
+                    "wait_ms_buckets": dict(zip([*map(str, WAIT_BUCKETS_MS), "inf"], self.wait_buckets[key])),
+                }
+            return pools
+
+# Shared by every client this process creates
+pool_metrics = PoolMetrics()
+
+# Monitoring listeners attached to clients created after they are added
+EVENT_LISTENERS = [pool_metrics]
+
+def add_event_listener(listener) -> None:
+    """Attach a pymongo monitoring listener to every client created from now on"""
+    if listener not in EVENT_LISTENERS:
+        EVENT_LISTENERS.append(listener)
+
+def create_client(mongo_url: str = None, **overrides) -> AsyncIOMotorClient:
+    """Create a Motor client with the configured pool, compression and monitoring listeners"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "compressors": MONGO_COMPRESSORS,
+        "event_listeners": list(EVENT_LISTENERS),
+        **overrides
+    }
+    return AsyncIOMotorClient(mongo_url or os.getenv("MONGO_URL"), **options)
+
+def catalog_read_preference():
+    """Read preference used for catalog reads"""
+    return READ_PREFERENCES.get(CATALOG_READ_PREFERENCE, ReadPreference.SECONDARY_PREFERRED)
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import Optional
+from auth import get_current_active_user, get_staff_user
+from database import get_database
+from models import NotificationBroadcast, NotificationMarkRead, NotificationPage
+from notification_service import notification_service
+from request_tracing import TracedRoute
+import logging
+
+logger = logging.getLogger(__name__)
+
+notification_router = APIRouter(prefix="/api/notifications", tags=["notifications"], route_class=TracedRoute)
+
+@notification_router.get("", response_model=NotificationPage)
+async def get_notifications(
+    unread_only: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Get a page of the current user's notifications, newest first"""
+    try:
+        return await notification_service.get_page(db, current_user["id"], unread_only, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@notification_router.get("/unread-count")
+async def get_unread_count(
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Get the current user's unread notification count"""
+    return {"unread": await notification_service.unread_count(db, current_user["id"])}
+
+@notification_router.post("/read")
+async def mark_notifications_read(
+    request: NotificationMarkRead,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Mark the given notifications, or all of them, as read"""
+    updated = await notification_service.mark_read(db, current_user["id"], request.notification_ids)
+    return {"updated": updated}
+
+@notification_router.post("/broadcast")
+async def broadcast_notification(
+    broadcast: NotificationBroadcast,
+    current_user: dict = Depends(get_staff_user),
+    db = Depends(get_database)
+):
+    """Send a notification to every active user with a role (Staff only)"""
+    recipients = await notification_service.notify_role(
+        db, broadcast.role, broadcast.title, broadcast.message, broadcast.notification_type, broadcast.data
+    )
+    logger.info(f"User {current_user['id']} broadcast {broadcast.notification_type} to {recipients} {broadcast.role.value} users")
+    return {"recipients": recipients}
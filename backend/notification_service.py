@@ -0,0 +1,208 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import Notification, OrderStatus, UserRole
+from order_events import order_events, ALL_ORDERS_TOPIC
+from pagination import keyset_filter, next_cursor
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+# What customers are told when their order reaches a status
+ORDER_STATUS_MESSAGES = {
+    OrderStatus.CONFIRMED.value: ("Pedido confirmado", "La tienda confirmó tu pedido"),
+    OrderStatus.PREPARING.value: ("Preparando tu pedido", "La tienda está preparando tu pedido"),
+    OrderStatus.OUT_FOR_DELIVERY.value: ("Pedido en camino", "Tu pedido salió para entrega"),
+    OrderStatus.DELIVERED.value: ("Pedido entregado", "¡Buen provecho!"),
+    OrderStatus.CANCELLED.value: ("Pedido cancelado", "Tu pedido fue cancelado"),
+}
+
+class NotificationService:
+    """Buffered notification writer with per-user unread counters.
+
+    notify() only queues a notification; a background flush writes the queue
+    with one insert_many and bumps each recipient's counter in
+    notification_counters with one bulk_write. Unread counts are read from
+    that counter document, and mark-read decrements it by the number of
+    notifications it actually changed.
+
+    Only notifications that failed to insert are re-queued (a unique index on
+    id turns a retried insert into a no-op), and counter bumps that failed are
+    kept and retried with the next flush.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, max_batch_size: int = 1000):
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._pending: List[Notification] = []
+        # Unread counter increments for stored notifications not yet applied
+        self._pending_counts: Counter = Counter()
+        self._batch_full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._events_task: Optional[asyncio.Task] = None
+
+    def notify(self, user_id: str, title: str, message: str, notification_type: str, data: Optional[Dict] = None) -> None:
+        """Queue a notification for one user"""
+        self._pending.append(Notification(
+            user_id=user_id, title=title, message=message,
+            notification_type=notification_type, data=data or {}
+        ))
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+
+    async def notify_role(self, db, role: UserRole, title: str, message: str, notification_type: str, data: Optional[Dict] = None) -> int:
+        """Queue a notification for every active user with a role, returning how many were queued"""
+        recipients = 0
+        async for user in db.users.find({"role": role.value, "is_active": True}, {"id": 1}):
+            self.notify(user["id"], title, message, notification_type, data)
+            recipients += 1
+        return recipients
+
+    async def flush(self, db) -> int:
+        """Write queued notifications and bump unread counters, returning how many were written"""
+        written = 0
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            failed = []
+            try:
+                await db.notifications.insert_many([notification.dict() for notification in batch], ordered=False)
+            except BulkWriteError as e:
+                # Duplicate ids were stored by an earlier attempt; retry only the rest
+                failed = [
+                    batch[error["index"]] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                ]
+            except Exception:
+                self._pending[:0] = batch
+                raise
+
+            if failed:
+                self._pending[:0] = failed
+                failed_ids = {notification.id for notification in failed}
+                batch = [notification for notification in batch if notification.id not in failed_ids]
+            self._pending_counts.update(notification.user_id for notification in batch)
+            written += len(batch)
+            if failed:
+                logger.warning(f"{len(failed)} notifications failed to insert and will be retried")
+                break
+
+        await self._flush_counters(db)
+        return written
+
+    async def _flush_counters(self, db) -> None:
+        """Apply pending unread counter increments, keeping the ones that failed"""
+        if not self._pending_counts:
+            return
+        counts, self._pending_counts = self._pending_counts, Counter()
+        user_ids = list(counts)
+        try:
+            await db.notification_counters.bulk_write(
+                [UpdateOne({"_id": user_id}, {"$inc": {"unread": counts[user_id]}}, upsert=True) for user_id in user_ids],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                user_id = user_ids[error["index"]]
+                self._pending_counts[user_id] += counts[user_id]
+            raise
+        except Exception:
+            self._pending_counts.update(counts)
+            raise
+
+    async def unread_count(self, db, user_id: str) -> int:
+        """Unread notifications for a user, from the counter document"""
+        counter = await db.notification_counters.find_one({"_id": user_id})
+        # A mark-read can land between a flush's insert and its counter bump
+        return max(counter["unread"], 0) if counter else 0
+
+    async def get_page(self, db, user_id: str, unread_only: bool, limit: int, cursor: Optional[str]) -> Dict:
+        """One keyset page of a user's notifications, newest first"""
+        query = {"user_id": user_id, **keyset_filter(cursor, field="sent_at")}
+        if unread_only:
+            query["is_read"] = False
+        notifications = await db.notifications.find(query) \
+            .sort([("sent_at", -1), ("_id", -1)]) \
+            .limit(limit + 1) \
+            .to_list(limit + 1)
+        return {"items": notifications, "next_cursor": next_cursor(notifications, limit, field="sent_at")}
+
+    async def mark_read(self, db, user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+        """Mark some or all of a user's notifications as read, returning how many changed"""
+        query = {"user_id": user_id, "is_read": False}
+        if notification_ids is not None:
+            query["id"] = {"$in": notification_ids}
+        result = await db.notifications.update_many(
+            query, {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            await db.notification_counters.update_one(
+                {"_id": user_id}, {"$inc": {"unread": -result.modified_count}}
+            )
+        return result.modified_count
+
+    async def recount(self, db, user_id: str) -> int:
+        """Reset a user's counter from the notifications themselves"""
+        unread = await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+        await db.notification_counters.update_one({"_id": user_id}, {"$set": {"unread": unread}}, upsert=True)
+        return unread
+
+    def _notify_order_event(self, event: Dict) -> None:
+        if event["type"] == "order.assigned":
+            self.notify(
+                event["courier_id"], "Nuevo pedido asignado", "Tienes un pedido listo para recoger",
+                "order_assigned", {"order_id": event["order_id"]}
+            )
+        elif event["type"] == "order.status_changed" and event.get("status") in ORDER_STATUS_MESSAGES:
+            user_topic = next((topic for topic in event["topics"] if topic.startswith("user:")), None)
+            if user_topic:
+                title, message = ORDER_STATUS_MESSAGES[event["status"]]
+                self.notify(
+                    user_topic[len("user:"):], title, message,
+                    f"order_{event['status']}", {"order_id": event["order_id"]}
+                )
+
+    def start(self, db) -> None:
+        """Start the periodic flush and order event fan-out"""
+        self._task = asyncio.create_task(self._run(db))
+        self._events_task = asyncio.create_task(self._follow_orders())
+
+    async def stop(self, db) -> None:
+        """Stop background work and write any queued notifications"""
+        for task in (self._events_task, self._task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(task for task in (self._events_task, self._task) if task), return_exceptions=True)
+        self._task = self._events_task = None
+        await self.flush(db)
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            try:
+                await self.flush(db)
+            except Exception as e:
+                logger.error(f"Notification flush failed: {str(e)}")
+
+    async def _follow_orders(self) -> None:
+        queue = order_events.subscribe([ALL_ORDERS_TOPIC])
+        try:
+            while True:
+                event = await queue.get()
+                # Events bridged from other workers are notified by the worker that published them
+                if event.get("origin") == order_events.worker_id:
+                    self._notify_order_event(event)
+        finally:
+            order_events.unsubscribe(queue, [ALL_ORDERS_TOPIC])
+
+# Shared notification service for this process
+notification_service = NotificationService()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# Topic every order event is published to, for staff without a store
+ALL_ORDERS_TOPIC = "orders:all"
+
+def order_topics(order: Dict) -> List[str]:
+    """Topics an event about this order is published to"""
+    topics = [ALL_ORDERS_TOPIC, f"user:{order['user_id']}", f"store:{order['store_id']}"]
+    if order.get("delivery_driver_id"):
+        topics.append(f"courier:{order['delivery_driver_id']}")
+    if order.get("delivery_zone"):
+        topics.append(f"zone:{order['delivery_zone']}")
+    return topics
+
+class OrderEventBus:
+    """In-process pub/sub for order events, bridged between workers.
+
+    Events are delivered to local subscribers immediately and appended to a
+    capped collection; each worker tails that collection and re-publishes
+    events that originated in other workers to its own subscribers.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "order_events",
+        capped_size_bytes: int = 16 * 1024 * 1024,
+        queue_size: int = 100
+    ):
+        self.collection_name = collection_name
+        self.capped_size_bytes = capped_size_bytes
+        self.queue_size = queue_size
+        self.worker_id = uuid.uuid4().hex
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, topics: Iterable[str]) -> asyncio.Queue:
+        """Register a subscriber queue for the given topics"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        for topic in topics:
+            self._subscribers[topic].add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, topics: Iterable[str]) -> None:
+        """Remove a subscriber queue"""
+        for topic in topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def _deliver(self, event: Dict) -> None:
+        # A queue subscribed to several matching topics gets the event once
+        queues = set()
+        for topic in event["topics"]:
+            queues.update(self._subscribers.get(topic, ()))
+
+        for queue in queues:
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than block publishers
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def publish(self, db, event_type: str, order: Dict, **fields) -> None:
+        """Publish an event about an order to local and remote subscribers"""
+        event = {
+            "type": event_type,
+            "order_id": order["id"],
+            "status": order.get("status"),
+            "topics": order_topics(order),
+            "at": datetime.utcnow(),
+            "origin": self.worker_id,
+            **fields
+        }
+        self._deliver(event)
+
+        try:
+            await db[self.collection_name].insert_one(dict(event))
+        except Exception as e:
+            logger.error(f"Failed to bridge order event {event_type} for {order['id']}: {str(e)}")
+
+    async def _ensure_collection(self, db) -> None:
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.capped_size_bytes)
+        except CollectionInvalid:
+            pass  # Already exists
+
+    def start(self, db) -> None:
+        """Start tailing events published by other workers"""
+        self._task = asyncio.create_task(self._tail(db))
+
+    async def stop(self) -> None:
+        """Stop tailing"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _tail(self, db) -> None:
+        await self._ensure_collection(db)
+        collection = db[self.collection_name]
+
+        # Only bridge events published from now on
+        latest = await collection.find_one({}, sort=[("$natural", -1)])
+        last_id = latest["_id"] if latest else None
+
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                async for event in cursor:
+                    last_id = event["_id"]
+                    if event.get("origin") != self.worker_id:
+                        self._deliver(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Order event tail failed: {str(e)}")
+            # Tailable cursors die when the collection is empty or rolls over
+            await asyncio.sleep(1)
+
+# Shared event bus for this process
+order_events = OrderEventBus()
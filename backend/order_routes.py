@@ -0,0 +1,317 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Optional
+import asyncio
+import json
+from auth import get_current_active_user, get_courier_user, get_customer_user, get_staff_user, staff_store_scope
+from database import get_database
+from models import (
+    Order, OrderCreate, OrderStatus, OrderStatusBulkResult, OrderStatusBulkUpdate,
+    OrderStatusUpdate, OrderSummary, OrderSummaryPage, UserRole
+)
+from order_service import place_order
+from order_state import transition_order_status, transition_orders_bulk
+from cart_service import cart_store
+from order_events import order_events, ALL_ORDERS_TOPIC
+from dispatch import dispatcher
+from delivery_zones import resolve_delivery_zone
+from pagination import keyset_filter, next_cursor
+from analytics import record_order_created
+from request_tracing import TracedRoute
+import logging
+
+logger = logging.getLogger(__name__)
+
+order_router = APIRouter(prefix="/api/orders", tags=["orders"], route_class=TracedRoute)
+
+# Seconds between SSE keep-alive comments on an idle stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Only the fields of OrderSummary, leaving out the embedded address and notes
+ORDER_SUMMARY_PROJECTION = {field: 1 for field in OrderSummary.model_fields}
+
+async def find_order_page(db, query: dict, limit: int, cursor: Optional[str]) -> dict:
+    """Fetch one keyset page of order summaries, newest first"""
+    try:
+        query = {**query, **keyset_filter(cursor)}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    orders = await db.orders.find(query, ORDER_SUMMARY_PROJECTION) \
+        .sort([("created_at", -1), ("_id", -1)]) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+    
+    return {"items": orders, "next_cursor": next_cursor(orders, limit)}
+
+@order_router.post("", response_model=Order)
+async def create_order(
+    order_data: OrderCreate,
+    current_user: dict = Depends(get_customer_user),
+    db = Depends(get_database)
+):
+    """Place an order for the current customer"""
+    order = await place_order(db, current_user, order_data)
+    cart_store.discard(current_user["id"])  # Checkout emptied the stored cart
+    await order_events.publish(db, "order.created", order.dict())
+    await record_order_created(db, order.dict())
+    logger.info(f"Order {order.id} placed by user {current_user['id']} for ${order.total_amount}")
+    return order
+
+@order_router.get("", response_model=OrderSummaryPage)
+async def get_orders(
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_staff_user),
+    db = Depends(get_database)
+):
+    """Get a page of orders for the staff member's store, newest first (Staff only)
+
+    store_id is only honoured for store admins not tied to a store.
+    """
+    query = {}
+    store_id = staff_store_scope(current_user, store_id)
+    if store_id:
+        query["store_id"] = store_id
+    if order_status:
+        query["status"] = order_status.value
+    if date_from or date_to:
+        query["created_at"] = {}
+        if date_from:
+            query["created_at"]["$gte"] = date_from
+        if date_to:
+            query["created_at"]["$lt"] = date_to
+    
+    return await find_order_page(db, query, limit, cursor)
+
+@order_router.get("/me", response_model=List[Order])
+async def get_my_orders(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Get the current user's most recent orders, newest first"""
+    orders = await db.orders.find({"user_id": current_user["id"]}) \
+        .sort([("created_at", -1), ("_id", -1)]) \
+        .limit(limit) \
+        .to_list(limit)
+    return [Order(**order) for order in orders]
+
+@order_router.get("/me/page", response_model=OrderSummaryPage)
+async def get_my_orders_page(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Get a page of the current user's order summaries, newest first"""
+    return await find_order_page(db, {"user_id": current_user["id"]}, limit, cursor)
+
+def subscription_topics(user: dict) -> List[str]:
+    """Order event topics a user receives"""
+    role = user.get("role")
+    if role in (UserRole.COURIER.value, UserRole.DELIVERY.value):
+        topics = [f"courier:{user['id']}"]
+        if user.get("delivery_zone"):
+            topics.append(f"zone:{user['delivery_zone']}")
+        return topics
+    if role in (UserRole.STAFF.value, UserRole.STORE_ADMIN.value):
+        return [f"store:{user['store_id']}"] if user.get("store_id") else [ALL_ORDERS_TOPIC]
+    return [f"user:{user['id']}"]
+
+async def order_event_stream(request: Request, topics: List[str]):
+    """Yield order events for the topics as server-sent events"""
+    queue = order_events.subscribe(topics)
+    try:
+        yield "retry: 5000\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            
+            payload = {
+                "order_id": event["order_id"],
+                "status": event.get("status"),
+                "at": event["at"].isoformat()
+            }
+            yield f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+    finally:
+        order_events.unsubscribe(queue, topics)
+
+@order_router.get("/stream")
+async def stream_order_events(
+    request: Request,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Push order status changes relevant to the current user (Server-Sent Events)"""
+    return StreamingResponse(
+        order_event_stream(request, subscription_topics(current_user)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def courier_at(courier: dict, latitude: Optional[float], longitude: Optional[float]) -> dict:
+    """The courier with the zone of their current coordinates in place of their home zone"""
+    if latitude is not None and longitude is not None:
+        current_zone = resolve_delivery_zone(latitude, longitude)
+        if current_zone:
+            return {**courier, "delivery_zone": current_zone}
+    return courier
+
+@order_router.get("/available", response_model=List[Order])
+async def get_available_orders(
+    limit: int = Query(20, ge=1, le=100),
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    current_user: dict = Depends(get_courier_user),
+    db = Depends(get_database)
+):
+    """Get ready orders the courier can accept, oldest first (Couriers only)
+
+    With the courier's current coordinates, orders come from the zone they are in
+    rather than their home zone.
+    """
+    current_user = courier_at(current_user, latitude, longitude)
+    order_ids = dispatcher.available_orders(current_user, limit)
+    orders = await db.orders.find(
+        {"id": {"$in": order_ids}, "status": OrderStatus.READY.value, "delivery_driver_id": None}
+    ).to_list(limit)
+    position = {order_id: index for index, order_id in enumerate(order_ids)}
+    orders.sort(key=lambda order: position[order["id"]])
+    return [Order(**order) for order in orders]
+
+@order_router.post("/available", response_model=List[Order])
+async def request_orders(
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    current_user: dict = Depends(get_courier_user),
+    db = Depends(get_database)
+):
+    """Join the dispatch line for the courier's zone and get the orders assigned to them (Couriers only)
+
+    Orders that become ready later are assigned while the courier stays in line
+    and arrive as order.assigned events.
+    """
+    if not await dispatcher.has_capacity(db, current_user["id"]):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="You already have the maximum number of active orders"
+        )
+    dispatcher.courier_available(courier_at(current_user, latitude, longitude))
+    # Shared record of who is waiting, for workers other than this one (ETA estimates)
+    await db.users.update_one({"id": current_user["id"]}, {"$set": {"available_at": datetime.utcnow()}})
+    await dispatcher.dispatch(db)
+    orders = await db.orders.find(
+        {"delivery_driver_id": current_user["id"], "status": OrderStatus.READY.value}
+    ).sort("assigned_at", 1).to_list(dispatcher.max_active_orders)
+    return [Order(**order) for order in orders]
+
+@order_router.post("/{order_id}/accept", response_model=Order)
+async def accept_order(
+    order_id: str,
+    current_user: dict = Depends(get_courier_user),
+    db = Depends(get_database)
+):
+    """Accept a ready order, along with nearby orders from the same store (Couriers only)"""
+    claimed = await dispatcher.accept(db, order_id, current_user["id"])
+    if not claimed and not await dispatcher.has_capacity(db, current_user["id"]):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="You already have the maximum number of active orders"
+        )
+    if not claimed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Order is no longer available"
+        )
+    if len(claimed) > 1:
+        logger.info(f"Courier {current_user['id']} accepted {order_id} batched with {len(claimed) - 1} orders")
+    return Order(**claimed[0])
+
+def status_change_scope(user: dict, new_status: OrderStatus) -> dict:
+    """Extra order filter limiting which orders a user may move to new_status"""
+    role = user.get("role")
+    if role in (UserRole.STAFF.value, UserRole.STORE_ADMIN.value):
+        return {"store_id": user["store_id"]} if user.get("store_id") else {}
+    if role in (UserRole.COURIER.value, UserRole.DELIVERY.value) and new_status in (
+        OrderStatus.OUT_FOR_DELIVERY, OrderStatus.DELIVERED
+    ):
+        return {"delivery_driver_id": user["id"]}
+    if role == UserRole.CUSTOMER.value and new_status == OrderStatus.CANCELLED:
+        # Customers can only cancel before the store confirms
+        return {"user_id": user["id"], "status": OrderStatus.PENDING.value}
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"Not allowed to mark orders as {new_status.value}"
+    )
+
+@order_router.post("/status/bulk", response_model=OrderStatusBulkResult)
+async def update_order_status_bulk(
+    update: OrderStatusBulkUpdate,
+    current_user: dict = Depends(get_staff_user),
+    db = Depends(get_database)
+):
+    """Move many orders to a new status at once (Staff only)"""
+    orders, skipped = await transition_orders_bulk(
+        db, update.order_ids, update.status, current_user["id"], update.note,
+        extra_query=status_change_scope(current_user, update.status)
+    )
+    logger.info(f"User {current_user['id']} moved {len(orders)} orders to {update.status.value}, skipped {len(skipped)}")
+    return {"updated": [order["id"] for order in orders], "skipped": skipped}
+
+@order_router.put("/{order_id}/status", response_model=Order)
+async def update_order_status(
+    order_id: str,
+    update: OrderStatusUpdate,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Move an order to a new status, if its current status allows it"""
+    scope = status_change_scope(current_user, update.status)
+    order = await transition_order_status(
+        db, order_id, update.status, current_user["id"], update.note, extra_query=scope
+    )
+    if order is None:
+        scope.pop("status", None)
+        current = await db.orders.find_one({"id": order_id, **scope}, {"status": 1})
+        if not current:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Cannot change order from {current['status']} to {update.status.value}"
+        )
+    
+    logger.info(f"Order {order_id} moved to {update.status.value} by user {current_user['id']}")
+    return Order(**order)
+
+def order_read_scope(user: dict) -> dict:
+    """Extra order filter limiting which orders a user may read"""
+    role = user.get("role")
+    if role in (UserRole.STAFF.value, UserRole.STORE_ADMIN.value):
+        store_id = staff_store_scope(user)
+        return {"store_id": store_id} if store_id else {}
+    if role in (UserRole.COURIER.value, UserRole.DELIVERY.value):
+        return {"delivery_driver_id": user["id"]}
+    return {"user_id": user["id"]}
+
+@order_router.get("/{order_id}", response_model=Order)
+async def get_order(
+    order_id: str,
+    current_user: dict = Depends(get_current_active_user),
+    db = Depends(get_database)
+):
+    """Get order by ID, if it is the user's own, assigned to them as courier or from their store"""
+    order = await db.orders.find_one({"id": order_id, **order_read_scope(current_user)})
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    return Order(**order)
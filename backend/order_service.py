@@ -0,0 +1,117 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict
+from fastapi import HTTPException, status
+from pymongo.errors import OperationFailure
+from models import Address, Order, OrderCreate, OrderItem
+from delivery_zones import DELIVERY_ZONE_IDS, resolve_delivery_zone
+from cart_service import cart_store
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error code for commands the server topology does not support, such as
+# a transaction on a standalone mongod
+ILLEGAL_OPERATION = 20
+
+async def place_order(db, user: dict, order_data: OrderCreate) -> Order:
+    """Price items, reserve stock, write the order and clear the cart in one transaction.
+
+    The transaction is retried by with_transaction on transient errors such as
+    write conflicts between concurrent orders for the same product.
+    Transactions need MongoDB to run as a replica set (a single-node one is
+    enough); on a standalone server orders fail with a 503 saying so.
+    """
+    if order_data.delivery_address_id:
+        address = await db.addresses.find_one({"id": order_data.delivery_address_id, "user_id": user["id"]})
+        if not address:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Delivery address not found")
+        delivery_address = Address(**address)
+    elif order_data.delivery_address:
+        delivery_address = Address(user_id=user["id"], **order_data.delivery_address.dict())
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Delivery address is required")
+    
+    delivery_zone = order_data.delivery_zone
+    if delivery_address.latitude is not None and delivery_address.longitude is not None:
+        delivery_zone = resolve_delivery_zone(delivery_address.latitude, delivery_address.longitude)
+        if delivery_zone is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Delivery address is outside the delivery area")
+    elif delivery_zone and delivery_zone not in DELIVERY_ZONE_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown delivery zone")
+    
+    # Merge repeated lines for the same product
+    quantities: Dict[str, int] = OrderedDict()
+    for item in order_data.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    async def reserve_and_write(session) -> Order:
+        now = datetime.utcnow()
+        items = []
+        store_id = None
+        
+        for product_id, quantity in quantities.items():
+            product = await db.products.find_one_and_update(
+                {"id": product_id, "is_available": True, "stock_quantity": {"$gte": quantity}},
+                {"$inc": {"stock_quantity": -quantity}, "$set": {"updated_at": now}},
+                projection={"name": 1, "price": 1, "store_id": 1},
+                session=session
+            )
+            if not product:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Product {product_id} is unavailable or out of stock"
+                )
+            if store_id is None:
+                store_id = product["store_id"]
+            elif product["store_id"] != store_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="All items in an order must come from the same store"
+                )
+            
+            items.append(OrderItem(
+                product_id=product_id,
+                product_name=product["name"],
+                quantity=quantity,
+                unit_price=product["price"],
+                total_price=round(product["price"] * quantity, 2)
+            ))
+        
+        store = await db.stores.find_one(
+            {"id": store_id}, {"delivery_fee": 1, "min_order_amount": 1}, session=session
+        ) or {}
+        subtotal = round(sum(item.total_price for item in items), 2)
+        if subtotal < store.get("min_order_amount", 0.0):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Minimum order amount is {store['min_order_amount']:.2f}"
+            )
+        delivery_fee = store.get("delivery_fee", 0.0)
+        
+        order = Order(
+            user_id=user["id"],
+            store_id=store_id,
+            items=items,
+            delivery_address=delivery_address,
+            subtotal=subtotal,
+            delivery_fee=delivery_fee,
+            total_amount=round(subtotal + delivery_fee, 2),
+            delivery_zone=delivery_zone,
+            customer_notes=order_data.customer_notes
+        )
+        await db.orders.insert_one(order.dict(), session=session)
+        await cart_store.checkout(db, user["id"], session=session)
+        return order
+    
+    try:
+        async with await db.client.start_session() as session:
+            return await session.with_transaction(reserve_and_write)
+    except OperationFailure as e:
+        if e.code != ILLEGAL_OPERATION or "replica set" not in str(e):
+            raise
+        logger.error(f"Cannot place orders: MongoDB is not a replica set ({str(e)})")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Order placement requires MongoDB to run as a replica set"
+        )
@@ -0,0 +1,138 @@
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from models import OrderStatus
+from order_events import order_events
+from analytics import record_status_changes
+
+# Allowed order status transitions; terminal statuses have no successors
+ORDER_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.PREPARING, OrderStatus.CANCELLED},
+    OrderStatus.PREPARING: {OrderStatus.READY, OrderStatus.CANCELLED},
+    OrderStatus.READY: {OrderStatus.OUT_FOR_DELIVERY, OrderStatus.CANCELLED},
+    OrderStatus.OUT_FOR_DELIVERY: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+
+# Order field stamped when an order enters each status
+STATUS_TIMESTAMP_FIELDS = {
+    OrderStatus.CONFIRMED: "confirmed_at",
+    OrderStatus.PREPARING: "preparing_at",
+    OrderStatus.READY: "ready_at",
+    OrderStatus.OUT_FOR_DELIVERY: "picked_up_at",
+    OrderStatus.DELIVERED: "delivered_at",
+    OrderStatus.CANCELLED: "cancelled_at",
+}
+
+def allowed_previous_statuses(new_status: OrderStatus) -> List[str]:
+    """Statuses an order may be in for a move to new_status"""
+    return [
+        status.value for status, successors in ORDER_TRANSITIONS.items()
+        if new_status in successors
+    ]
+
+def transition_guard(new_status: OrderStatus, extra_query: Optional[Dict] = None) -> Dict:
+    """Filter matching orders that may move to new_status"""
+    query = {"status": {"$in": allowed_previous_statuses(new_status)}, **(extra_query or {})}
+    if new_status == OrderStatus.OUT_FOR_DELIVERY:
+        # Only an assigned courier can pick an order up
+        query.setdefault("delivery_driver_id", {"$ne": None})
+    return query
+
+def transition_update(new_status: OrderStatus, changed_by: str, note: Optional[str] = None, **fields) -> Dict:
+    """Update setting the status and its timestamp and appending to the history"""
+    now = datetime.utcnow()
+    return {
+        "$set": {"status": new_status.value, STATUS_TIMESTAMP_FIELDS[new_status]: now, **fields},
+        "$push": {"status_history": {"status": new_status.value, "at": now, "by": changed_by, "note": note}}
+    }
+
+async def restock_cancelled_orders(db, orders: List[Dict]) -> None:
+    """Return the stock reserved by cancelled orders"""
+    quantities: Dict[str, int] = {}
+    for order in orders:
+        for item in order["items"]:
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+    if quantities:
+        await db.products.bulk_write(
+            [UpdateOne({"id": product_id}, {"$inc": {"stock_quantity": quantity}}) for product_id, quantity in quantities.items()],
+            ordered=False
+        )
+
+async def release_courier_slots(db, orders: List[Dict]) -> None:
+    """Give back the active order slots of couriers whose orders were delivered or cancelled"""
+    released: Dict[str, int] = {}
+    for order in orders:
+        if order.get("delivery_driver_id"):
+            released[order["delivery_driver_id"]] = released.get(order["delivery_driver_id"], 0) + 1
+    if released:
+        await db.users.bulk_write(
+            [UpdateOne({"id": courier_id}, {"$inc": {"active_orders": -count}}) for courier_id, count in released.items()],
+            ordered=False
+        )
+
+async def transition_order_status(
+    db,
+    order_id: str,
+    new_status: OrderStatus,
+    changed_by: str,
+    note: Optional[str] = None,
+    extra_query: Optional[Dict] = None
+) -> Optional[Dict]:
+    """Apply a status transition as one conditional update.
+
+    Returns the updated order if this call performed the transition, or None
+    if the order is missing, not matched by extra_query or not in a state that
+    allows the move.
+    """
+    order = await db.orders.find_one_and_update(
+        {"id": order_id, **transition_guard(new_status, extra_query)},
+        transition_update(new_status, changed_by, note),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if order is None:
+        return None
+
+    if new_status == OrderStatus.CANCELLED:
+        await restock_cancelled_orders(db, [order])
+    if new_status in (OrderStatus.DELIVERED, OrderStatus.CANCELLED):
+        await release_courier_slots(db, [order])
+    await order_events.publish(db, "order.status_changed", order)
+    await record_status_changes(db, [order])
+    return order
+
+async def transition_orders_bulk(
+    db,
+    order_ids: List[str],
+    new_status: OrderStatus,
+    changed_by: str,
+    note: Optional[str] = None,
+    extra_query: Optional[Dict] = None
+) -> Tuple[List[Dict], List[str]]:
+    """Apply one transition to many orders with a single update_many.
+
+    Each call tags the orders it moved with its own transition id, so they can
+    be read back without racing concurrent changes. Returns the updated orders
+    and the ids that were skipped.
+    """
+    transition_id = str(uuid.uuid4())
+    await db.orders.update_many(
+        {"id": {"$in": order_ids}, **transition_guard(new_status, extra_query)},
+        transition_update(new_status, changed_by, note, last_transition_id=transition_id)
+    )
+    orders = await db.orders.find({"last_transition_id": transition_id}, {"_id": 0}).to_list(len(order_ids))
+
+    if new_status == OrderStatus.CANCELLED:
+        await restock_cancelled_orders(db, orders)
+    if new_status in (OrderStatus.DELIVERED, OrderStatus.CANCELLED):
+        await release_courier_slots(db, orders)
+    for order in orders:
+        await order_events.publish(db, "order.status_changed", order)
+    await record_status_changes(db, orders)
+
+    updated_ids = {order["id"] for order in orders}
+    return orders, [order_id for order_id in order_ids if order_id not in updated_ids]
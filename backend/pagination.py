@@ -0,0 +1,39 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+def encode_cursor(sort_value: datetime, doc_id: ObjectId) -> str:
+    """Encode the sort key of the last returned document as an opaque cursor"""
+    raw = f"{sort_value.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        sort_value, doc_id = raw.split("|", 1)
+        return datetime.fromisoformat(sort_value), ObjectId(doc_id)
+    except (ValueError, InvalidId, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def keyset_filter(cursor: Optional[str], field: str = "created_at") -> dict:
+    """Build the filter selecting documents after the cursor in (field, _id) descending order"""
+    if not cursor:
+        return {}
+    sort_value, doc_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {field: {"$lt": sort_value}},
+            {field: sort_value, "_id": {"$lt": doc_id}}
+        ]
+    }
+
+def next_cursor(docs: list, limit: int, field: str = "created_at") -> Optional[str]:
+    """Trim a limit + 1 batch to limit and return the cursor for the following page"""
+    if len(docs) <= limit:
+        return None
+    del docs[limit:]
+    last = docs[-1]
+    return encode_cursor(last[field], last["_id"])
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from payment_models import PaymentStatus
+
+logger = logging.getLogger(__name__)
+
+OPEN_PAYMENT_STATUSES = [PaymentStatus.INITIATED.value, PaymentStatus.PENDING.value]
+
+# Public URL of this API, used for the webhook URL of the reconciler's Stripe client
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8001")
+
+class RateLimiter:
+    """Spaces out calls so at most `rate` start per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class PaymentReconciler:
+    """Background sweeper resolving transactions stuck in INITIATED or PENDING.
+
+    Pages through stale open transactions by the (payment_status, updated_at)
+    index and checks each against Stripe with bounded concurrency and a rate
+    limit, applying results through the payment state machine. Each sweep
+    also queues fulfillment for paid transactions whose outbox was left open.
+
+    Every API worker runs a reconciler, so a transaction is claimed with a
+    short lease (reconcile_lease_until) before Stripe is asked about it;
+    workers sweeping at the same time split the work instead of repeating it.
+    """
+
+    def __init__(
+        self,
+        payment_service,
+        interval_seconds: float = 60,
+        stale_after_seconds: float = 300,
+        page_size: int = 100,
+        concurrency: int = 8,
+        rate_per_second: float = 20,
+        lease_seconds: float = 120
+    ):
+        self.payment_service = payment_service
+        self.interval_seconds = interval_seconds
+        self.stale_after = timedelta(seconds=stale_after_seconds)
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_per_second)
+        self.lease = timedelta(seconds=lease_seconds)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, db) -> None:
+        """Start sweeping in the background"""
+        self._task = asyncio.create_task(self._run(db))
+        logger.info(f"Started payment reconciler (every {self.interval_seconds}s)")
+
+    async def stop(self) -> None:
+        """Stop the background sweep"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                checked = await self.sweep(db)
+                if checked:
+                    logger.info(f"Payment reconciler checked {checked} stale transactions")
+                queued = await self.payment_service.queue_pending_fulfillments(db, datetime.utcnow() - self.stale_after)
+                if queued:
+                    logger.warning(f"Payment reconciler queued {queued} lost fulfillments")
+            except Exception as e:
+                logger.error(f"Payment reconciliation sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def sweep(self, db) -> int:
+        """Check every stale open transaction once, returning how many were checked"""
+        cutoff = datetime.utcnow() - self.stale_after
+        stripe_checkout = self.payment_service.get_checkout_client(f"{PUBLIC_BASE_URL}/api/webhook/stripe")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last = None
+        checked = 0
+
+        while True:
+            query = {"payment_status": {"$in": OPEN_PAYMENT_STATUSES}, "updated_at": {"$lt": cutoff}}
+            if last:
+                query["$or"] = [
+                    {"updated_at": {"$gt": last["updated_at"]}},
+                    {"updated_at": last["updated_at"], "_id": {"$gt": last["_id"]}}
+                ]
+
+            page = await db.payment_transactions.find(
+                query, {"session_id": 1, "payment_status": 1, "updated_at": 1}
+            ).sort([("updated_at", 1), ("_id", 1)]).limit(self.page_size).to_list(self.page_size)
+            if not page:
+                return checked
+
+            results = await asyncio.gather(*(
+                self._reconcile(db, transaction, stripe_checkout, semaphore) for transaction in page
+            ))
+            checked += sum(results)
+            last = page[-1]
+
+    async def claim(self, db, transaction: Dict) -> bool:
+        """Lease a transaction for checking, returning False if another worker holds it"""
+        now = datetime.utcnow()
+        result = await db.payment_transactions.update_one(
+            {
+                "session_id": transaction["session_id"],
+                "payment_status": transaction["payment_status"],
+                "$or": [{"reconcile_lease_until": None}, {"reconcile_lease_until": {"$lte": now}}]
+            },
+            {"$set": {"reconcile_lease_until": now + self.lease}}
+        )
+        return result.modified_count == 1
+
+    async def _reconcile(self, db, transaction: Dict, stripe_checkout, semaphore: asyncio.Semaphore) -> bool:
+        """Check one transaction against Stripe, returning False if it was skipped"""
+        session_id = transaction["session_id"]
+        if not await self.claim(db, transaction):
+            return False
+        async with semaphore:
+            await self.rate_limiter.acquire()
+            try:
+                _, _, transitioned = await self.payment_service.sync_with_stripe(session_id, stripe_checkout, db)
+            except Exception as e:
+                logger.warning(f"Could not reconcile payment session {session_id}: {str(e)}")
+                return True
+
+        # Still open at Stripe: push it back so the next check happens after stale_after
+        if not transitioned:
+            await db.payment_transactions.update_one(
+                {"session_id": session_id, "payment_status": transaction["payment_status"]},
+                {"$set": {"updated_at": datetime.utcnow()}}
+            )
+        return True
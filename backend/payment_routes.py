@@ -4,11 +4,12 @@ from payment_service import PaymentService
 from payment_models import CheckoutRequest
 from auth import get_current_user_optional
 from database import get_database
+from request_tracing import TracedRoute
 import logging
 
 logger = logging.getLogger(__name__)
 
-payment_router = APIRouter(prefix="/api/payments", tags=["payments"])
+payment_router = APIRouter(prefix="/api/payments", tags=["payments"], route_class=TracedRoute)
 
 # Initialize payment service
 payment_service = PaymentService()
@@ -1,20 +1,42 @@
+import asyncio
+import inspect
 import os
+from collections import OrderedDict
 from typing import Dict, Optional
+import httpx
+import stripe
 from fastapi import HTTPException, Request
 from dotenv import load_dotenv
-from emergentintegrations.payments.stripe.checkout import (
-    StripeCheckout, 
-    CheckoutSessionResponse, 
-    CheckoutStatusResponse, 
-    CheckoutSessionRequest
-)
 from database import get_database
 from payment_models import PaymentTransaction, PaymentStatus
+from payment_state import (
+    transition_payment_status, record_stripe_event, forget_stripe_event,
+    TERMINAL_PAYMENT_STATUSES
+)
+from job_queue import job_queue
 from datetime import datetime
 import logging
 
 load_dotenv()
 
+# "stripe" for the real checkout client, "fake" for the offline stand-in
+PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "stripe")
+
+if PAYMENT_PROVIDER == "fake":
+    from fake_checkout import (
+        StripeCheckout,
+        CheckoutSessionResponse,
+        CheckoutStatusResponse,
+        CheckoutSessionRequest
+    )
+else:
+    from emergentintegrations.payments.stripe.checkout import (
+        StripeCheckout, 
+        CheckoutSessionResponse, 
+        CheckoutStatusResponse, 
+        CheckoutSessionRequest
+    )
+
 logger = logging.getLogger(__name__)
 
 # Fixed payment packages - amounts are NOT accepted from frontend
@@ -25,17 +47,110 @@ PAYMENT_PACKAGES = {
     "delivery_fee": {"amount": 2.50, "name": "Tarifa de Envío", "description": "Costo de entrega estándar"}
 }
 
+# Job type for post-payment work run by the fulfillment workers
+FULFILL_PAYMENT_JOB = "payment.fulfill"
+
+# Connections kept alive to the Stripe API, shared by all checkout clients
+STRIPE_HTTP_POOL_SIZE = int(os.getenv("STRIPE_HTTP_POOL_SIZE", "32"))
+
+# Webhook URLs derive from the Host header, so only keep a handful of clients
+MAX_CHECKOUT_CLIENTS = 8
+
+# Checkout session status reported for each payment status when the transaction
+# was not synced from Stripe (e.g. paid via webhook); others are still "open"
+CHECKOUT_STATUS_BY_PAYMENT_STATUS = {
+    PaymentStatus.PAID.value: "complete",
+    PaymentStatus.EXPIRED.value: "expired",
+    PaymentStatus.CANCELLED.value: "cancelled",
+    PaymentStatus.FAILED.value: "expired",
+}
+
+def checkout_status_for(payment_status: str) -> str:
+    """Checkout session status matching a stored payment status"""
+    return CHECKOUT_STATUS_BY_PAYMENT_STATUS.get(payment_status, "open")
+
+# Final checkout statuses served from memory without touching Mongo or Stripe
+MAX_CACHED_TERMINAL_STATUSES = 10000
+
+class PooledHttpx:
+    """Stands in for the httpx module inside stripe.HTTPXClient, building its clients with pool limits"""
+
+    def __init__(self, limits: "httpx.Limits"):
+        self.limits = limits
+
+    def AsyncClient(self, **kwargs) -> "httpx.AsyncClient":
+        return httpx.AsyncClient(limits=self.limits, **kwargs)
+
+    def Client(self, **kwargs) -> "httpx.Client":
+        return httpx.Client(limits=self.limits, **kwargs)
+
+def configure_stripe_transport(pool_size: int = STRIPE_HTTP_POOL_SIZE) -> "stripe.HTTPXClient":
+    """Route all Stripe SDK calls, sync and async, through pooled keep-alive httpx clients.
+
+    HTTPXClient takes no pool options, only the httpx module to build its
+    clients from (the _lib argument), so it is given one that applies
+    pool_size. Both the argument and the client attributes are private to
+    the SDK; they are checked here, and by tests/test_stripe_transport.py,
+    so an SDK upgrade that changes them fails at startup instead of silently
+    dropping the pool limits.
+    """
+    if "_lib" not in inspect.signature(stripe.HTTPXClient.__init__).parameters:
+        raise RuntimeError(f"stripe {stripe.VERSION}: HTTPXClient no longer accepts _lib; update configure_stripe_transport")
+    client = stripe.HTTPXClient(allow_sync_methods=True, _lib=PooledHttpx(
+        httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    ))
+    if not (isinstance(getattr(client, "_client", None), httpx.Client)
+            and isinstance(getattr(client, "_client_async", None), httpx.AsyncClient)):
+        raise RuntimeError(f"stripe {stripe.VERSION}: HTTPXClient does not keep its httpx clients where expected; update configure_stripe_transport")
+    stripe.default_http_client = client
+    
+    # Allows pointing the SDK at a local Stripe stand-in such as stripe-mock
+    api_base = os.getenv("STRIPE_API_BASE")
+    if api_base:
+        stripe.api_base = api_base
+    return client
+
 class PaymentService:
     def __init__(self):
+        self._checkout_clients: "OrderedDict[str, StripeCheckout]" = OrderedDict()
+        self._terminal_statuses: "OrderedDict[str, Dict]" = OrderedDict()
+        self._status_lookups: Dict[str, asyncio.Future] = {}
+        self._http_client = None
+        
+        if PAYMENT_PROVIDER == "fake":
+            self.stripe_api_key = os.getenv("STRIPE_API_KEY", "sk_test_fake")
+            logger.warning("Using the offline fake checkout provider")
+            return
+        
         self.stripe_api_key = os.getenv("STRIPE_API_KEY")
         if not self.stripe_api_key:
             raise ValueError("STRIPE_API_KEY environment variable is required")
         
+        self._http_client = configure_stripe_transport()
+    
+    async def close(self) -> None:
+        """Close the pooled Stripe connections"""
+        if self._http_client is not None:
+            self._http_client.close()
+            await self._http_client.close_async()
+    
+    def get_checkout_client(self, webhook_url: str) -> StripeCheckout:
+        """Get the long-lived Stripe checkout client for a webhook URL"""
+        client = self._checkout_clients.get(webhook_url)
+        if client is None:
+            client = StripeCheckout(api_key=self.stripe_api_key, webhook_url=webhook_url)
+            self._checkout_clients[webhook_url] = client
+            if len(self._checkout_clients) > MAX_CHECKOUT_CLIENTS:
+                self._checkout_clients.popitem(last=False)
+        else:
+            self._checkout_clients.move_to_end(webhook_url)
+        return client
+        
     def _get_stripe_checkout(self, request: Request) -> StripeCheckout:
-        """Initialize Stripe checkout with webhook URL"""
+        """Get Stripe checkout for the webhook URL of the current host"""
         host_url = str(request.base_url).rstrip('/')
         webhook_url = f"{host_url}/api/webhook/stripe"
-        return StripeCheckout(api_key=self.stripe_api_key, webhook_url=webhook_url)
+        return self.get_checkout_client(webhook_url)
     
     async def create_checkout_session(
         self, 
@@ -112,63 +227,154 @@ class PaymentService:
             logger.error(f"Error creating checkout session: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to create checkout session: {str(e)}")
     
+    def _payment_status_from_checkout(self, checkout_status: CheckoutStatusResponse) -> PaymentStatus:
+        """Map a Stripe checkout session status onto our payment status"""
+        if checkout_status.payment_status == "paid":
+            return PaymentStatus.PAID
+        if checkout_status.status == "expired":
+            return PaymentStatus.EXPIRED
+        if checkout_status.status == "cancelled":
+            return PaymentStatus.CANCELLED
+        return PaymentStatus.PENDING
+    
+    def _status_from_transaction(self, transaction: Dict) -> Dict:
+        """Build a checkout status response from a stored transaction"""
+        return {
+            "session_id": transaction["session_id"],
+            "status": transaction.get("status") or checkout_status_for(transaction["payment_status"]),
+            "payment_status": "paid" if transaction["payment_status"] == PaymentStatus.PAID else "unpaid",
+            "amount_total": transaction["amount"],
+            "currency": transaction["currency"],
+            "metadata": transaction.get("metadata", {}),
+            "package_info": PAYMENT_PACKAGES.get(transaction.get("package_id", ""), {}),
+            "transitioned": False
+        }
+    
+    def _cache_terminal_status(self, session_id: str, result: Dict):
+        """Remember a final status; terminal transactions never change again"""
+        self._terminal_statuses[session_id] = {**result, "transitioned": False}
+        if len(self._terminal_statuses) > MAX_CACHED_TERMINAL_STATUSES:
+            self._terminal_statuses.popitem(last=False)
+    
+    async def sync_with_stripe(self, session_id: str, stripe_checkout: StripeCheckout, db):
+        """Fetch a session from Stripe and apply the resulting status transition"""
+        checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
+        new_payment_status = self._payment_status_from_checkout(checkout_status)
+        
+        # Only one caller (poll, webhook or reconciler) can win the transition
+        updated = await transition_payment_status(
+            db, session_id, new_payment_status, {"status": checkout_status.status}
+        )
+        transitioned = updated is not None
+        
+        if transitioned:
+            logger.info(f"Updated payment transaction {session_id} status to {new_payment_status}")
+        
+        # Also covers a PAID transition whose fulfillment job was never queued
+        if new_payment_status == PaymentStatus.PAID:
+            await self.queue_fulfillment(db, session_id)
+        
+        return checkout_status, new_payment_status, transitioned
+    
     async def get_checkout_status(self, session_id: str, request: Request, db) -> Dict:
-        """Get and update checkout session status"""
+        """Get checkout session status, coalescing concurrent polls for a session"""
+        cached = self._terminal_statuses.get(session_id)
+        if cached:
+            return dict(cached)
+        
+        # Concurrent polls for the same session share one lookup
+        lookup = self._status_lookups.get(session_id)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._fetch_checkout_status(session_id, request, db))
+            self._status_lookups[session_id] = lookup
+            lookup.add_done_callback(lambda _: self._status_lookups.pop(session_id, None))
+        
+        return dict(await asyncio.shield(lookup))
+    
+    async def _fetch_checkout_status(self, session_id: str, request: Request, db) -> Dict:
+        """Get and update checkout session status, calling Stripe only for open sessions"""
         
         try:
-            # Get Stripe checkout instance
-            stripe_checkout = self._get_stripe_checkout(request)
-            
-            # Get status from Stripe
-            checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
-            
-            # Find existing transaction
             transaction = await db.payment_transactions.find_one({"session_id": session_id})
             if not transaction:
                 raise HTTPException(status_code=404, detail="Payment transaction not found")
             
-            # Determine new payment status
-            new_payment_status = PaymentStatus.PENDING
-            if checkout_status.payment_status == "paid":
-                new_payment_status = PaymentStatus.PAID
-            elif checkout_status.status in ["expired", "cancelled"]:
-                new_payment_status = PaymentStatus.EXPIRED if checkout_status.status == "expired" else PaymentStatus.CANCELLED
-            
-            # Only update if status changed to avoid multiple processing
-            if transaction["payment_status"] != new_payment_status:
-                update_data = {
-                    "payment_status": new_payment_status,
-                    "status": checkout_status.status,
-                    "updated_at": datetime.utcnow()
-                }
-                
-                await db.payment_transactions.update_one(
-                    {"session_id": session_id}, 
-                    {"$set": update_data}
-                )
-                
-                logger.info(f"Updated payment transaction {session_id} status to {new_payment_status}")
-                
-                # Perform post-payment operations only once for successful payments
-                if new_payment_status == PaymentStatus.PAID and transaction["payment_status"] != PaymentStatus.PAID:
-                    await self._handle_successful_payment(transaction, checkout_status)
+            if transaction["payment_status"] in TERMINAL_PAYMENT_STATUSES:
+                result = self._status_from_transaction(transaction)
+                self._cache_terminal_status(session_id, result)
+                return result
             
-            return {
+            # Get Stripe checkout instance
+            stripe_checkout = self._get_stripe_checkout(request)
+            checkout_status, new_payment_status, transitioned = await self.sync_with_stripe(
+                session_id, stripe_checkout, db
+            )
+            
+            result = {
                 "session_id": session_id,
                 "status": checkout_status.status,
                 "payment_status": checkout_status.payment_status,
                 "amount_total": checkout_status.amount_total / 100,  # Convert from cents
                 "currency": checkout_status.currency,
                 "metadata": checkout_status.metadata,
-                "package_info": PAYMENT_PACKAGES.get(transaction.get("package_id", ""), {})
+                "package_info": PAYMENT_PACKAGES.get(transaction.get("package_id", ""), {}),
+                "transitioned": transitioned
             }
             
+            if new_payment_status.value in TERMINAL_PAYMENT_STATUSES:
+                self._cache_terminal_status(session_id, result)
+            
+            return result
+            
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error getting checkout status: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to get checkout status: {str(e)}")
     
-    async def _handle_successful_payment(self, transaction: Dict, checkout_status: CheckoutStatusResponse):
+    async def queue_fulfillment(self, db, session_id: str) -> bool:
+        """Queue post-payment fulfillment if the transaction's outbox is still open.
+
+        Safe to call any number of times: the job is deduplicated by session,
+        and the outbox is closed only after the job is stored.
+        """
+        pending = await db.payment_transactions.find_one(
+            {"session_id": session_id, "payment_status": PaymentStatus.PAID.value, "fulfillment_queued": False},
+            {"_id": 1}
+        )
+        if not pending:
+            return False
+        
+        enqueued = await job_queue.enqueue(
+            db,
+            FULFILL_PAYMENT_JOB,
+            {"session_id": session_id},
+            dedupe_key=f"{FULFILL_PAYMENT_JOB}:{session_id}"
+        )
+        await db.payment_transactions.update_one(
+            {"session_id": session_id, "fulfillment_queued": False},
+            {"$set": {"fulfillment_queued": True}}
+        )
+        if enqueued:
+            logger.info(f"Queued fulfillment for session {session_id}")
+        return True
+    
+    async def queue_pending_fulfillments(self, db, older_than: datetime) -> int:
+        """Queue fulfillment for paid transactions whose outbox was left open, returning how many"""
+        pending = await db.payment_transactions.find(
+            {"fulfillment_queued": False, "updated_at": {"$lt": older_than}},
+            {"session_id": 1}
+        ).to_list(None)
+        for transaction in pending:
+            await self.queue_fulfillment(db, transaction["session_id"])
+        return len(pending)
+    
+    async def fulfill_payment(self, db, payload: Dict):
         """Handle successful payment - implement business logic here"""
+        transaction = await db.payment_transactions.find_one({"session_id": payload["session_id"]})
+        if not transaction:
+            raise ValueError(f"Payment transaction {payload['session_id']} not found")
+        
         logger.info(f"Processing successful payment for session {transaction['session_id']}")
         
         # TODO: Implement business logic for successful payments
@@ -179,7 +385,7 @@ class PaymentService:
         # - Trigger delivery process
         
         package_id = transaction.get("package_id")
-        amount = checkout_status.amount_total / 100
+        amount = transaction.get("amount")
         
         logger.info(f"Payment successful: {package_id} package for ${amount}")
     
@@ -201,30 +407,37 @@ class PaymentService:
             
             logger.info(f"Webhook received: {webhook_response.event_type} for session {webhook_response.session_id}")
             
-            # Update transaction based on webhook event
-            if webhook_response.session_id:
-                # Find and update transaction
-                transaction = await db.payment_transactions.find_one({"session_id": webhook_response.session_id})
-                if transaction:
+            # Stripe delivers at least once; drop events we have already processed
+            if not await record_stripe_event(db, webhook_response.event_id):
+                logger.info(f"Ignoring duplicate webhook event {webhook_response.event_id}")
+                return {
+                    "event_type": webhook_response.event_type,
+                    "session_id": webhook_response.session_id,
+                    "status": "duplicate",
+                    "transitioned": False
+                }
+            
+            transitioned = False
+            try:
+                if webhook_response.session_id:
                     new_status = PaymentStatus.PAID if webhook_response.payment_status == "paid" else PaymentStatus.PENDING
+                    transaction = await transition_payment_status(
+                        db, webhook_response.session_id, new_status, {"status": checkout_status_for(new_status.value)}
+                    )
+                    transitioned = transaction is not None
                     
-                    if transaction["payment_status"] != new_status:
-                        await db.payment_transactions.update_one(
-                            {"session_id": webhook_response.session_id},
-                            {"$set": {
-                                "payment_status": new_status,
-                                "updated_at": datetime.utcnow()
-                            }}
-                        )
-                        
-                        # Handle successful payment
-                        if new_status == PaymentStatus.PAID:
-                            await self._handle_successful_payment(transaction, webhook_response)
+                    # A retried event for an already PAID transaction still queues a lost fulfillment
+                    if new_status == PaymentStatus.PAID:
+                        await self.queue_fulfillment(db, webhook_response.session_id)
+            except Exception:
+                await forget_stripe_event(db, webhook_response.event_id)
+                raise
             
             return {
                 "event_type": webhook_response.event_type,
                 "session_id": webhook_response.session_id,
-                "status": "processed"
+                "status": "processed",
+                "transitioned": transitioned
             }
             
         except Exception as e:
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from payment_models import PaymentStatus
+
+# Allowed payment status transitions; terminal statuses have no successors
+PAYMENT_TRANSITIONS = {
+    PaymentStatus.INITIATED: {
+        PaymentStatus.PENDING, PaymentStatus.PAID, PaymentStatus.FAILED,
+        PaymentStatus.EXPIRED, PaymentStatus.CANCELLED
+    },
+    PaymentStatus.PENDING: {
+        PaymentStatus.PAID, PaymentStatus.FAILED,
+        PaymentStatus.EXPIRED, PaymentStatus.CANCELLED
+    },
+    PaymentStatus.PAID: set(),
+    PaymentStatus.FAILED: set(),
+    PaymentStatus.EXPIRED: set(),
+    PaymentStatus.CANCELLED: set(),
+}
+
+# Stored values of the terminal statuses, as found in payment_transactions
+TERMINAL_PAYMENT_STATUSES = {
+    status.value for status, successors in PAYMENT_TRANSITIONS.items() if not successors
+}
+
+def allowed_previous_statuses(new_status: PaymentStatus) -> List[str]:
+    """Statuses a transaction may be in for a move to new_status"""
+    return [
+        status.value for status, successors in PAYMENT_TRANSITIONS.items()
+        if new_status in successors
+    ]
+
+async def transition_payment_status(
+    db,
+    session_id: str,
+    new_status: PaymentStatus,
+    extra_fields: Optional[Dict] = None
+) -> Optional[Dict]:
+    """Apply a status transition as one conditional update.
+
+    Returns the updated transaction if this call performed the transition,
+    or None if the transaction is missing or already past an allowed state.
+    A move to PAID also opens the fulfillment outbox (fulfillment_queued
+    False) in the same update, so a crash before the fulfillment job is
+    queued leaves a marker the reconciler picks up.
+    """
+    fields = {**(extra_fields or {})}
+    if new_status == PaymentStatus.PAID:
+        fields["fulfillment_queued"] = False
+    return await db.payment_transactions.find_one_and_update(
+        {
+            "session_id": session_id,
+            "payment_status": {"$in": allowed_previous_statuses(new_status)}
+        },
+        {"$set": {
+            "payment_status": new_status.value,
+            "updated_at": datetime.utcnow(),
+            **fields
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def record_stripe_event(db, event_id: Optional[str]) -> bool:
+    """Record a Stripe event id, returning False if it was already processed.
+
+    Events without an id cannot be deduplicated and are always processed;
+    the payment transitions they cause are idempotent anyway.
+    """
+    if not event_id:
+        return True
+    try:
+        await db.stripe_events.insert_one({"_id": event_id, "received_at": datetime.utcnow()})
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def forget_stripe_event(db, event_id: Optional[str]) -> None:
+    """Drop a recorded event so a Stripe retry is processed again"""
+    if event_id:
+        await db.stripe_events.delete_one({"_id": event_id})
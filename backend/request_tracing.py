@@ -0,0 +1,288 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi.routing import APIRoute
+from pymongo.monitoring import CommandListener
+from metrics import route_template
+from mongo_client import add_event_listener
+
+logger = logging.getLogger(__name__)
+
+# JSON-lines file sampled traces are appended to; empty disables export
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+
+# Fraction of requests exported; requests slower than TRACE_SLOW_MS are always exported
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+
+# Seconds between writes of buffered traces to TRACE_EXPORT_PATH
+TRACE_EXPORT_FLUSH_SECONDS = 5
+
+# MongoDB spans kept per request; a request looping over the database only counts the rest
+TRACE_MAX_SPANS = 200
+
+# Span that holds all MongoDB commands in the Server-Timing header
+DB_SPAN = "db"
+
+class RequestTrace:
+    """Spans recorded while handling one request, as offsets from its start"""
+
+    def __init__(self, method: str, route: str, path: str):
+        self.trace_id = uuid.uuid4().hex
+        self.method = method
+        self.route = route
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.dropped_spans = 0
+        # (connection, request id) -> collection of MongoDB commands in flight
+        self.commands: Dict = {}
+
+    def add_span(self, name: str, started: float, ended: float, detail: Optional[str] = None) -> None:
+        """Record a span between two time.perf_counter() readings"""
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+            "detail": detail,
+        })
+
+    def last_span(self, name: str) -> Optional[Dict]:
+        return next((span for span in reversed(self.spans) if span["name"] == name), None)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value summing spans by name, plus the total so far"""
+        totals: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+            counts[span["name"]] = counts.get(span["name"], 0) + 1
+        entries = []
+        for name, duration in totals.items():
+            entry = f"{name};dur={duration:.1f}"
+            if name == DB_SPAN:
+                entry += f';desc="{counts[name]} commands"'
+            entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self, status_code: int, duration_ms: float) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "at": datetime.utcnow().isoformat(),
+            "method": self.method,
+            "route": self.route,
+            "path": self.path,
+            "status": status_code,
+            "duration_ms": round(duration_ms, 3),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+            "dropped_spans": self.dropped_spans,
+        }
+
+# Trace of the request being handled, if any
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+@contextmanager
+def span(name: str, detail: Optional[str] = None):
+    """Record the enclosed block as a span of the current request, if there is one"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, started, time.perf_counter(), detail)
+
+class MongoTraceListener(CommandListener):
+    """Adds every MongoDB command issued on behalf of a request as a span of its trace"""
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is not None:
+            collection = event.command.get(event.command_name)
+            trace.commands[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else None
+
+    def _finish(self, event, outcome: str):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        collection = trace.commands.pop((event.connection_id, event.request_id), None)
+        if len(trace.spans) >= TRACE_MAX_SPANS:
+            trace.dropped_spans += 1
+            return
+        ended = time.perf_counter()
+        detail = f"{event.command_name} {collection}" if collection else event.command_name
+        if outcome != "ok":
+            detail += f" ({outcome})"
+        trace.add_span(DB_SPAN, ended - event.duration_micros / 1e6, ended, detail)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "failed")
+
+add_event_listener(MongoTraceListener())
+
+def traced_endpoint(endpoint):
+    """Wrap a route endpoint so the time spent inside it is recorded as the "handler" span"""
+    # Routers copy their routes when included, so an endpoint may already be wrapped
+    if getattr(endpoint, "__traced__", False):
+        return endpoint
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            with span("handler"):
+                return await endpoint(*args, **kwargs)
+        async_wrapper.__traced__ = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def sync_wrapper(*args, **kwargs):
+        with span("handler"):
+            return endpoint(*args, **kwargs)
+    sync_wrapper.__traced__ = True
+    return sync_wrapper
+
+class TracedRoute(APIRoute):
+    """APIRoute recording dependency resolution, handler and response rendering spans.
+
+    Everything between the route being called and the endpoint starting
+    (body parsing and dependencies such as get_current_user) becomes the
+    "deps" span; everything after the endpoint returns (response_model
+    validation and JSON encoding) becomes the "render" span.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            trace = current_trace.get()
+            if trace is None:
+                return await handler(request)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                ended = time.perf_counter()
+                endpoint_span = trace.last_span("handler")
+                if endpoint_span is None:
+                    # Failed before reaching the endpoint, e.g. a 401 from get_current_user
+                    trace.add_span("deps", started, ended)
+                else:
+                    endpoint_started = trace.started + endpoint_span["start_ms"] / 1000
+                    endpoint_ended = endpoint_started + endpoint_span["duration_ms"] / 1000
+                    trace.add_span("deps", started, endpoint_started)
+                    trace.add_span("render", endpoint_ended, ended)
+
+        return traced_handler
+
+class TraceExporter:
+    """Buffers sampled traces and appends them to a JSON-lines file off the event loop"""
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH, sample_rate: float = TRACE_SAMPLE_RATE, slow_ms: float = TRACE_SLOW_MS):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._buffer: deque = deque(maxlen=10000)
+        self._task: Optional[asyncio.Task] = None
+
+    def offer(self, trace: RequestTrace, status_code: int, duration_ms: float) -> None:
+        """Queue a finished trace for export if it is slow or sampled"""
+        if not self.path:
+            return
+        if duration_ms >= self.slow_ms or random.random() < self.sample_rate:
+            self._buffer.append(trace.to_dict(status_code, duration_ms))
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as export_file:
+            export_file.writelines(lines)
+
+    async def flush(self) -> int:
+        """Append buffered traces to the export file, returning how many were written"""
+        lines = []
+        while self._buffer:
+            lines.append(json.dumps(self._buffer.popleft(), default=str) + "\n")
+        if lines:
+            await asyncio.to_thread(self._write, lines)
+        return len(lines)
+
+    def start(self) -> None:
+        """Start writing buffered traces every TRACE_EXPORT_FLUSH_SECONDS"""
+        if self.path:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the writer and flush what is left"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.path:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(TRACE_EXPORT_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Trace export to {self.path} failed: {str(e)}")
+
+trace_exporter = TraceExporter()
+
+class RequestTracingMiddleware:
+    """ASGI middleware tracing each HTTP request and returning its spans in a Server-Timing header.
+
+    Server-sent event streams are not traced.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        trace = RequestTrace(method, route_template(scope["app"], method, scope["path"]), scope["path"])
+        token = current_trace.set(trace)
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in headers
+                )
+                if not streaming:
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            if not streaming:
+                trace_exporter.offer(trace, status_code, (time.perf_counter() - trace.started) * 1000)
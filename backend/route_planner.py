@@ -0,0 +1,65 @@
+from typing import List, Sequence, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+Point = Tuple[float, float]  # (latitude, longitude)
+
+def distance_matrix_km(points: Sequence[Point]) -> np.ndarray:
+    """Great-circle distances between every pair of points"""
+    latitudes, longitudes = np.radians(np.asarray(points, dtype=float)).T
+    dlat = latitudes[:, None] - latitudes[None, :]
+    dlng = longitudes[:, None] - longitudes[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(latitudes[:, None]) * np.cos(latitudes[None, :]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def nearest_neighbor_route(distances: np.ndarray) -> List[int]:
+    """Greedy tour from node 0, always visiting the closest unvisited node next"""
+    count = len(distances)
+    visited = np.zeros(count, dtype=bool)
+    visited[0] = True
+    route = [0]
+    for _ in range(count - 1):
+        candidates = np.where(visited, np.inf, distances[route[-1]])
+        nearest = int(candidates.argmin())
+        visited[nearest] = True
+        route.append(nearest)
+    return route
+
+def two_opt(route: List[int], distances: np.ndarray, max_passes: int = 50) -> List[int]:
+    """Improve an open path from a fixed start by reversing segments while that shortens it.
+
+    For each segment start i, the gain of reversing route[i:j+1] is computed
+    for every j at once; the path has no return leg, so reversing up to the
+    last stop only changes the edge into the segment.
+    """
+    route = np.array(route)
+    count = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, count - 1):
+            before, first = route[i - 1], route[i]
+            lasts = route[i + 1:]
+            afters = np.append(route[i + 2:], -1)
+            has_after = afters >= 0
+            safe_afters = np.where(has_after, afters, 0)
+            delta = distances[before, lasts] - distances[before, first] + np.where(
+                has_after, distances[first, safe_afters] - distances[lasts, safe_afters], 0
+            )
+            best = int(delta.argmin())
+            if delta[best] < -1e-9:
+                j = i + 1 + best
+                route[i:j + 1] = route[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route.tolist()
+
+def plan_route(start: Point, stops: Sequence[Point]) -> Tuple[List[int], List[float]]:
+    """Order stops to visit from start, returning stop indexes and the km of each leg"""
+    if not stops:
+        return [], []
+    distances = distance_matrix_km([start, *stops])
+    route = two_opt(nearest_neighbor_route(distances), distances)
+    legs = distances[route[:-1], route[1:]].tolist()
+    return [node - 1 for node in route[1:]], legs
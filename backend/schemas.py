@@ -23,6 +23,11 @@ class InvitationCodeCreate(BaseModel):
     role: InvitationRole
     expires_in_days: int = 30
 
+class InvitationCodeBulkCreate(BaseModel):
+    role: InvitationRole
+    count: int = Field(..., ge=1, le=1000)
+    expires_in_days: int = 30
+
 class InvitationCodeValidate(BaseModel):
     code: str
     role: InvitationRole
@@ -36,6 +41,17 @@ class InvitationCodeResponse(BaseModel):
     used_by: Optional[str] = None
     used_at: Optional[datetime] = None
 
+class InvitationCodeCounts(BaseModel):
+    total: int
+    used: int
+    expired: int
+    active: int
+
+class InvitationCodePage(BaseModel):
+    items: List[InvitationCodeResponse]
+    next_cursor: Optional[str] = None
+    counts: Optional[InvitationCodeCounts] = None  # Only on the first page
+
 # Enhanced User Registration with Invitation Code
 class UserCreateWithInvitation(BaseModel):
     email: EmailStr
@@ -1,21 +1,45 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
-from database import connect_to_mongo, close_mongo_connection, get_database
+from database import connect_to_mongo, close_mongo_connection, get_catalog_database, get_client, get_database
+from mongo_client import pool_metrics
+from metrics import PrometheusMiddleware, metrics_response_body
+from slow_query_log import slow_query_log
+from request_tracing import RequestTracingMiddleware, TracedRoute, trace_exporter
 from auth import (
     authenticate_user, create_access_token, get_password_hash,
     get_current_active_user, get_customer_user, get_store_admin_user,
-    get_delivery_user
+    get_delivery_user, get_staff_user
 )
 from auth_google import handle_google_auth, get_google_login_url, logout_session
 from models import *
 from schemas import *
-from payment_routes import payment_router
+from payment_routes import payment_router, payment_service
+from order_routes import order_router
+from cart_routes import cart_router
+from cart_service import cart_store
+from order_events import order_events
+from dispatch import dispatcher
+from analytics import ANALYTICS_BACKFILL_JOB, rebuild_rollups
+from analytics_routes import analytics_router
+from notification_routes import notification_router
+from notification_service import notification_service
+from eta_service import EtaEstimator
+from courier_routes import courier_router
+from payment_service import FULFILL_PAYMENT_JOB
+from job_queue import JobWorkerPool, job_queue
+from payment_reconciler import PaymentReconciler
 from invitation_system import InvitationSystem
+from delivery_zones import DELIVERY_AREAS, resolve_delivery_zone
 from typing import List, Optional
 from datetime import datetime
+import asyncio
+import csv
+import io
 import os
 import logging
 from pathlib import Path
@@ -31,13 +55,56 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Fulfillment workers per process; set to 0 to run them in a separate deployment
+FULFILLMENT_WORKERS = int(os.getenv("FULFILLMENT_WORKERS", "4"))
+
+# Seconds between payment reconciliation sweeps; set to 0 to disable
+PAYMENT_RECONCILE_INTERVAL = float(os.getenv("PAYMENT_RECONCILE_INTERVAL", "60"))
+
+# Seconds between delivery ETA refreshes for open orders; set to 0 to disable
+ETA_REFRESH_INTERVAL = float(os.getenv("ETA_REFRESH_INTERVAL", "30"))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
     logger.info("Connected to MongoDB")
+    database = await get_database()
+    slow_query_log.start(get_client())
+    trace_exporter.start()
+    
+    fulfillment_workers = JobWorkerPool(
+        job_queue,
+        {FULFILL_PAYMENT_JOB: payment_service.fulfill_payment, ANALYTICS_BACKFILL_JOB: rebuild_rollups},
+        concurrency=FULFILLMENT_WORKERS
+    )
+    if FULFILLMENT_WORKERS > 0:
+        fulfillment_workers.start(database)
+    
+    payment_reconciler = PaymentReconciler(payment_service, interval_seconds=PAYMENT_RECONCILE_INTERVAL)
+    if PAYMENT_RECONCILE_INTERVAL > 0:
+        payment_reconciler.start(database)
+    
+    cart_store.start(database)
+    order_events.start(database)
+    dispatcher.start(database)
+    notification_service.start(database)
+    
+    eta_estimator = EtaEstimator(interval_seconds=ETA_REFRESH_INTERVAL)
+    if ETA_REFRESH_INTERVAL > 0:
+        eta_estimator.start(database)
     yield
     # Shutdown
+    await eta_estimator.stop()
+    await notification_service.stop(database)
+    await dispatcher.stop()
+    await order_events.stop()
+    await cart_store.stop(database)
+    await payment_reconciler.stop()
+    await payment_service.close()
+    await fulfillment_workers.stop()
+    await slow_query_log.stop()
+    await trace_exporter.stop()
     await close_mongo_connection()
     logger.info("Closed MongoDB connection")
 
@@ -50,7 +117,7 @@ app = FastAPI(
 )
 
 # Create API router with prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TracedRoute)
 
 # CORS middleware
 app.add_middleware(
@@ -61,11 +128,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request spans returned in a Server-Timing header and sampled to TRACE_EXPORT_PATH
+app.add_middleware(RequestTracingMiddleware)
+
+# Request metrics, outermost so they include the time spent in other middleware
+app.add_middleware(PrometheusMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request, MongoDB command and connection pool metrics in Prometheus text format"""
+    body, content_type = metrics_response_body()
+    return Response(content=body, media_type=content_type)
+
 # Health check endpoint
 @api_router.get("/health")
 async def health_check():
     return {"status": "healthy", "message": "Delivery App API is running"}
 
+@api_router.get("/health/mongo-pool")
+async def mongo_pool_health(current_user: dict = Depends(get_staff_user)):
+    """Get MongoDB connection pool usage and checkout wait times for this worker (Staff only)"""
+    return {"pools": pool_metrics.snapshot()}
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    collscan_only: bool = False,
+    current_user: dict = Depends(get_store_admin_user)
+):
+    """Get the slowest MongoDB query shapes and recent slow commands of this worker (Admin only)"""
+    return slow_query_log.report(limit=limit, collscan_only=collscan_only)
+
+@api_router.delete("/admin/slow-queries")
+async def reset_slow_queries(current_user: dict = Depends(get_store_admin_user)):
+    """Clear the slow query log of this worker (Admin only)"""
+    slow_query_log.reset()
+    return {"message": "Slow query log cleared"}
+
 # Invitation System endpoints
 @api_router.post("/invitations/generate", response_model=dict)
 async def generate_invitation_code(
@@ -75,13 +174,13 @@ async def generate_invitation_code(
 ):
     """Generate invitation code for courier or staff (Admin only)"""
     try:
-        invitation_system = InvitationSystem()
+        invitation_system = InvitationSystem(get_client())
         code = await invitation_system.generate_invitation_code(
             role=invitation_data.role.value,
             created_by=current_user["id"],
             expires_in_days=invitation_data.expires_in_days
         )
-        invitation_system.client.close()
+        invitation_system.close()
         return {"code": code, "message": "Invitation code generated successfully"}
     except Exception as e:
         raise HTTPException(
@@ -89,16 +188,54 @@ async def generate_invitation_code(
             detail=f"Failed to generate invitation code: {str(e)}"
         )
 
+def iter_invitations_csv(invitations: List[dict]):
+    """Yield invitation codes as CSV rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["code", "role", "expires_at"])
+    for invitation in invitations:
+        writer.writerow([invitation["code"], invitation["role"], invitation["expires_at"].isoformat()])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+@api_router.post("/invitations/bulk")
+async def generate_invitation_codes_bulk(
+    invitation_data: InvitationCodeBulkCreate,
+    current_user: dict = Depends(get_store_admin_user)
+):
+    """Generate a batch of invitation codes and stream them as CSV (Admin only)"""
+    try:
+        invitation_system = InvitationSystem(get_client())
+        invitations = await invitation_system.generate_invitation_codes_bulk(
+            role=invitation_data.role.value,
+            created_by=current_user["id"],
+            count=invitation_data.count,
+            expires_in_days=invitation_data.expires_in_days
+        )
+        invitation_system.close()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate invitation codes: {str(e)}"
+        )
+    
+    return StreamingResponse(
+        iter_invitations_csv(invitations),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="invitation_codes.csv"'}
+    )
+
 @api_router.post("/invitations/validate", response_model=dict)
 async def validate_invitation_code(validation_data: InvitationCodeValidate):
     """Validate invitation code"""
     try:
-        invitation_system = InvitationSystem()
+        invitation_system = InvitationSystem(get_client())
         is_valid = await invitation_system.validate_invitation_code(
             code=validation_data.code,
             role=validation_data.role.value
         )
-        invitation_system.client.close()
+        invitation_system.close()
         return {"valid": is_valid}
     except Exception as e:
         raise HTTPException(
@@ -113,9 +250,9 @@ async def get_invitation_codes(
 ):
     """Get all invitation codes created by current user (Admin only)"""
     try:
-        invitation_system = InvitationSystem()
+        invitation_system = InvitationSystem(get_client())
         codes = await invitation_system.get_invitation_codes(created_by=current_user["id"])
-        invitation_system.client.close()
+        invitation_system.close()
         return [InvitationCodeResponse(**code) for code in codes]
     except Exception as e:
         raise HTTPException(
@@ -123,6 +260,47 @@ async def get_invitation_codes(
             detail=f"Failed to retrieve invitation codes: {str(e)}"
         )
 
+@api_router.get("/invitations/page", response_model=InvitationCodePage)
+async def get_invitation_codes_page(
+    role: Optional[InvitationRole] = None,
+    used: Optional[bool] = None,
+    expired: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_store_admin_user)
+):
+    """Get a page of invitation codes created by current user (Admin only)
+
+    Counts are returned with the first page only, so paging on does not
+    re-run the count aggregation.
+    """
+    invitation_system = InvitationSystem(get_client())
+    try:
+        page = invitation_system.get_invitation_codes_page(
+            created_by=current_user["id"],
+            role=role.value if role else None,
+            is_used=used,
+            expired=expired,
+            limit=limit,
+            cursor=cursor
+        )
+        if cursor:
+            (codes, next_cursor), counts = await page, None
+        else:
+            (codes, next_cursor), counts = await asyncio.gather(
+                page, invitation_system.count_invitation_codes(created_by=current_user["id"])
+            )
+        return {"items": codes, "next_cursor": next_cursor, "counts": counts}
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve invitation codes: {str(e)}"
+        )
+    finally:
+        invitation_system.close()
+
 @api_router.delete("/invitations/{code}")
 async def delete_invitation_code(
     code: str,
@@ -131,9 +309,9 @@ async def delete_invitation_code(
 ):
     """Delete invitation code (Admin only)"""
     try:
-        invitation_system = InvitationSystem()
+        invitation_system = InvitationSystem(get_client())
         deleted = await invitation_system.delete_invitation_code(code)
-        invitation_system.client.close()
+        invitation_system.close()
         if deleted:
             return {"message": "Invitation code deleted successfully"}
         else:
@@ -149,17 +327,21 @@ async def delete_invitation_code(
             detail=f"Failed to delete invitation code: {str(e)}"
         )
 
+async def release_redeemed_invitation(invitation_system: InvitationSystem, user_data: UserCreateWithInvitation) -> None:
+    """Give back an invitation code redeemed by a registration that did not complete"""
+    try:
+        await invitation_system.release_invitation_code(
+            code=user_data.invitation_code,
+            used_by=user_data.email
+        )
+    except Exception as e:
+        logger.error(f"Failed to release invitation code {user_data.invitation_code}: {str(e)}")
+
 # Authentication endpoints
 @api_router.post("/auth/register", response_model=AuthResponse)
 async def register_user(user_data: UserCreateWithInvitation, db = Depends(get_database)):
     """Register a new user with invitation code validation for courier and staff"""
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
+    invitation_system = None
     
     # Validate invitation code for courier and staff roles
     if user_data.role in ['courier', 'staff']:
@@ -169,60 +351,72 @@ async def register_user(user_data: UserCreateWithInvitation, db = Depends(get_da
                 detail="Invitation code is required for courier and staff registration"
             )
         
-        try:
-            invitation_system = InvitationSystem()
-            is_valid = await invitation_system.validate_invitation_code(
-                code=user_data.invitation_code,
-                role=user_data.role
-            )
-            
-            if not is_valid:
-                invitation_system.client.close()
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Invalid or expired invitation code"
-                )
-            
-            # Mark invitation code as used
-            await invitation_system.use_invitation_code(
+        # Redeem the invitation code while the password is hashed in a worker thread
+        invitation_system = InvitationSystem(get_client())
+        hashed_password, redeemed = await asyncio.gather(
+            run_in_threadpool(get_password_hash, user_data.password),
+            invitation_system.redeem_invitation_code(
                 code=user_data.invitation_code,
+                role=user_data.role,
                 used_by=user_data.email
-            )
-            invitation_system.client.close()
-            
-        except HTTPException:
-            raise
-        except Exception as e:
+            ),
+            return_exceptions=True
+        )
+        if isinstance(hashed_password, Exception) or isinstance(redeemed, Exception):
+            if redeemed is True:
+                await release_redeemed_invitation(invitation_system, user_data)
+            invitation_system.close()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to validate invitation code"
             )
+        
+        if not redeemed:
+            invitation_system.close()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid or expired invitation code"
+            )
+    else:
+        hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     
-    # Hash password
-    hashed_password = get_password_hash(user_data.password)
-    
-    # Create user document (convert to the original UserCreate format)
-    user_create_data = {
-        "email": user_data.email,
-        "full_name": user_data.full_name,
-        "phone": user_data.phone,
-        "role": UserRole(user_data.role),
-        "password": user_data.password,
-        "store_id": user_data.store_id,
-        "delivery_zone": user_data.delivery_zone
-    }
-    
-    user_create = UserCreate(**user_create_data)
-    user_dict = user_create.dict()
-    user_dict.pop("password", None)  # Remove plain password safely
-    
-    user = User(**user_dict)
-    user_doc = user.dict()
-    user_doc["password"] = hashed_password  # Add hashed password
+    # Until the user is stored, any failure gives the redeemed invitation code back
+    user_created = False
+    try:
+        # Create user document (convert to the original UserCreate format)
+        user_create_data = {
+            "email": user_data.email,
+            "full_name": user_data.full_name,
+            "phone": user_data.phone,
+            "role": UserRole(user_data.role),
+            "password": user_data.password,
+            "store_id": user_data.store_id,
+            "delivery_zone": user_data.delivery_zone
+        }
+        
+        user_create = UserCreate(**user_create_data)
+        user_dict = user_create.dict()
+        user_dict.pop("password", None)  # Remove plain password safely
+        
+        user = User(**user_dict)
+        user_doc = user.dict()
+        user_doc["password"] = hashed_password  # Add hashed password
+        
+        # Insert user; the unique email index rejects duplicates atomically
+        result = await db.users.insert_one(user_doc)
+        user_created = bool(result.inserted_id)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    finally:
+        if invitation_system:
+            if not user_created:
+                await release_redeemed_invitation(invitation_system, user_data)
+            invitation_system.close()
     
-    # Insert user
-    result = await db.users.insert_one(user_doc)
-    if not result.inserted_id:
+    if not user_created:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create user"
@@ -384,7 +578,7 @@ async def create_store(
 async def get_stores(
     skip: int = 0,
     limit: int = 20,
-    db = Depends(get_database)
+    db = Depends(get_catalog_database)
 ):
     """Get all active stores"""
     stores = await db.stores.find(
@@ -394,7 +588,7 @@ async def get_stores(
     return [Store(**store) for store in stores]
 
 @api_router.get("/stores/{store_id}", response_model=Store)
-async def get_store(store_id: str, db = Depends(get_database)):
+async def get_store(store_id: str, db = Depends(get_catalog_database)):
     """Get store by ID"""
     store = await db.stores.find_one({"id": store_id})
     if not store:
@@ -424,7 +618,7 @@ async def create_category(
     return category
 
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories(db = Depends(get_database)):
+async def get_categories(db = Depends(get_catalog_database)):
     """Get all active categories"""
     categories = await db.categories.find({"is_active": True}).to_list(100)
     return [Category(**category) for category in categories]
@@ -460,7 +654,7 @@ async def get_products(
     category_id: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
-    db = Depends(get_database)
+    db = Depends(get_catalog_database)
 ):
     """Get products with optional filters"""
     query = {"is_available": True}
@@ -474,7 +668,7 @@ async def get_products(
     return [Product(**product) for product in products]
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str, db = Depends(get_database)):
+async def get_product(product_id: str, db = Depends(get_catalog_database)):
     """Get product by ID"""
     product = await db.products.find_one({"id": product_id})
     if not product:
@@ -488,42 +682,36 @@ async def get_product(product_id: str, db = Depends(get_database)):
 @api_router.get("/locations/delivery-areas")
 async def get_delivery_areas():
     """Get available delivery areas (restricted to Baños de Agua Santa)"""
-    return {
-        "areas": [
-            {
-                "id": "banos-centro",
-                "name": "Baños Centro",
-                "city": "Baños de Agua Santa",
-                "state": "Tungurahua",
-                "country": "Ecuador",
-                "is_active": True
-            },
-            {
-                "id": "banos-norte",
-                "name": "Baños Norte",
-                "city": "Baños de Agua Santa", 
-                "state": "Tungurahua",
-                "country": "Ecuador",
-                "is_active": True
-            },
-            {
-                "id": "banos-sur",
-                "name": "Baños Sur",
-                "city": "Baños de Agua Santa",
-                "state": "Tungurahua", 
-                "country": "Ecuador",
-                "is_active": True
-            }
-        ]
-    }
+    return {"areas": DELIVERY_AREAS}
 
 @api_router.get("/locations/validate")
-async def validate_delivery_location(city: str = None, address: str = None):
+async def validate_delivery_location(
+    city: str = None,
+    address: str = None,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180)
+):
     """Validate if delivery is available to the specified location"""
+    if latitude is not None and longitude is not None:
+        zone_id = resolve_delivery_zone(latitude, longitude)
+        if zone_id is None:
+            return {
+                "available": False,
+                "message": "Delivery is only available in Baños de Agua Santa",
+                "suggested_city": "Baños de Agua Santa"
+            }
+        return {
+            "available": True,
+            "delivery_zone": zone_id,
+            "city": "Baños de Agua Santa",
+            "state": "Tungurahua",
+            "country": "Ecuador"
+        }
+    
     if not city:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="City is required"
+            detail="City or coordinates are required"
         )
     
     # Only allow delivery to Baños de Agua Santa
@@ -584,6 +772,11 @@ async def update_user_theme(
 # Include the router in the main app
 app.include_router(api_router)
 app.include_router(payment_router)
+app.include_router(order_router)
+app.include_router(cart_router)
+app.include_router(analytics_router)
+app.include_router(notification_router)
+app.include_router(courier_router)
 
 if __name__ == "__main__":
     import uvicorn
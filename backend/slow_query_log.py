@@ -0,0 +1,272 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from pymongo.monitoring import CommandListener
+from metrics import current_route
+from mongo_client import add_event_listener
+
+logger = logging.getLogger(__name__)
+
+# Commands slower than this many milliseconds are recorded
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+
+# Number of recent slow commands kept in memory per worker
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "500"))
+
+# Re-explain a query shape at most once per this many seconds (0 disables explain)
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+
+# Distinct query shapes tracked per worker; slow commands of new shapes beyond this are only logged
+SLOW_QUERY_MAX_SHAPES = 1000
+
+# Commands that can be explained, and the fields that describe their shape
+EXPLAINABLE_COMMANDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+
+# Commands never recorded: explain is our own, and getMore on the tailable order
+# event cursor waits up to a second for new events by design
+IGNORED_COMMANDS = {"explain", "getMore"}
+
+# Driver-added fields that must not be sent back inside explain
+SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "$clusterTime", "$db", "$readPreference"}
+
+def query_shape(value: Any) -> Any:
+    """Replace literal values with 1, keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        # Pipelines and bulk write batches keep their structure; $in lists collapse to one value
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return 1
+    return 1
+
+def command_shape(command_name: str, command: Dict) -> str:
+    """Stable description of a command's query shape"""
+    fields = EXPLAINABLE_COMMANDS[command_name]
+    # Sort and projection specs are shape already (field names and directions)
+    shape = {
+        field: command[field] if field in ("sort", "projection") else query_shape(command[field])
+        for field in fields if field in command
+    }
+    return json.dumps(shape, sort_keys=True, default=str)
+
+def summarize_explain(explain: Dict) -> Dict:
+    """Plan stages, indexes used and documents examined from explain("executionStats") output"""
+    stages, indexes = [], []
+    docs_examined = keys_examined = 0
+    returned = None
+
+    def walk(node):
+        nonlocal docs_examined, keys_examined, returned
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        for key, value in node.items():
+            if key == "stage" and isinstance(value, str) and value not in stages:
+                stages.append(value)
+            elif key == "indexName" and value not in indexes:
+                indexes.append(value)
+            elif key == "executionStats" and isinstance(value, dict):
+                docs_examined += value.get("totalDocsExamined", 0)
+                keys_examined += value.get("totalKeysExamined", 0)
+                returned = value.get("nReturned", returned)
+            # Rejected plans were not run, so their stages do not describe this query
+            if key != "rejectedPlans":
+                walk(value)
+
+    walk(explain)
+    return {
+        "collscan": "COLLSCAN" in stages,
+        "stages": stages,
+        "indexes": indexes,
+        "docs_examined": docs_examined,
+        "keys_examined": keys_examined,
+        "returned": returned,
+        "explained_at": datetime.utcnow(),
+    }
+
+class SlowQueryLog(CommandListener):
+    """Records MongoDB commands slower than SLOW_QUERY_THRESHOLD_MS with the route that issued them.
+
+    The listener runs on driver threads, so it only queues commands for
+    explain; a background task runs explain("executionStats") once per
+    query shape and interval and flags plans that scan whole collections.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL):
+        self.threshold_ms = threshold_ms
+        self.explain_interval = explain_interval
+        self._lock = threading.Lock()
+        # (connection, request id) -> explainable command, until the command finishes
+        self._started: Dict[Tuple, Dict] = {}
+        self.entries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self.shapes: Dict[str, Dict] = {}
+        self._pending_explains: deque = deque(maxlen=100)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            self._started[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        command = self._started.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms or event.command_name in IGNORED_COMMANDS:
+            return
+
+        collection = command.get(event.command_name) if command else None
+        shape = command_shape(event.command_name, command) if command else None
+        route = current_route.get() or "background"
+        logger.warning(
+            f"Slow MongoDB {event.command_name} on {event.database_name}.{collection or '-'} "
+            f"took {duration_ms:.1f} ms from {route}: {shape or '-'}"
+        )
+
+        shape_key = f"{event.database_name}.{collection}:{event.command_name}:{shape}" if shape else None
+        needs_explain = False
+        with self._lock:
+            self.entries.append({
+                "at": datetime.utcnow(),
+                "duration_ms": round(duration_ms, 3),
+                "command": event.command_name,
+                "database": event.database_name,
+                "collection": collection,
+                "route": route,
+                "failed": failed,
+                "shape_key": shape_key,
+            })
+            if shape_key is None:
+                return
+            stats = self.shapes.get(shape_key)
+            if stats is None:
+                if len(self.shapes) >= SLOW_QUERY_MAX_SHAPES:
+                    return
+                stats = self.shapes[shape_key] = {
+                    "shape_key": shape_key,
+                    "command": event.command_name,
+                    "database": event.database_name,
+                    "collection": collection,
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": {},
+                    "explain": None,
+                    "_explain_requested": 0.0,
+                }
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["last_seen"] = datetime.utcnow()
+            stats["routes"][route] = stats["routes"].get(route, 0) + 1
+            now = time.monotonic()
+            if self.explain_interval > 0 and (
+                not stats["_explain_requested"] or now - stats["_explain_requested"] >= self.explain_interval
+            ):
+                stats["_explain_requested"] = now
+                needs_explain = True
+
+        if needs_explain and self._loop is not None:
+            explain_command = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+            # explain only accepts a single update or delete statement
+            for batch in ("updates", "deletes"):
+                if batch in explain_command:
+                    explain_command[batch] = explain_command[batch][:1]
+            self._pending_explains.append((shape_key, event.database_name, explain_command))
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def explain(self, client, shape_key: str, database_name: str, command: Dict) -> None:
+        """Run explain("executionStats") for a slow command and attach the summary to its shape"""
+        try:
+            result = await client[database_name].command({"explain": command, "verbosity": "executionStats"})
+        except Exception as e:
+            logger.error(f"Explain failed for slow query {shape_key}: {str(e)}")
+            return
+        summary = summarize_explain(result)
+        with self._lock:
+            if shape_key in self.shapes:
+                self.shapes[shape_key]["explain"] = summary
+        if summary["collscan"]:
+            logger.warning(f"Slow query {shape_key} scans the whole collection ({summary['docs_examined']} documents examined)")
+
+    def start(self, client) -> None:
+        """Start explaining slow query shapes with the given client"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(client))
+
+    async def stop(self) -> None:
+        """Stop explaining slow queries"""
+        self._loop = None
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, client) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending_explains:
+                await self.explain(client, *self._pending_explains.popleft())
+
+    def report(self, limit: int = 50, collscan_only: bool = False) -> Dict:
+        """Slowest query shapes by total time and the most recent slow commands"""
+        with self._lock:
+            # Driver threads keep updating routes, so nested dicts are copied here too
+            shapes = [
+                {
+                    **{key: value for key, value in stats.items() if not key.startswith("_")},
+                    "routes": dict(stats["routes"]),
+                    "explain": dict(stats["explain"]) if stats["explain"] else None,
+                }
+                for stats in self.shapes.values()
+            ]
+            entries = list(self.entries)
+        if collscan_only:
+            shapes = [shape for shape in shapes if shape["explain"] and shape["explain"]["collscan"]]
+            collscan_keys = {shape["shape_key"] for shape in shapes}
+            entries = [entry for entry in entries if entry["shape_key"] in collscan_keys]
+        shapes.sort(key=lambda shape: shape["total_ms"], reverse=True)
+        for shape in shapes:
+            shape["total_ms"] = round(shape["total_ms"], 3)
+            shape["max_ms"] = round(shape["max_ms"], 3)
+        return {
+            "threshold_ms": self.threshold_ms,
+            "shapes": shapes[:limit],
+            "recent": entries[-limit:][::-1],
+        }
+
+    def reset(self) -> None:
+        """Forget all recorded slow commands and shapes"""
+        with self._lock:
+            self.entries.clear()
+            self.shapes.clear()
+
+slow_query_log = SlowQueryLog()
+add_event_listener(slow_query_log)
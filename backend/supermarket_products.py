@@ -1,7 +1,6 @@
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+from mongo_client import create_client
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
@@ -407,7 +406,7 @@ SUPERMARKET_PRODUCTS = [
 async def update_supermarket_catalog():
     """Обновляет каталог супермаркета с новыми категориями и товарами"""
     try:
-        client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+        client = create_client()
         db = client.megabodega_db
         
         # Обновляем категории
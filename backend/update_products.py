@@ -1,7 +1,6 @@
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+from mongo_client import create_client
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
@@ -157,7 +156,7 @@ IMPROVED_PRODUCTS = [
 
 async def update_products():
     try:
-        client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+        client = create_client()
         db = client.megabodega_db
         
         # Очищаем старые товары
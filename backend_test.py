@@ -7,11 +7,15 @@ Tests all authentication endpoints and core functionality
 import requests
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Get backend URL from environment
 BACKEND_URL = "https://megabodega-delivery.preview.emergentagent.com/api"
 
+# Number of simultaneous registrations fired by the concurrency test
+CONCURRENT_REGISTRATIONS = 200
+
 class BackendTester:
     def __init__(self):
         self.base_url = BACKEND_URL
@@ -176,6 +180,60 @@ class BackendTester:
             self.log_test("Duplicate Registration", False, "Request failed", str(e))
             return False
     
+    def test_concurrent_registration(self):
+        """Test simultaneous registrations for the same and for different emails"""
+        import time
+        timestamp = str(int(time.time()))
+        
+        def register(email):
+            response = requests.post(
+                f"{self.base_url}/auth/register",
+                json={
+                    "role": "customer",
+                    "email": email,
+                    "full_name": "Ana Concurrente",
+                    "phone": "+593987000000",
+                    "password": "ConcurrentPass123!"
+                },
+                timeout=120
+            )
+            return response.status_code
+        
+        try:
+            with ThreadPoolExecutor(max_workers=50) as executor:
+                same_email = f"same.email.{timestamp}@gmail.com"
+                same_statuses = list(executor.map(register, [same_email] * CONCURRENT_REGISTRATIONS))
+                distinct_statuses = list(executor.map(
+                    register,
+                    [f"distinct.{timestamp}.{i}@gmail.com" for i in range(CONCURRENT_REGISTRATIONS)]
+                ))
+        except Exception as e:
+            self.log_test("Concurrent Registration", False, "Request failed", str(e))
+            return False
+        
+        same_ok = same_statuses.count(200) == 1 and same_statuses.count(400) == CONCURRENT_REGISTRATIONS - 1
+        distinct_ok = distinct_statuses.count(200) == CONCURRENT_REGISTRATIONS
+        
+        if same_ok and distinct_ok:
+            self.log_test(
+                "Concurrent Registration",
+                True,
+                f"1 of {CONCURRENT_REGISTRATIONS} same-email registrations succeeded, "
+                f"all {CONCURRENT_REGISTRATIONS} distinct-email registrations succeeded"
+            )
+            return True
+        
+        self.log_test(
+            "Concurrent Registration",
+            False,
+            "Unexpected status distribution",
+            {
+                "same_email": {code: same_statuses.count(code) for code in set(same_statuses)},
+                "distinct_emails": {code: distinct_statuses.count(code) for code in set(distinct_statuses)}
+            }
+        )
+        return False
+    
     def test_user_login(self):
         """Test user login functionality"""
         login_success = True
@@ -1432,6 +1490,416 @@ class BackendTester:
         
         return generate_success and get_codes_success and delete_success and unauthorized_success
     
+    def test_bulk_invitation_generation(self):
+        """Test bulk invitation code generation with CSV output (admin only)"""
+        if "store_admin" not in self.auth_tokens:
+            self.log_test("Bulk Invitation Generation", False, "No store admin token available for testing")
+            return False
+        
+        headers = {
+            "Authorization": f"Bearer {self.auth_tokens['store_admin']['token']}",
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            response = self.session.post(
+                f"{self.base_url}/invitations/bulk",
+                json={"role": "courier", "count": 250, "expires_in_days": 7},
+                headers=headers
+            )
+            
+            if response.status_code != 200:
+                self.log_test("Bulk Invitation Generation", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            if not response.headers.get("content-type", "").startswith("text/csv"):
+                self.log_test("Bulk Invitation Generation", False, "Expected CSV response", response.headers.get("content-type"))
+                return False
+            
+            rows = response.text.strip().splitlines()
+            codes = [row.split(",")[0] for row in rows[1:]]
+            if rows[0] == "code,role,expires_at" and len(codes) == 250 and len(set(codes)) == 250:
+                self.log_test("Bulk Invitation Generation", True, f"Generated {len(codes)} unique invitation codes")
+                return True
+            
+            self.log_test("Bulk Invitation Generation", False, f"Expected 250 unique codes, got {len(set(codes))}", rows[:3])
+            return False
+            
+        except Exception as e:
+            self.log_test("Bulk Invitation Generation", False, "Request failed", str(e))
+            return False
+    
+    def test_invitation_codes_pagination(self):
+        """Test paginated and filtered invitation listing (admin only)"""
+        if "store_admin" not in self.auth_tokens:
+            self.log_test("Invitation Pagination", False, "No store admin token available for testing")
+            return False
+        
+        headers = {"Authorization": f"Bearer {self.auth_tokens['store_admin']['token']}"}
+        
+        try:
+            seen_codes = []
+            cursor = None
+            counts = None
+            for _ in range(3):
+                params = {"limit": 20, "role": "courier", "used": "false"}
+                if cursor:
+                    params["cursor"] = cursor
+                response = self.session.get(f"{self.base_url}/invitations/page", params=params, headers=headers)
+                
+                if response.status_code != 200:
+                    self.log_test("Invitation Pagination", False, f"HTTP {response.status_code}", response.text)
+                    return False
+                
+                data = response.json()
+                if cursor and data.get("counts") is not None:
+                    self.log_test("Invitation Pagination", False, "Counts should only be returned on the first page")
+                    return False
+                counts = counts or data["counts"]
+                seen_codes.extend(item["code"] for item in data["items"])
+                if any(item["role"] != "courier" or item["is_used"] for item in data["items"]):
+                    self.log_test("Invitation Pagination", False, "Filters not applied", data["items"][:3])
+                    return False
+                
+                cursor = data.get("next_cursor")
+                if not cursor:
+                    break
+            
+            if len(seen_codes) != len(set(seen_codes)):
+                self.log_test("Invitation Pagination", False, "Pages returned overlapping codes")
+                return False
+            
+            self.log_test(
+                "Invitation Pagination",
+                True,
+                f"Paged through {len(seen_codes)} codes, counts: {counts}"
+            )
+            return True
+            
+        except Exception as e:
+            self.log_test("Invitation Pagination", False, "Request failed", str(e))
+            return False
+    
+    def test_order_placement(self):
+        """Test server-priced order placement and order retrieval"""
+        if "customer" not in self.auth_tokens:
+            self.log_test("Order Placement", False, "No customer token available for testing")
+            return False
+        
+        headers = {
+            "Authorization": f"Bearer {self.auth_tokens['customer']['token']}",
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            products = self.session.get(f"{self.base_url}/products", params={"limit": 1}).json()
+            if not products:
+                self.log_test("Order Placement", True, "Skipped - no products available")
+                return True
+            product = products[0]
+            
+            response = self.session.post(
+                f"{self.base_url}/orders",
+                json={
+                    "items": [{"product_id": product["id"], "quantity": 2}],
+                    "delivery_address": {
+                        "full_name": "María González",
+                        "phone": "+593987654321",
+                        "street_address": "Calle Ambato y Halflants",
+                        "city": "Baños de Agua Santa",
+                        "state": "Tungurahua",
+                        "postal_code": "180250"
+                    }
+                },
+                headers=headers
+            )
+            
+            if response.status_code != 200:
+                self.log_test("Order Placement", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            order = response.json()
+            expected_subtotal = round(product["price"] * 2, 2)
+            if abs(order["subtotal"] - expected_subtotal) > 0.001:
+                self.log_test("Order Placement", False, "Order was not priced from the catalog", order)
+                return False
+            
+            if "courier" in self.auth_tokens:
+                courier_headers = {"Authorization": f"Bearer {self.auth_tokens['courier']['token']}"}
+                response = self.session.get(f"{self.base_url}/orders/{order['id']}", headers=courier_headers)
+                if response.status_code != 404:
+                    self.log_test("Order Placement", False, f"Unassigned courier could read the order: HTTP {response.status_code}")
+                    return False
+            
+            response = self.session.get(f"{self.base_url}/orders/{order['id']}", headers=headers)
+            if response.status_code == 200 and response.json()["id"] == order["id"]:
+                self.log_test("Order Placement", True, f"Placed order {order['id']} for ${order['total_amount']}")
+                return True
+            
+            self.log_test("Order Placement", False, f"Could not fetch order: HTTP {response.status_code}", response.text)
+            return False
+            
+        except Exception as e:
+            self.log_test("Order Placement", False, "Request failed", str(e))
+            return False
+    
+    def test_order_cancellation(self):
+        """Test that a customer can cancel a pending order exactly once"""
+        if "customer" not in self.auth_tokens:
+            self.log_test("Order Cancellation", False, "No customer token available for testing")
+            return False
+        
+        headers = {
+            "Authorization": f"Bearer {self.auth_tokens['customer']['token']}",
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            products = self.session.get(f"{self.base_url}/products", params={"limit": 1}).json()
+            if not products:
+                self.log_test("Order Cancellation", True, "Skipped - no products available")
+                return True
+            
+            order = self.session.post(
+                f"{self.base_url}/orders",
+                json={
+                    "items": [{"product_id": products[0]["id"], "quantity": 1}],
+                    "delivery_address": {
+                        "full_name": "María González",
+                        "phone": "+593987654321",
+                        "street_address": "Calle Ambato y Halflants",
+                        "city": "Baños de Agua Santa",
+                        "state": "Tungurahua",
+                        "postal_code": "180250"
+                    }
+                },
+                headers=headers
+            ).json()
+            
+            response = self.session.put(
+                f"{self.base_url}/orders/{order['id']}/status", json={"status": "cancelled"}, headers=headers
+            )
+            if response.status_code != 200:
+                self.log_test("Order Cancellation", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            cancelled = response.json()
+            if not cancelled.get("cancelled_at") or cancelled["status_history"][-1]["status"] != "cancelled":
+                self.log_test("Order Cancellation", False, "Cancellation was not recorded", cancelled)
+                return False
+            
+            response = self.session.put(
+                f"{self.base_url}/orders/{order['id']}/status", json={"status": "cancelled"}, headers=headers
+            )
+            if response.status_code == 409:
+                self.log_test("Order Cancellation", True, "Order cancelled once, repeat rejected")
+                return True
+            
+            self.log_test("Order Cancellation", False, f"Repeat cancel returned HTTP {response.status_code}", response.text)
+            return False
+            
+        except Exception as e:
+            self.log_test("Order Cancellation", False, "Request failed", str(e))
+            return False
+    
+    def test_order_analytics(self):
+        """Test that a placed order shows up in the analytics dashboard without errors"""
+        if "customer" not in self.auth_tokens or "store_admin" not in self.auth_tokens:
+            self.log_test("Order Analytics", False, "Customer and store admin tokens required for testing")
+            return False
+        
+        customer_headers = {
+            "Authorization": f"Bearer {self.auth_tokens['customer']['token']}",
+            "Content-Type": "application/json"
+        }
+        admin_headers = {"Authorization": f"Bearer {self.auth_tokens['store_admin']['token']}"}
+        
+        try:
+            products = self.session.get(f"{self.base_url}/products", params={"limit": 1}).json()
+            if not products:
+                self.log_test("Order Analytics", True, "Skipped - no products available")
+                return True
+            
+            response = self.session.post(
+                f"{self.base_url}/orders",
+                json={
+                    "items": [{"product_id": products[0]["id"], "quantity": 1}],
+                    "delivery_address": {
+                        "full_name": "María González",
+                        "phone": "+593987654321",
+                        "street_address": "Calle Ambato y Halflants",
+                        "city": "Baños de Agua Santa",
+                        "state": "Tungurahua",
+                        "postal_code": "180250"
+                    }
+                },
+                headers=customer_headers
+            )
+            if response.status_code != 200:
+                self.log_test("Order Analytics", False, f"Order placement returned HTTP {response.status_code}", response.text)
+                return False
+            order = response.json()
+            
+            response = self.session.get(
+                f"{self.base_url}/analytics",
+                params={"period": "day", "store_id": order["store_id"]},
+                headers=admin_headers
+            )
+            if response.status_code != 200:
+                self.log_test("Order Analytics", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            by_status = response.json()["orders_by_status"]
+            valid_statuses = {"pending", "confirmed", "preparing", "ready", "out_for_delivery", "delivered", "cancelled"}
+            if set(by_status) <= valid_statuses and all(isinstance(count, int) and count >= 0 for count in by_status.values()):
+                self.log_test("Order Analytics", True, f"Orders by status: {by_status}")
+                return True
+            
+            self.log_test("Order Analytics", False, "Malformed status counters", by_status)
+            return False
+            
+        except Exception as e:
+            self.log_test("Order Analytics", False, "Request failed", str(e))
+            return False
+    
+    def test_order_history(self):
+        """Test the order history list and its paged variant"""
+        if "customer" not in self.auth_tokens:
+            self.log_test("Order History", False, "Customer token required for testing")
+            return False
+        
+        headers = {"Authorization": f"Bearer {self.auth_tokens['customer']['token']}"}
+        
+        try:
+            response = self.session.get(f"{self.base_url}/orders/me", params={"limit": 5}, headers=headers)
+            if response.status_code != 200 or not isinstance(response.json(), list):
+                self.log_test("Order History", False, f"/orders/me should return a list (HTTP {response.status_code})", response.text)
+                return False
+            orders = response.json()
+            
+            response = self.session.get(f"{self.base_url}/orders/me/page", params={"limit": 5}, headers=headers)
+            if response.status_code != 200:
+                self.log_test("Order History", False, f"/orders/me/page returned HTTP {response.status_code}", response.text)
+                return False
+            page = response.json()
+            
+            if [order["id"] for order in page["items"]] == [order["id"] for order in orders] and "next_cursor" in page:
+                self.log_test("Order History", True, f"{len(orders)} recent orders, paged view agrees")
+                return True
+            
+            self.log_test("Order History", False, "Paged history does not match the order list", page)
+            return False
+            
+        except Exception as e:
+            self.log_test("Order History", False, "Request failed", str(e))
+            return False
+    
+    def test_notifications_mark_read(self):
+        """Test unread counter and bulk mark-read of notifications"""
+        if "customer" not in self.auth_tokens:
+            self.log_test("Notifications", False, "No customer token available for testing")
+            return False
+        
+        headers = {
+            "Authorization": f"Bearer {self.auth_tokens['customer']['token']}",
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            response = self.session.get(f"{self.base_url}/notifications/unread-count", headers=headers)
+            if response.status_code != 200:
+                self.log_test("Notifications", False, f"HTTP {response.status_code}", response.text)
+                return False
+            unread = response.json()["unread"]
+            
+            response = self.session.post(f"{self.base_url}/notifications/read", json={}, headers=headers)
+            if response.status_code != 200:
+                self.log_test("Notifications", False, f"Mark read returned HTTP {response.status_code}", response.text)
+                return False
+            
+            remaining = self.session.get(f"{self.base_url}/notifications/unread-count", headers=headers).json()["unread"]
+            if remaining == 0:
+                self.log_test("Notifications", True, f"Marked {response.json()['updated']} of {unread} unread notifications as read")
+                return True
+            
+            self.log_test("Notifications", False, f"{remaining} notifications still unread after marking all read")
+            return False
+            
+        except Exception as e:
+            self.log_test("Notifications", False, "Request failed", str(e))
+            return False
+    
+    def test_metrics_endpoint(self):
+        """Test that /metrics exposes per-route request latency histograms"""
+        metrics_url = self.base_url[:-len("/api")] + "/metrics"
+        try:
+            self.session.get(f"{self.base_url}/health")
+            response = self.session.get(metrics_url)
+            if response.status_code != 200:
+                self.log_test("Metrics Endpoint", False, f"HTTP {response.status_code}", response.text)
+                return False
+            
+            if 'http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}' in response.text:
+                self.log_test("Metrics Endpoint", True, "Health check latency recorded under its route template")
+                return True
+            
+            self.log_test("Metrics Endpoint", False, "Health check latency histogram missing", response.text[:500])
+            return False
+            
+        except Exception as e:
+            self.log_test("Metrics Endpoint", False, "Request failed", str(e))
+            return False
+    
+    def test_server_timing_header(self):
+        """Test that responses carry a Server-Timing breakdown"""
+        try:
+            response = self.session.get(f"{self.base_url}/health")
+            timing = response.headers.get("Server-Timing", "")
+            if "handler;dur=" in timing and "total;dur=" in timing:
+                self.log_test("Server-Timing Header", True, timing)
+                return True
+            
+            self.log_test("Server-Timing Header", False, "Missing or incomplete Server-Timing header", timing)
+            return False
+            
+        except Exception as e:
+            self.log_test("Server-Timing Header", False, "Request failed", str(e))
+            return False
+    
+    def test_slow_query_log_admin(self):
+        """Test reading and clearing the slow query log as an admin"""
+        if "store_admin" not in self.auth_tokens:
+            self.log_test("Slow Query Log", False, "No store admin token available for testing")
+            return False
+        
+        headers = {"Authorization": f"Bearer {self.auth_tokens['store_admin']['token']}"}
+        
+        try:
+            response = self.session.get(f"{self.base_url}/admin/slow-queries", params={"limit": 10}, headers=headers)
+            if response.status_code != 200:
+                self.log_test("Slow Query Log", False, f"GET returned HTTP {response.status_code}", response.text)
+                return False
+            report = response.json()
+            if not {"threshold_ms", "shapes", "recent"} <= set(report):
+                self.log_test("Slow Query Log", False, "Malformed slow query report", report)
+                return False
+            
+            response = self.session.delete(f"{self.base_url}/admin/slow-queries", headers=headers)
+            if response.status_code != 200:
+                self.log_test("Slow Query Log", False, f"DELETE returned HTTP {response.status_code}", response.text)
+                return False
+            
+            self.log_test(
+                "Slow Query Log",
+                True,
+                f"{len(report['shapes'])} slow query shapes above {report['threshold_ms']} ms, log cleared"
+            )
+            return True
+            
+        except Exception as e:
+            self.log_test("Slow Query Log", False, "Request failed", str(e))
+            return False
+    
     def run_all_tests(self):
         """Run all backend tests"""
         print("🚀 Starting Backend API Tests for MegaBodega Delivery App")
@@ -1445,6 +1913,7 @@ class BackendTester:
             ("Google OAuth Endpoints", self.test_google_oauth_endpoints),
             ("User Registration", self.test_user_registration),
             ("Duplicate Registration", self.test_duplicate_registration),
+            ("Concurrent Registration", self.test_concurrent_registration),
             ("User Login", self.test_user_login),
             ("Invalid Login", self.test_invalid_login),
             ("Get Current User", self.test_get_current_user),
@@ -1463,7 +1932,17 @@ class BackendTester:
             ("Enhanced User Registration with Invitations", self.test_enhanced_user_registration_with_invitations),
             ("Location Delivery Areas", self.test_location_delivery_areas),
             ("User Theme Management", self.test_user_theme_management),
-            ("Invitation Management Endpoints", self.test_invitation_management_endpoints)
+            ("Invitation Management Endpoints", self.test_invitation_management_endpoints),
+            ("Bulk Invitation Generation", self.test_bulk_invitation_generation),
+            ("Invitation Pagination", self.test_invitation_codes_pagination),
+            ("Order Placement", self.test_order_placement),
+            ("Order Cancellation", self.test_order_cancellation),
+            ("Order Analytics", self.test_order_analytics),
+            ("Order History", self.test_order_history),
+            ("Notifications", self.test_notifications_mark_read),
+            ("Metrics Endpoint", self.test_metrics_endpoint),
+            ("Server-Timing Header", self.test_server_timing_header),
+            ("Slow Query Log", self.test_slow_query_log_admin)
         ]
         
         passed = 0
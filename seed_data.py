@@ -5,9 +5,13 @@ Seed test data for MegaBodega backend
 
 import asyncio
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+from mongo_client import create_client
+
 load_dotenv()
 
 async def seed_data():
@@ -17,7 +21,7 @@ async def seed_data():
     mongo_url = os.getenv("MONGO_URL")
     db_name = os.getenv("DB_NAME", "test_database")
     
-    client = AsyncIOMotorClient(mongo_url)
+    client = create_client(mongo_url)
     db = client[db_name]
     
     print("🌱 Seeding test data...")
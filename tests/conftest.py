@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# Unit tests run offline, without the emergentintegrations checkout client
+os.environ.setdefault("PAYMENT_PROVIDER", "fake")
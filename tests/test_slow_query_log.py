@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+from slow_query_log import SlowQueryLog
+
+def command_event(command_name, command, duration_ms, request_id=1):
+    return SimpleNamespace(
+        connection_id=("localhost", 27017),
+        request_id=request_id,
+        command_name=command_name,
+        command=command,
+        duration_micros=int(duration_ms * 1000),
+        database_name="delivery_app",
+    )
+
+def run_command(log, event):
+    log.started(event)
+    log.succeeded(event)
+
+def test_records_slow_find_with_its_shape():
+    log = SlowQueryLog(threshold_ms=100, explain_interval=0)
+    run_command(log, command_event("find", {"find": "orders", "filter": {"user_id": "u1"}}, 250))
+
+    report = log.report()
+    assert len(report["recent"]) == 1
+    assert report["shapes"][0]["shape"] == '{"filter": {"user_id": 1}}'
+    assert report["shapes"][0]["routes"] == {"background": 1}
+
+def test_ignores_awaiting_getmore():
+    log = SlowQueryLog(threshold_ms=100, explain_interval=0)
+    run_command(log, command_event("getMore", {"getMore": 123, "collection": "order_events"}, 1000))
+
+    report = log.report()
+    assert report["recent"] == []
+    assert report["shapes"] == []
+
+def test_report_copies_routes():
+    log = SlowQueryLog(threshold_ms=100, explain_interval=0)
+    run_command(log, command_event("find", {"find": "orders", "filter": {}}, 250))
+
+    log.report()["shapes"][0]["routes"]["GET /api/orders"] = 1
+    assert log.report()["shapes"][0]["routes"] == {"background": 1}
@@ -0,0 +1,27 @@
+import asyncio
+import httpx
+import pytest
+import stripe
+from payment_service import configure_stripe_transport
+
+@pytest.fixture
+def restore_stripe_client():
+    previous = stripe.default_http_client
+    yield
+    stripe.default_http_client = previous
+
+def pool_limit(client) -> int:
+    return client._transport._pool._max_connections
+
+def test_sdk_clients_use_the_configured_pool(restore_stripe_client):
+    client = configure_stripe_transport(pool_size=3)
+    try:
+        # Fails if an SDK upgrade renames the attributes the transport relies on
+        assert isinstance(client._client, httpx.Client)
+        assert isinstance(client._client_async, httpx.AsyncClient)
+        assert pool_limit(client._client) == 3
+        assert pool_limit(client._client_async) == 3
+        assert stripe.default_http_client is client
+    finally:
+        client.close()
+        asyncio.run(client.close_async())